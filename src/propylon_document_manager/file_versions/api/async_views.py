@@ -0,0 +1,229 @@
+"""
+Native async versions of the retrieve and upload endpoints.
+
+Under ASGI, a sync view holds a thread for as long as a client takes to download the response.
+These views resolve through the async cache and ORM APIs, and stream blobs from async
+generators whose reads run in the default thread pool. A slow client then only holds a
+coroutine. The blocking parts that remain, namely multipart parsing, hashing, writing blobs
+and the upload transaction, run in threads.
+
+They are routed in place of the DRF views when FILE_VERSIONS_ASYNC_VIEWS is set, which the
+ASGI entry point does by default. Responses and errors match the DRF views.
+"""
+import asyncio
+import functools
+import mimetypes
+import os
+from hashlib import sha256
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import (
+    APIException,
+    AuthenticationFailed,
+    MethodNotAllowed,
+    NotAuthenticated,
+    NotFound,
+    ValidationError,
+)
+
+from ..audit import aaudit
+from ..blobs import BLOB_CHUNK_SIZE, cached_blob, offloaded_response
+from ..metrics import record_blob_read, record_upload
+from ..models import AuditEvent, FileVersion
+from ..quotas import limit_upload
+from ..resolution import aresolve_file_version
+from ..routers import areplica_reads, pin_to_primary
+from ..uploads import store_file_version
+from . import views
+from .authentication import CachedTokenAuthentication
+
+
+def async_api_view(methods):
+    """Turns DRF exceptions and Http404 raised by an async view into the JSON errors DRF returns."""
+
+    def decorator(view):
+        @csrf_exempt
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                if request.method not in methods:
+                    raise MethodNotAllowed(request.method)
+                return await view(request, *args, **kwargs)
+            except Http404 as exc:
+                return error_response(NotFound(*exc.args))
+            except APIException as exc:
+                return error_response(exc)
+
+        return wrapper
+
+    return decorator
+
+
+def error_response(exc):
+    detail = exc.detail if isinstance(exc.detail, (dict, list)) else {"detail": exc.detail}
+    # As with the DRF views, SessionAuthentication comes first and turns 401s into 403s
+    if isinstance(exc, (AuthenticationFailed, NotAuthenticated)):
+        return JsonResponse(detail, status=status.HTTP_403_FORBIDDEN, safe=False)
+
+    return JsonResponse(detail, status=exc.status_code, safe=False)
+
+
+async def authenticate(request):
+    """
+    Async counterpart of [SessionAuthentication, CachedTokenAuthentication]: an active session
+    user first, with DRF's CSRF check, then an API token.
+    """
+    user = await request.auser()
+    if user.is_authenticated and user.is_active:
+        SessionAuthentication().enforce_csrf(request)
+        return user
+
+    authorization = request.headers.get("Authorization", "").split()
+    if not authorization or authorization[0].lower() != "token":
+        raise NotAuthenticated()
+    if len(authorization) != 2:
+        raise AuthenticationFailed("Invalid token header.")
+
+    user, _ = await sync_to_async(CachedTokenAuthentication().authenticate_credentials)(authorization[1])
+    # As DRF does, so middleware sees the token's user
+    request.user = user
+    return user
+
+
+async def aiter_blob(path, chunk_size=BLOB_CHUNK_SIZE):
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        while chunk := await asyncio.to_thread(f.read, chunk_size):
+            yield chunk
+    finally:
+        f.close()
+
+
+async def aiter_bytes(data):
+    yield data
+
+
+async def blob_stream_response(file_hash, download_path, content_type, filename):
+    data = await asyncio.to_thread(cached_blob, file_hash, download_path)
+    if data is not None:
+        response = StreamingHttpResponse(aiter_bytes(data), content_type=content_type)
+        size = len(data)
+        record_blob_read(size, "cache")
+    else:
+        response = StreamingHttpResponse(aiter_blob(download_path), content_type=content_type)
+        size = await asyncio.to_thread(os.path.getsize, download_path)
+        record_blob_read(size, "disk")
+
+    response["Content-Length"] = size
+    response["Content-Disposition"] = content_disposition_header(False, filename)
+    return response
+
+
+@async_api_view(methods=("GET",))
+async def retrieve_file_version(request, file_url):
+    user = await authenticate(request)
+
+    revision, as_of = views.parse_retrieval_params(request.GET)
+    async with areplica_reads(user.id):
+        file_version = await aresolve_file_version(user.id, file_url, revision=revision, as_of=as_of)
+    if not file_version:
+        raise Http404("File not found")
+
+    file_hash = file_version["file_hash"]
+    download_path = os.path.join(os.getcwd(), *views.PATH_TO_MEDIA, file_hash)
+
+    if not await asyncio.to_thread(os.path.exists, download_path):
+        raise Http404("File not found")
+
+    await aaudit(AuditEvent.READ, user.id, file_url, file_hash)
+    content_type = mimetypes.guess_type(file_url)[0] or "application/octet-stream"
+    response = offloaded_response(file_hash, download_path, content_type, file_version["file_name"])
+    if response:
+        return response
+
+    return await blob_stream_response(file_hash, download_path, content_type, file_version["file_name"])
+
+
+def hash_upload(file):
+    digest = sha256()
+    file_size = 0
+    for chunk in file.chunks():
+        digest.update(chunk)
+        file_size += len(chunk)
+
+    return digest.hexdigest(), file_size
+
+
+def write_blob(file, path):
+    with open(path, "wb") as f:
+        for chunk in file.chunks():
+            f.write(chunk)
+
+
+@async_api_view(methods=("POST",))
+async def create_file_version(request):
+    user = await authenticate(request)
+    await sync_to_async(limit_upload)(request, user.id)
+
+    # Parsing spools large uploads to disk, so it runs in a thread
+    files = await asyncio.to_thread(lambda: request.FILES)
+    file = files.get("file")
+    if not file:
+        raise ValidationError({"detail": "No file provided"})
+
+    file_url = views.FileVersionViewSet.validate_file_url(request.POST.get("file_url"))
+    file_hash, file_size = await asyncio.to_thread(hash_upload, file)
+
+    latest_version = await (
+        FileVersion.objects.filter(file_url=file_url, user_id=user.id).order_by("-version_number").afirst()
+    )
+    if latest_version and latest_version.file_hash == file_hash:
+        # Same as latest version, skipping
+        record_upload(file_size, "unchanged")
+        await aaudit(AuditEvent.WRITE, user.id, file_url, file_hash, latest_version.id)
+        return JsonResponse(
+            {"file_url": file_url, "version_number": latest_version.version_number}, status=status.HTTP_201_CREATED
+        )
+
+    version_number = latest_version.version_number + 1 if latest_version else 0
+    media_path, file_name = views.get_directories(file_url=file_url)
+
+    blob_path = os.path.join(media_path, file_hash)
+    existing_blob = await FileVersion.objects.filter(file_hash=file_hash).aexists()
+
+    def save_blob():
+        os.makedirs(media_path, exist_ok=True)
+        write_blob(file, blob_path)
+
+    # The blob is written in the storing transaction, which runs in a thread
+    file_version = await sync_to_async(store_file_version)(
+        user.id, file_url, file_name, file_hash, file_size, version_number, None if existing_blob else save_blob
+    )
+    record_upload(file_size, "deduplicated" if existing_blob else "stored")
+    if existing_blob and not await asyncio.to_thread(os.path.exists, blob_path):
+        # Pruning released the blob after the deduplication check
+        await asyncio.to_thread(write_blob, file, blob_path)
+    await sync_to_async(pin_to_primary)(user.id)
+    await aaudit(AuditEvent.WRITE, user.id, file_url, file_hash, file_version.id)
+
+    return JsonResponse(
+        {"id": file_version.id, "file_url": file_version.file_url, "version_number": file_version.version_number},
+        status=status.HTTP_201_CREATED,
+    )
+
+
+list_file_versions = views.FileVersionViewSet.as_view({"get": "list"})
+
+
+@csrf_exempt
+async def file_versions_root(request):
+    """``/api/file_versions/``: uploads are handled natively, listings by the DRF view in a thread."""
+    if request.method == "POST":
+        return await create_file_version(request)
+
+    return await sync_to_async(list_file_versions)(request)
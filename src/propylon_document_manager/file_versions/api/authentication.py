@@ -0,0 +1,96 @@
+import pickle
+import threading
+import time
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from ..metrics import record_cache_lookup
+
+TOKEN_CACHE_KEY = "file_versions:auth_token:{digest}"
+# Upper bound on the tokens a process keeps, the oldest are dropped first
+LOCAL_CACHE_MAX_ENTRIES = 10000
+
+_local_cache = {}
+_local_lock = threading.Lock()
+
+
+def token_cache_key(key):
+    # Tokens are credentials, so only their digest is used as a cache key
+    return TOKEN_CACHE_KEY.format(digest=sha256(key.encode()).hexdigest())
+
+
+def invalidate_token(key):
+    """Drops a token from the shared cache and from this process. Other processes drop it within the local TTL."""
+    cache.delete(token_cache_key(key))
+    with _local_lock:
+        _local_cache.pop(key, None)
+
+
+def clear_local_token_cache():
+    with _local_lock:
+        _local_cache.clear()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement for TokenAuthentication that caches token -> (user, token).
+
+    Lookups go to a per-process cache first (FILE_VERSIONS_TOKEN_LOCAL_CACHE_TTL), then to the
+    default Django cache (FILE_VERSIONS_TOKEN_CACHE_TTL), and only then to the database. Only
+    tokens of active users are cached; deleting a token or saving its user invalidates it, so
+    deactivated users are rejected as before. Failures are never cached and raise the same
+    errors as TokenAuthentication. Like entries of the shared cache, local entries are stored
+    pickled, so every request gets its own user and token instances to modify.
+    """
+
+    def authenticate_credentials(self, key):
+        credentials = self.get_local(key)
+        if credentials is not None:
+            record_cache_lookup("token_local", True)
+            return credentials
+
+        credentials = cache.get(token_cache_key(key))
+        record_cache_lookup("token", credentials is not None)
+        if credentials is None:
+            credentials = self.get_credentials(key)
+            cache.set(token_cache_key(key), credentials, timeout=settings.FILE_VERSIONS_TOKEN_CACHE_TTL)
+
+        self.set_local(key, credentials)
+        return credentials
+
+    def get_credentials(self, key):
+        try:
+            token = Token.objects.select_related("user").get(key=key)
+        except Token.DoesNotExist:
+            raise AuthenticationFailed(_("Invalid token."))
+
+        if not token.user.is_active:
+            raise AuthenticationFailed(_("User inactive or deleted."))
+
+        return token.user, token
+
+    def get_local(self, key):
+        with _local_lock:
+            entry = _local_cache.get(key)
+        if entry is None:
+            return None
+
+        expires, credentials = entry
+        return pickle.loads(credentials) if expires > time.monotonic() else None
+
+    def set_local(self, key, credentials):
+        ttl = settings.FILE_VERSIONS_TOKEN_LOCAL_CACHE_TTL
+        if ttl <= 0:
+            return
+
+        with _local_lock:
+            _local_cache.pop(key, None)
+            _local_cache[key] = (time.monotonic() + ttl, pickle.dumps(credentials))
+            if len(_local_cache) > LOCAL_CACHE_MAX_ENTRIES:
+                del _local_cache[next(iter(_local_cache))]
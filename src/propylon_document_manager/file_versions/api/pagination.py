@@ -0,0 +1,144 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Keeps the microseconds of datetimes, which DjangoJSONEncoder drops, so cursors seek exactly."""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on a composite, indexed ordering instead of using OFFSET.
+
+    The cursor holds the ordering values of the last row on the page, so every page is a
+    single index range scan and page 10,000 costs the same as page 1. The last field of the
+    ordering must be unique (normally ``id``) to make the key total. Views can override the
+    ordering by exposing a ``keyset_ordering`` attribute.
+    """
+
+    ordering = ("file_url", "id")
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = tuple(getattr(view, "keyset_ordering", self.ordering))
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.seek_filter(position))
+
+        # One extra row tells us whether there is a next page without a COUNT query
+        results = list(queryset[: self.page_size + 1])
+        self.next_position = self.get_position(results[self.page_size - 1]) if len(results) > self.page_size else None
+
+        return results[: self.page_size]
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+
+        if page_size <= 0:
+            return self.page_size
+
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    def seek_filter(self, position):
+        """
+        Builds the row-value comparison ``(a, b, c) > (x, y, z)`` as
+        ``a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)``,
+        flipping the operator for descending fields.
+        """
+        condition = Q()
+        preceding_equal = Q()
+
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= preceding_equal & Q(**{f"{name}__{lookup}": value})
+            preceding_equal &= Q(**{name: value})
+
+        return condition
+
+    def get_position(self, item):
+        names = [field.lstrip("-") for field in self.ordering]
+        if isinstance(item, dict):
+            return [item[name] for name in names]
+
+        return [getattr(item, name) for name in names]
+
+    def encode_cursor(self, position):
+        return urlsafe_b64encode(json.dumps(position, cls=CursorEncoder).encode()).decode()
+
+    def decode_cursor(self, request, model):
+        """Returns the position in a cursor, with each value converted by its model field."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            position = json.loads(urlsafe_b64decode(encoded.encode()))
+        except (BinasciiError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        try:
+            return [self.to_python(model, field.lstrip("-"), value) for field, value in zip(self.ordering, position)]
+        except (DjangoValidationError, FieldDoesNotExist, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def to_python(model, name, value):
+        field = model._meta.get_field(name)
+        if value is None:
+            if not field.null:
+                raise ValueError(f"{name} cannot be null")
+            return None
+
+        return field.to_python(value)
@@ -0,0 +1,53 @@
+import json
+from uuid import uuid4
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class MultipartMixedRenderer(BaseRenderer):
+    """
+    Renders batch results as multipart/mixed: a JSON part with the metadata of every item,
+    followed by one binary part per item whose ``content`` was inlined. Each inlined item
+    gets a ``content_id`` in the metadata matching the Content-ID of its part.
+    """
+
+    media_type = "multipart/mixed"
+    format = "multipart"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        boundary = uuid4().hex
+        if renderer_context and "response" in renderer_context:
+            renderer_context["response"]["Content-Type"] = f"{self.media_type}; boundary={boundary}"
+
+        metadata = data
+        contents = []
+        if isinstance(data, dict) and isinstance(data.get("results"), list):
+            results = []
+            for item in data["results"]:
+                item = dict(item)
+                content = item.pop("content", None)
+                if content is not None:
+                    item["content_id"] = str(len(contents))
+                    contents.append((item, content))
+                results.append(item)
+            metadata = {**data, "results": results}
+
+        parts = [self.part({"Content-Type": "application/json"}, json.dumps(metadata, cls=JSONEncoder).encode())]
+        for item, content in contents:
+            headers = {
+                "Content-Type": item.get("content_type") or "application/octet-stream",
+                "Content-ID": f"<{item['content_id']}>",
+                "Content-Location": item["file_url"],
+            }
+            parts.append(self.part(headers, content))
+
+        delimiter = f"--{boundary}\r\n".encode()
+        return delimiter + delimiter.join(parts) + f"--{boundary}--\r\n".encode()
+
+    @staticmethod
+    def part(headers, body):
+        head = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        return head.encode() + b"\r\n" + body + b"\r\n"
@@ -1,9 +1,91 @@
 from rest_framework import serializers
 
-from ..models import FileVersion
+from ..blobs import blob_url
+from ..models import AuditEvent, FileVersion, Folder, RetentionPolicy
 
 
-class FileVersionSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """Lets callers narrow a serializer to a subset of its fields with a ``fields`` keyword."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class FileVersionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Read serializer for file versions. Only ``uploader`` and the permission lists need
+    related rows, and ``blob_url`` is computed from the hash; every other field is a
+    column of the file_versions table.
+    """
+
+    uploader = serializers.EmailField(source="user.email", read_only=True)
+    read_permissions = serializers.SlugRelatedField(many=True, read_only=True, slug_field="email")
+    write_permissions = serializers.SlugRelatedField(many=True, read_only=True, slug_field="email")
+    blob_url = serializers.SerializerMethodField()
+
     class Meta:
         model = FileVersion
-        fields = "__all__"
+        fields = [
+            "id",
+            "file_url",
+            "file_name",
+            "version_number",
+            "file_hash",
+            "file_size",
+            "created_at",
+            "is_latest",
+            "is_protected",
+            "user",
+            "uploader",
+            "read_permissions",
+            "write_permissions",
+            "blob_url",
+        ]
+        read_only_fields = fields
+
+    def get_blob_url(self, file_version):
+        return blob_url(self.context["request"], file_version.file_hash)
+
+
+class BatchItemSerializer(serializers.Serializer):
+    file_url = serializers.CharField()
+    revision = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+
+
+class FolderSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Folder
+        fields = ["path", "name", "file_count", "total_file_count", "total_version_count", "total_size"]
+
+
+class AuditEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AuditEvent
+        fields = ["id", "created_at", "action", "user", "file_url", "file_hash", "file_version_id"]
+        read_only_fields = fields
+
+
+class RetentionPolicySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RetentionPolicy
+        fields = ["id", "prefix", "keep_last", "keep_daily_days", "keep_monthly_months"]
+
+    def validate_prefix(self, prefix):
+        prefix = prefix.lstrip("/")
+        policies = RetentionPolicy.objects.filter(user=self.context["request"].user, prefix=prefix)
+        if self.instance is not None:
+            policies = policies.exclude(pk=self.instance.pk)
+        if policies.exists():
+            raise serializers.ValidationError("A policy with this prefix already exists")
+        return prefix
+
+    def validate(self, attrs):
+        # Unset rules keep nothing, so a policy without any would prune every superseded version
+        rules = ("keep_last", "keep_daily_days", "keep_monthly_months")
+        if not any(attrs.get(rule, getattr(self.instance, rule, None)) for rule in rules):
+            raise serializers.ValidationError("A policy needs keep_last, keep_daily_days or keep_monthly_months")
+        return attrs
@@ -1,23 +1,76 @@
+import mimetypes
 import os
+from base64 import b64encode
+from datetime import timezone as dt_timezone
 from hashlib import sha256
 from pathlib import Path
 
-from django.db.models import Q
-from django.http import FileResponse, Http404
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Prefetch, Q, Value, When
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import status
-from rest_framework.authentication import SessionAuthentication, TokenAuthentication
-from rest_framework.exceptions import ValidationError
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 
-from ..models import FileVersion, User
-from .serializers import FileVersionSerializer
+from ..archives import archive_name, stream_zip
+from .. import signing
+from ..audit import audit
+from ..blobs import (
+    RangeNotSatisfiable,
+    blob_cache_control,
+    blob_response,
+    blob_url,
+    file_range_iterator,
+    offloaded_response,
+    parse_range_header,
+)
+from ..metrics import record_blob_read, record_upload
+from ..models import AuditEvent, FileVersion, Folder, RetentionPolicy, User
+from ..quotas import limit_upload
+from ..resolution import resolve_file_version, resolve_file_versions
+from ..routers import pin_to_primary, replica_reads
+from ..uploads import store_file_version
+from .authentication import CachedTokenAuthentication
+from .pagination import KeysetPagination
+from .renderers import MultipartMixedRenderer
+from .serializers import (
+    AuditEventSerializer,
+    BatchItemSerializer,
+    FileVersionSerializer,
+    FolderSerializer,
+    RetentionPolicySerializer,
+)
 
 
 PATH_TO_MEDIA = ['src', 'propylon_document_manager', 'media']
 
+# Default fields of the listing endpoints. They are all columns of the file_versions table,
+# so listings are read with .values() and never instantiate models or touch the permission tables.
+LIST_FIELDS = ("id", "file_url", "file_name", "version_number", "file_hash", "user")
+
+HISTORY_FIELDS = (
+    "id", "version_number", "file_hash", "file_size", "uploader", "created_at", "read_permissions", "write_permissions"
+)
+
+# Serializer fields that cannot be read from the file_versions table alone
+RELATED_FIELDS = ("uploader", "read_permissions", "write_permissions")
+COMPUTED_FIELDS = ("blob_url",)
+
+LIST_SCOPES = ("all", "owned", "shared")
+
+ARCHIVE_REVISIONS = ("latest", "all")
+
+AUDIT_ACTIONS = [action for action, _ in AuditEvent.ACTION_CHOICES]
+
 
 def get_directories(file_url):
     new_file_directories = file_url.split("/")
@@ -28,51 +81,239 @@ def get_directories(file_url):
     return media_path, new_file_name
 
 
+def parse_timestamp(value, param):
+    """Parses an ISO 8601 query parameter, treating naive values as UTC."""
+    try:
+        timestamp = parse_datetime(value)
+    except ValueError:
+        timestamp = None
+
+    if timestamp is None:
+        raise ValidationError({"detail": f"{param} must be an ISO 8601 datetime"})
+
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp, dt_timezone.utc)
+
+    return timestamp
+
+
+def parse_retrieval_params(query_params):
+    """Returns the (revision, as_of) a document is retrieved at, either may be None."""
+    revision = query_params.get("revision")
+    as_of = query_params.get("as_of")
+
+    if revision and as_of:
+        raise ValidationError({"detail": "revision and as_of cannot be combined"})
+
+    if revision and not str(revision).isdigit():
+        raise ValidationError({"detail": "revision must be a non-negative integer"})
+
+    return int(revision) if revision else None, parse_timestamp(as_of, "as_of") if as_of else None
+
+
+def with_fields(queryset, fields):
+    """Loads exactly what FileVersionSerializer needs to render the given fields."""
+    columns = {field for field in fields if field not in RELATED_FIELDS + COMPUTED_FIELDS}
+    if "blob_url" in fields:
+        columns.add("file_hash")
+    if "uploader" in fields:
+        queryset = queryset.select_related("user")
+        columns |= {"user__id", "user__email"}
+
+    permitted_users = User.objects.only("id", "email")
+    for permission in ("read_permissions", "write_permissions"):
+        if permission in fields:
+            queryset = queryset.prefetch_related(Prefetch(permission, queryset=permitted_users))
+
+    return queryset.only("id", *columns)
+
+
 class FileVersionRetrieveView(APIView):
-    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, file_url):
-        user_id = request.user.id
-        version_number = request.query_params.get("revision")
+        revision, as_of = parse_retrieval_params(request.query_params)
+        with replica_reads(request.user.id):
+            file_version = resolve_file_version(request.user.id, file_url, revision=revision, as_of=as_of)
+        if not file_version:
+            raise Http404("File not found")
 
-        if version_number:
-            base_query = FileVersion.objects.filter(
-                file_url=file_url,
-                version_number=version_number
-            )
-        else:
-            base_query = FileVersion.objects.filter(file_url=file_url).order_by("-version_number")
+        file_hash = file_version["file_hash"]
+        download_path = os.path.join(os.getcwd(), *PATH_TO_MEDIA, file_hash)
 
-        # Currently two or more users can upload files with the same url and share the files between them
-        # This could maybe be fixed with an optional query param like user_id or is_uploader.
+        if not os.path.exists(download_path):
+            raise Http404("File not found")
 
-        # Searching for user's files first
-        file_version = base_query.filter(user_id=user_id).first()
-        if not file_version:
-            # If no files are found, searching for files where user has permission
-            file_version = base_query.filter(
-                Q(read_permissions=user_id) |
-                Q(write_permissions=user_id)
-            ).first()
+        audit(AuditEvent.READ, request.user.id, file_url, file_hash)
+        content_type = mimetypes.guess_type(file_url)[0] or "application/octet-stream"
+        response = offloaded_response(file_hash, download_path, content_type, file_version["file_name"])
+        if response:
+            return response
 
-        if not file_version:
-            raise Http404("File not found")
+        return blob_response(file_hash, download_path, content_type, file_version["file_name"])
+
+
+class BlobView(APIView):
+    """
+    Serves blob bytes keyed purely by content hash. The response never depends on which revision
+    is latest, so it is marked immutable, but private and only until the signed URL expires.
+    Access is authorised by the signed URL handed out with the file metadata, not by the session
+    or auth token, so no database query is made.
+    """
 
-        download_path = os.path.join(os.getcwd(), *PATH_TO_MEDIA, file_version.file_hash)
+    authentication_classes = []
+    permission_classes = [AllowAny]
 
+    def get(self, request, file_hash):
+        try:
+            grant = signing.verify(file_hash, request.query_params)
+        except signing.InvalidSignature as e:
+            raise PermissionDenied(str(e))
+
+        etag = f'"{file_hash}"'
+        if etag in request.headers.get("If-None-Match", "") and not grant.byte_range:
+            return self.with_blob_headers(HttpResponseNotModified(), etag, grant)
+
+        download_path = os.path.join(os.getcwd(), *PATH_TO_MEDIA, file_hash)
         if not os.path.exists(download_path):
             raise Http404("File not found")
 
-        with open(download_path, "rb") as f:
-            return FileResponse(f.read().decode(), content_type='application/octet-stream')
+        audit(AuditEvent.READ, grant.user_id, file_hash=file_hash)
+        if not grant.byte_range:
+            # The proxy serves Range requests itself, but cannot enforce a range bound into the URL
+            response = offloaded_response(file_hash, download_path, "application/octet-stream")
+            if response:
+                return self.with_blob_headers(response, etag, grant)
+
+        size = os.path.getsize(download_path)
+        try:
+            byte_range = self.requested_range(request, grant, size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+        if byte_range is None:
+            response = blob_response(file_hash, download_path, "application/octet-stream", file_hash)
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                file_range_iterator(open(download_path, "rb"), start, end - start + 1),
+                status=status.HTTP_206_PARTIAL_CONTENT,
+                content_type="application/octet-stream",
+            )
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response["Content-Length"] = end - start + 1
+            record_blob_read(end - start + 1, "disk")
+
+        return self.with_blob_headers(response, etag, grant)
+
+    @staticmethod
+    def requested_range(request, grant, size):
+        """The byte range to serve: the Range header, limited to the range bound into the signed URL."""
+        byte_range = parse_range_header(request.headers.get("Range"), size)
+        if not grant.byte_range:
+            return byte_range
+
+        granted_start, granted_end = grant.byte_range
+        if granted_start >= size:
+            raise RangeNotSatisfiable(grant.byte_range)
+        if byte_range is None:
+            return granted_start, min(granted_end, size - 1)
+        if byte_range[0] < granted_start or byte_range[1] > granted_end:
+            raise PermissionDenied("Requested range is outside the signed range")
+
+        return byte_range
+
+    @staticmethod
+    def with_blob_headers(response, etag, grant):
+        response["ETag"] = etag
+        response["Cache-Control"] = blob_cache_control(grant.expires)
+        response["Accept-Ranges"] = "bytes"
+        return response
+
+
+class FileVersionHistoryView(APIView):
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, file_url):
+        """
+        Returns every version of a file_url visible to the user, oldest first.
+        The uploader is joined in and both permission lists are prefetched, so the
+        whole history costs three queries however many versions there are.
+        """
+        versions = (
+            with_fields(FileVersion.objects.all(), HISTORY_FIELDS)
+            .filter(file_url=file_url)
+            .visible_to(request.user.id)
+            .order_by("version_number", "id")
+        )
+
+        with replica_reads(request.user.id):
+            data = FileVersionSerializer(versions, many=True, fields=HISTORY_FIELDS).data
+        if not data:
+            raise Http404("File not found")
+
+        return Response({"file_url": file_url, "versions": data})
 
 
 class FileVersionViewSet(GenericViewSet):
-    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = FileVersionSerializer
     queryset = FileVersion.objects.all()
+    pagination_class = KeysetPagination
+    # Ids only, so other paths are not found rather than failing to convert
+    lookup_value_regex = r"\d+"
+
+    @property
+    def keyset_ordering(self):
+        if self.action == "versions":
+            return ("-version_number", "-id")
+        return ("file_url", "id")
+
+    def get_fields(self):
+        """Fields requested with `?fields=`, defaulting to the slim listing fields."""
+        requested = self.request.query_params.get("fields")
+        if not requested:
+            return LIST_FIELDS if self.action in ("list", "versions") else FileVersionSerializer.Meta.fields
+
+        fields = [field.strip() for field in requested.split(",") if field.strip()]
+        unknown = set(fields) - set(FileVersionSerializer.Meta.fields)
+        if unknown:
+            raise ValidationError({"detail": f"Unknown fields: {', '.join(sorted(unknown))}"})
+
+        return fields
+
+    def get_queryset(self):
+        return with_fields(FileVersion.objects.all(), self.get_fields())
+
+    def filter_changed_since(self, queryset):
+        """Keeps versions uploaded after `?changed_since=`, when given."""
+        changed_since = self.request.query_params.get("changed_since")
+        if not changed_since:
+            return queryset
+
+        return queryset.filter(created_at__gt=parse_timestamp(changed_since, "changed_since"))
+
+    def paginate_rows(self, queryset):
+        """
+        Paginates a listing and renders the requested fields. When every field is a column
+        the page is read with .values() and no model instances are created at all.
+        """
+        fields = self.get_fields()
+        if any(field in RELATED_FIELDS + COMPUTED_FIELDS for field in fields):
+            page = self.paginate_queryset(queryset)
+            return self.get_serializer(page, many=True, fields=fields).data
+
+        ordering_fields = [field.lstrip("-") for field in self.keyset_ordering]
+        page = self.paginate_queryset(queryset.values(*dict.fromkeys([*fields, *ordering_fields])))
+        if set(ordering_fields) <= set(fields):
+            return page
+
+        return [{field: row[field] for field in fields} for row in page]
 
     @staticmethod
     def validate_file_url(file_url):
@@ -87,22 +328,226 @@ class FileVersionViewSet(GenericViewSet):
 
         return file_url
 
+    def list(self, request):
+        """
+        Lists the latest version of every document the user can see, ordered by file_url.
+        `prefix` narrows the listing to a folder and `scope` selects owned, shared or all documents.
+        """
+        user_id = request.user.id
+        scope = request.query_params.get("scope", "all")
+        if scope not in LIST_SCOPES:
+            raise ValidationError({"detail": f"scope must be one of: {', '.join(LIST_SCOPES)}"})
+
+        # Shared documents are listed at the newest version shared with the user, which need not be the latest
+        queryset = self.get_queryset()
+        if scope == "owned":
+            queryset = queryset.filter(user_id=user_id, is_latest=True)
+        elif scope == "shared":
+            queryset = queryset.latest_shared_with(user_id)
+        else:
+            queryset = queryset.filter(
+                Q(user_id=user_id, is_latest=True)
+                | Q(id__in=FileVersion.objects.latest_shared_with(user_id).values("id"))
+            )
+
+        prefix = request.query_params.get("prefix")
+        if prefix:
+            queryset = queryset.filter(file_url__startswith=prefix.lstrip("/"))
+
+        with replica_reads(user_id):
+            rows = self.paginate_rows(self.filter_changed_since(queryset))
+
+        return self.get_paginated_response(rows)
+
+    @action(detail=False, methods=["get"])
+    def versions(self, request):
+        """Lists the versions of a file_url visible to the user, newest first."""
+        file_url = self.validate_file_url(request.query_params.get("file_url"))
+
+        queryset = self.get_queryset().filter(file_url=file_url).visible_to(request.user.id)
+
+        with replica_reads(request.user.id):
+            rows = self.paginate_rows(self.filter_changed_since(queryset))
+
+        return self.get_paginated_response(rows)
+
+    @action(detail=False, methods=["get"])
+    def archive(self, request):
+        """
+        Streams a ZIP of every readable document under `prefix`. By default each document is
+        archived at its latest version, or at the version current at `as_of`; `revisions=all`
+        archives every version instead. Like the retrieve view, the user's own copy of a
+        file_url wins over copies shared by other users.
+        """
+        prefix = request.query_params.get("prefix", "").lstrip("/")
+        revisions = request.query_params.get("revisions", "latest")
+        if revisions not in ARCHIVE_REVISIONS:
+            raise ValidationError({"detail": f"revisions must be one of: {', '.join(ARCHIVE_REVISIONS)}"})
+
+        versions = FileVersion.objects.filter(file_url__startswith=prefix).visible_to(request.user.id)
+        as_of = request.query_params.get("as_of")
+        if as_of:
+            versions = versions.filter(created_at__lte=parse_timestamp(as_of, "as_of"))
+
+        versions = (
+            versions.annotate(is_shared=Case(When(user_id=request.user.id, then=Value(0)), default=Value(1)))
+            .order_by("file_url", "is_shared", "user_id", "-version_number")
+            .values_list("file_url", "user_id", "version_number", "file_hash", "created_at")
+        )
+
+        response = StreamingHttpResponse(
+            stream_zip(self.archive_entries(versions.iterator(chunk_size=500), revisions == "all", request.user.id)),
+            content_type="application/zip",
+        )
+        response["Content-Disposition"] = f'attachment; filename="{archive_name(prefix)}"'
+        return response
+
+    @staticmethod
+    def archive_entries(versions, all_revisions, user_id):
+        """Picks the archived versions out of rows ordered by file_url with the preferred owner first."""
+        media_path = os.path.join(os.getcwd(), *PATH_TO_MEDIA)
+        current_file_url, current_owner = None, None
+
+        for file_url, owner_id, version_number, file_hash, created_at in versions:
+            if file_url != current_file_url:
+                current_file_url, current_owner = file_url, owner_id
+            elif not all_revisions or owner_id != current_owner:
+                continue
+
+            arcname = file_url
+            if all_revisions:
+                root, extension = os.path.splitext(file_url)
+                arcname = f"{root}.v{version_number}{extension}"
+
+            audit(AuditEvent.READ, user_id, file_url, file_hash)
+            yield arcname, os.path.join(media_path, file_hash), created_at
+
+    @action(detail=False, methods=["post"], renderer_classes=[JSONRenderer, MultipartMixedRenderer])
+    def batch(self, request):
+        """
+        Resolves many (file_url, revision) pairs in one round trip. Small files are returned inline,
+        base64 encoded in JSON or as binary parts with `Accept: multipart/mixed`; the rest as links.
+        Files that do not exist or are not visible to the user are reported per item.
+        """
+        if not isinstance(request.data, dict):
+            raise ValidationError({"detail": "Expected an object with a files list"})
+
+        # Oversized batches are rejected before any of their items is validated
+        files = request.data.get("files")
+        if isinstance(files, list) and len(files) > settings.FILE_VERSIONS_BATCH_MAX_ITEMS:
+            raise ValidationError(
+                {"detail": f"A batch may request at most {settings.FILE_VERSIONS_BATCH_MAX_ITEMS} files"}
+            )
+        items = BatchItemSerializer(data=files, many=True)
+        items.is_valid(raise_exception=True)
+
+        keys = [(item["file_url"].lstrip("/"), item.get("revision")) for item in items.validated_data]
+        with replica_reads(request.user.id):
+            resolved = resolve_file_versions(request.user.id, keys)
+
+        binary = request.accepted_renderer.format == MultipartMixedRenderer.format
+        media_path = os.path.join(os.getcwd(), *PATH_TO_MEDIA)
+        inline_budget = settings.FILE_VERSIONS_BATCH_INLINE_BUDGET
+
+        results = []
+        for file_url, revision in keys:
+            row = resolved.get((file_url, revision))
+            if not row:
+                results.append(
+                    {"file_url": file_url, "revision": revision, "status": 404, "detail": "File not found"}
+                )
+                continue
+
+            result = {
+                "file_url": file_url,
+                "revision": revision,
+                "status": 200,
+                "version_number": row["version_number"],
+                "file_hash": row["file_hash"],
+                "file_size": row["file_size"],
+                "content_type": mimetypes.guess_type(file_url)[0] or "application/octet-stream",
+                "url": blob_url(request, row["file_hash"]),
+            }
+
+            inline_limit = min(settings.FILE_VERSIONS_BATCH_INLINE_MAX_SIZE, inline_budget)
+            if row["file_size"] <= inline_limit:
+                try:
+                    with open(os.path.join(media_path, row["file_hash"]), "rb") as f:
+                        # Never trust the recorded size to bound the read
+                        content = f.read(inline_limit + 1)
+                except FileNotFoundError:
+                    results.append(
+                        {"file_url": file_url, "revision": revision, "status": 404, "detail": "File not found"}
+                    )
+                    continue
+
+                if len(content) <= inline_limit:
+                    inline_budget -= len(content)
+                    audit(AuditEvent.READ, request.user.id, file_url, row["file_hash"])
+                    result["content"] = content if binary else b64encode(content).decode()
+
+            results.append(result)
+
+        return Response({"results": results})
+
+    @action(detail=True, methods=["get"])
+    def download_url(self, request, pk=None):
+        """
+        Mints a signed, expiring blob URL for a visible version. `range` (inclusive "start-end")
+        binds the URL to a byte range and `expires_in` shortens its lifetime.
+        """
+        file_version = FileVersion.objects.visible_to(request.user.id).filter(pk=pk).only("file_hash").first()
+        if not file_version:
+            raise Http404("File not found")
+
+        byte_range = request.query_params.get("range")
+        max_age = settings.FILE_VERSIONS_BLOB_URL_MAX_AGE
+        try:
+            byte_range = signing.parse_range(byte_range) if byte_range else None
+            max_age = min(int(request.query_params.get("expires_in", max_age)), max_age)
+        except ValueError:
+            raise ValidationError({"detail": "range must be start-end and expires_in a number of seconds"})
+
+        if max_age <= 0:
+            raise ValidationError({"detail": "expires_in must be positive"})
+
+        return Response(
+            {
+                "url": blob_url(request, file_version.file_hash, byte_range=byte_range, max_age=max_age),
+                "expires_in": max_age,
+            }
+        )
+
+    def retrieve(self, request, pk=None):
+        """Returns the metadata of a single visible version, narrowed by `?fields=`."""
+        file_version = self.get_queryset().visible_to(request.user.id).filter(pk=pk).first()
+        if not file_version:
+            raise Http404("File not found")
+
+        return Response(self.get_serializer(file_version, fields=self.get_fields()).data)
+
     def create(self, request):
         user_id = request.user.id
 
+        # Before request.data, which reads the body
+        limit_upload(request, user_id)
         file = request.data.get("file")
         if not file:
             raise ValidationError({"detail": "No file provided"})
 
         file_url = self.validate_file_url(request.data.get("file_url"))
 
-        file_hash = sha256(file.read()).hexdigest()
+        content = file.read()
+        file_hash = sha256(content).hexdigest()
+        file_size = len(content)
         file.seek(0)
 
         latest_version = FileVersion.objects.filter(file_url=file_url, user_id=user_id).order_by(
             "-version_number").first()
         if latest_version and latest_version.file_hash == file_hash:
             # Same as latest version, skipping
+            record_upload(file_size, "unchanged")
+            audit(AuditEvent.WRITE, user_id, file_url, file_hash, latest_version.id)
             return Response(
                 {"file_url": file_url, "version_number": latest_version.version_number},
                 status=status.HTTP_201_CREATED
@@ -111,19 +556,24 @@ class FileVersionViewSet(GenericViewSet):
         version_number = latest_version.version_number + 1 if latest_version else 0
         media_path, file_name = get_directories(file_url=file_url)
 
+        blob_path = os.path.join(media_path, file_hash)
         existing_file = FileVersion.objects.filter(file_hash=file_hash).first()
-        if not existing_file:
+
+        def save_blob():
             Path(media_path).mkdir(parents=True, exist_ok=True)
-            with open(os.path.join(media_path, file_hash), "wb") as f:
+            with open(blob_path, "wb") as f:
                 f.write(file.read())
 
-        file_version = FileVersion.objects.create(
-            file_name=file_name,
-            version_number=version_number,
-            file_url=file_url,
-            file_hash=file_hash,
-            user_id=user_id
+        file_version = store_file_version(
+            user_id, file_url, file_name, file_hash, file_size, version_number, None if existing_file else save_blob
         )
+        record_upload(file_size, "deduplicated" if existing_file else "stored")
+        if existing_file and not os.path.exists(blob_path):
+            # Pruning released the blob after the deduplication check
+            with open(blob_path, "wb") as f:
+                f.write(file.read())
+        pin_to_primary(user_id)
+        audit(AuditEvent.WRITE, user_id, file_url, file_hash, file_version.id)
 
         return Response(
             {
@@ -139,8 +589,17 @@ class FileVersionViewSet(GenericViewSet):
         if not file_version:
             raise Http404("File not found")
 
+        # Permissions decide who reads the file and protection what retention prunes
+        if file_version.user_id != request.user.id and not file_version.write_permissions.filter(
+            pk=request.user.id
+        ).exists():
+            raise PermissionDenied("Only the owner or users with write permission can update a version")
+
         read_permissions_request = request.data.get("read_permissions")
         write_permissions_request = request.data.get("write_permissions")
+        is_protected = request.data.get("is_protected")
+        if is_protected is not None and not isinstance(is_protected, bool):
+            raise ValidationError({"detail": "is_protected must be a boolean"})
 
         # TODO Maybe add option to change file_url
         # Check if there's a file with the same file_url, but not that file itself - it should be possible to overwrite
@@ -150,25 +609,22 @@ class FileVersionViewSet(GenericViewSet):
         #   If yes but different file, raise error so we don't update
         # If updating file_url of a file with multiple revisions, all revisions should be updated
 
-        if isinstance(read_permissions_request, list):
-            # Deleting users from the permissions list
-            file_version.read_permissions.clear()
+        # Both lists are replaced together, so readers never see them half-applied. set() only
+        # removes the users missing from the new list, so only they lose their signed URLs.
+        with transaction.atomic():
+            if isinstance(read_permissions_request, list):
+                file_version.read_permissions.set(User.objects.filter(email__in=read_permissions_request).all())
 
-            users = User.objects.filter(email__in=read_permissions_request).all()
-            # Adding requested users to the permissions list
-            for user in users:
-                if user.id not in file_version.read_permissions.all():
-                    file_version.read_permissions.add(user)
+            if isinstance(write_permissions_request, list):
+                file_version.write_permissions.set(User.objects.filter(email__in=write_permissions_request).all())
 
-        if isinstance(write_permissions_request, list):
-            # Deleting users from the permissions list
-            file_version.write_permissions.clear()
+            if is_protected is not None:
+                # Protected versions are never pruned by retention policies
+                FileVersion.objects.filter(pk=file_version.pk).update(is_protected=is_protected)
 
-            users = User.objects.filter(email__in=write_permissions_request).all()
-            # Adding requested users to the permissions list
-            for user in users:
-                if user.id not in file_version.write_permissions.all():
-                    file_version.write_permissions.add(user)
+        pin_to_primary(request.user.id)
+        if isinstance(read_permissions_request, list) or isinstance(write_permissions_request, list):
+            audit(AuditEvent.SHARE, request.user.id, file_version.file_url, file_version.file_hash, file_version.id)
 
         return Response(
             {
@@ -178,3 +634,119 @@ class FileVersionViewSet(GenericViewSet):
             },
             status=status.HTTP_200_OK
         )
+
+
+class FolderViewSet(GenericViewSet):
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = FolderSerializer
+    queryset = Folder.objects.all()
+
+    def list(self, request):
+        """
+        Lists the immediate subfolders and documents of one of the user's folders, with the folder's
+        size and recursive counts. Everything is read from the folder index, not from a file_url scan.
+        """
+        path = request.query_params.get("path", "").strip("/")
+
+        with replica_reads(request.user.id):
+            folder = Folder.objects.filter(user_id=request.user.id, path=path).first()
+            if not folder:
+                if path:
+                    raise Http404("Folder not found")
+                # A user without uploads still has an (empty) root folder
+                return Response({**FolderSerializer(Folder(path="")).data, "folders": [], "files": []})
+
+            subfolders = folder.children.order_by("path")
+            files = folder.file_versions.filter(is_latest=True).order_by("file_url").values(*LIST_FIELDS)
+
+            return Response(
+                {
+                    **FolderSerializer(folder).data,
+                    "folders": FolderSerializer(subfolders, many=True).data,
+                    "files": list(files),
+                }
+            )
+
+
+class AuditEventViewSet(GenericViewSet):
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAdminUser]
+    serializer_class = AuditEventSerializer
+    queryset = AuditEvent.objects.all()
+    pagination_class = KeysetPagination
+    keyset_ordering = ("-created_at", "-id")
+
+    def list(self, request):
+        """
+        Lists audit events, newest first. `user` (an email), `file_url` and `file_hash` each
+        narrow the listing along an index, as do `since` and `until`; `action` filters further.
+        Buffered events appear once their process has written them.
+        """
+        params = request.query_params
+        events = self.get_queryset()
+
+        email = params.get("user")
+        if email:
+            events = events.filter(user_id__in=User.objects.filter(email=email).values("id"))
+        file_url = params.get("file_url")
+        if file_url:
+            events = events.filter(file_url=file_url.lstrip("/"))
+        file_hash = params.get("file_hash")
+        if file_hash:
+            events = events.filter(file_hash=file_hash)
+
+        action = params.get("action")
+        if action:
+            if action not in AUDIT_ACTIONS:
+                raise ValidationError({"detail": f"action must be one of: {', '.join(AUDIT_ACTIONS)}"})
+            events = events.filter(action=action)
+
+        if params.get("since"):
+            events = events.filter(created_at__gte=parse_timestamp(params["since"], "since"))
+        if params.get("until"):
+            events = events.filter(created_at__lt=parse_timestamp(params["until"], "until"))
+
+        page = self.paginate_queryset(events)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+
+class RetentionPolicyViewSet(GenericViewSet):
+    """
+    The user's own retention policies, which ``prune_versions`` enforces. Policies that apply to
+    every user have no user, and are created by staff from the Django shell.
+    """
+
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = RetentionPolicySerializer
+    queryset = RetentionPolicy.objects.all()
+    lookup_value_regex = r"\d+"
+
+    def get_queryset(self):
+        return super().get_queryset().filter(user_id=self.request.user.id).order_by("prefix")
+
+    def get_object(self):
+        policy = self.get_queryset().filter(pk=self.kwargs["pk"]).first()
+        if not policy:
+            raise Http404("Retention policy not found")
+        return policy
+
+    def list(self, request):
+        return Response(self.get_serializer(self.get_queryset(), many=True).data)
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def partial_update(self, request, pk=None):
+        serializer = self.get_serializer(self.get_object(), data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
+    def destroy(self, request, pk=None):
+        self.get_object().delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,70 @@
+import io
+import logging
+import os
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_CHUNK_SIZE = 64 * 1024
+
+
+class ZipSink(io.RawIOBase):
+    """
+    Write-only, non-seekable buffer that zipfile writes into while the archive is being
+    streamed. Whatever zipfile wrote since the last drain() is handed to the response, so
+    at most one chunk plus a header is ever held in memory.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """
+    Yields a ZIP archive of ``entries`` piece by piece, without temp files or buffering the archive.
+
+    ``entries`` is an iterable of (arcname, path, modified) tuples. Entries are stored
+    uncompressed, their CRC is computed while the bytes stream through, and ZIP64 records are
+    written automatically for large files and archives. Blobs missing from disk are skipped.
+    """
+    sink = ZipSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for arcname, path, modified in entries:
+            try:
+                source = open(path, "rb")
+            except FileNotFoundError:
+                logger.warning("Skipping %s in archive, blob %s is missing", arcname, path)
+                continue
+
+            info = zipfile.ZipInfo(arcname, date_time=modified.timetuple()[:6])
+            # The declared size only decides whether the entry needs ZIP64 headers
+            info.file_size = os.fstat(source.fileno()).st_size
+            with source, archive.open(info, mode="w") as target:
+                while chunk := source.read(chunk_size):
+                    target.write(chunk)
+                    if data := sink.drain():
+                        yield data
+            if data := sink.drain():
+                yield data
+
+    # Central directory
+    yield sink.drain()
+
+
+def archive_name(prefix):
+    """Download name of an archive of a folder prefix."""
+    folder = os.path.basename(prefix.rstrip("/"))
+    return f"{folder or 'documents'}.zip"
@@ -0,0 +1,178 @@
+"""
+Access audit log of document reads, uploads and permission changes.
+
+Views call ``audit`` with what happened. With FILE_VERSIONS_AUDIT_DURABILITY set to "async", the
+default, an event is only appended to a per-process buffer, so requests never wait on the log.
+A background thread writes the buffer in batches once it holds FILE_VERSIONS_AUDIT_BATCH_SIZE
+events or every FILE_VERSIONS_AUDIT_FLUSH_SECONDS, and once more when the process exits.
+Events still buffered when a process is killed are lost. Like request handling, the thread
+closes its database connection once it outlives CONN_MAX_AGE or a write fails. With "sync",
+each event is written before the request goes on, in the database or fsynced to the log file.
+
+FILE_VERSIONS_AUDIT_BACKEND selects the destination: "database" (AuditEvent rows, which staff
+can query at /api/audit/), "file" (JSON lines appended to FILE_VERSIONS_AUDIT_FILE, e.g. for a
+log shipper), or "" to turn auditing off.
+"""
+import atexit
+import functools
+import json
+import logging
+import os
+import threading
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .models import AuditEvent
+
+logger = logging.getLogger(__name__)
+
+# Buffered events kept when the backend keeps failing, per batch size, before the oldest are dropped
+MAX_PENDING_BATCHES = 100
+
+
+def write_to_database(events):
+    AuditEvent.objects.bulk_create(events)
+
+
+class FileWriter:
+    """Appends events to a file as JSON lines, fsyncing each write when durable."""
+
+    def __init__(self, path, durable):
+        self.path = path
+        self.durable = durable
+        self.lock = threading.Lock()
+
+    def __call__(self, events):
+        lines = "".join(
+            json.dumps(
+                {
+                    "created_at": event.created_at.isoformat(),
+                    "action": event.action,
+                    "user_id": event.user_id,
+                    "file_url": event.file_url,
+                    "file_hash": event.file_hash,
+                    "file_version_id": event.file_version_id,
+                }
+            )
+            + "\n"
+            for event in events
+        )
+        with self.lock, open(self.path, "a") as f:
+            f.write(lines)
+            if self.durable:
+                f.flush()
+                os.fsync(f.fileno())
+
+
+class AuditLog:
+    def __init__(self, writer, durability="async", batch_size=500, flush_seconds=1.0):
+        self.writer = writer
+        self.durability = durability
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def record(self, event):
+        if self.durability == "sync":
+            self.writer([event])
+            return
+
+        with self.lock:
+            self.pending.append(event)
+            overflow = len(self.pending) - self.batch_size * MAX_PENDING_BATCHES
+            for _ in range(overflow):
+                self.pending.popleft()
+            if self.thread is None:
+                self.start()
+        if overflow > 0:
+            logger.error("Audit log backend is behind, dropped %s events", overflow)
+        if len(self.pending) >= self.batch_size:
+            self.wakeup.set()
+
+    def flush(self):
+        """Writes the buffered events in batches. Events of a failed batch are put back."""
+        with self.flush_lock:
+            while True:
+                with self.lock:
+                    batch = [self.pending.popleft() for _ in range(min(self.batch_size, len(self.pending)))]
+                if not batch:
+                    return
+                try:
+                    self.writer(batch)
+                except Exception:
+                    with self.lock:
+                        self.pending.extendleft(reversed(batch))
+                    raise
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="audit-log", daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.flush_seconds)
+            self.wakeup.clear()
+            # The thread's connection outlives requests, so it is recycled before each flush like theirs
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not write audit events, retrying later")
+                # A connection the database dropped is opened anew on the next flush
+                connection.close()
+
+
+@functools.cache
+def get_audit_log():
+    """The audit log of this process, built from settings on first use, or None when auditing is off."""
+    backend = settings.FILE_VERSIONS_AUDIT_BACKEND
+    if not backend:
+        return None
+
+    durability = settings.FILE_VERSIONS_AUDIT_DURABILITY
+    if backend == "file":
+        writer = FileWriter(settings.FILE_VERSIONS_AUDIT_FILE, durable=durability == "sync")
+    else:
+        writer = write_to_database
+
+    return AuditLog(
+        writer,
+        durability=durability,
+        batch_size=settings.FILE_VERSIONS_AUDIT_BATCH_SIZE,
+        flush_seconds=settings.FILE_VERSIONS_AUDIT_FLUSH_SECONDS,
+    )
+
+
+def audit(action, user_id, file_url="", file_hash="", file_version_id=None):
+    audit_log = get_audit_log()
+    if audit_log is None:
+        return
+
+    audit_log.record(
+        AuditEvent(
+            created_at=timezone.now(),
+            action=action,
+            user_id=user_id,
+            file_url=file_url,
+            file_hash=file_hash,
+            file_version_id=file_version_id,
+        )
+    )
+
+
+async def aaudit(action, user_id, file_url="", file_hash="", file_version_id=None):
+    """``audit`` for async views: only sync durability does I/O, and then in a thread."""
+    audit_log = get_audit_log()
+    if audit_log is not None and audit_log.durability == "sync":
+        await sync_to_async(audit)(action, user_id, file_url, file_hash, file_version_id)
+    else:
+        audit(action, user_id, file_url, file_hash, file_version_id)
@@ -0,0 +1,109 @@
+"""
+Byte-budgeted LRU cache of small blobs, keyed by content hash.
+
+Blobs are immutable, so entries never need invalidation: a hash always maps to the same bytes
+and the only reason to drop one is memory pressure. Each process keeps its own LRU, bounded
+by ``FILE_VERSIONS_BLOB_CACHE_SIZE`` bytes. Only blobs up to
+``FILE_VERSIONS_BLOB_CACHE_MAX_ITEM_SIZE`` are admitted, so a few large downloads cannot flush
+the hot set. ``FILE_VERSIONS_BLOB_CACHE_ALIAS`` optionally names a Django cache (e.g. Redis)
+shared by all workers as a second tier behind the per-process one.
+"""
+import functools
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+SHARED_CACHE_KEY = "file_versions:blob:{file_hash}"
+
+
+class BlobCache:
+    def __init__(self, max_size, max_item_size, shared=None):
+        self.max_size = max_size
+        self.max_item_size = max_item_size
+        self.shared = shared
+        self.size = 0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 and self.max_item_size > 0
+
+    def admits(self, size):
+        return self.enabled and size <= min(self.max_item_size, self.max_size)
+
+    def get(self, file_hash):
+        """Returns the cached bytes of a blob, or None."""
+        with self._lock:
+            data = self._entries.get(file_hash)
+            if data is not None:
+                self._entries.move_to_end(file_hash)
+                self.hits += 1
+                return data
+
+        if self.shared is not None:
+            data = self.shared.get(SHARED_CACHE_KEY.format(file_hash=file_hash))
+            if data is not None:
+                self._store(file_hash, data)
+                with self._lock:
+                    self.shared_hits += 1
+                return data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, file_hash, data):
+        if not self.admits(len(data)):
+            return
+
+        self._store(file_hash, data)
+        if self.shared is not None:
+            self.shared.set(SHARED_CACHE_KEY.format(file_hash=file_hash), data, timeout=None)
+
+    def _store(self, file_hash, data):
+        with self._lock:
+            if file_hash in self._entries:
+                self._entries.move_to_end(file_hash)
+                return
+
+            self._entries[file_hash] = data
+            self.size += len(data)
+            while self.size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size": self.size,
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+@functools.cache
+def get_blob_cache():
+    """The blob cache of this process, built from settings on first use."""
+    alias = settings.FILE_VERSIONS_BLOB_CACHE_ALIAS
+    return BlobCache(
+        max_size=settings.FILE_VERSIONS_BLOB_CACHE_SIZE,
+        max_item_size=settings.FILE_VERSIONS_BLOB_CACHE_MAX_ITEM_SIZE,
+        shared=caches[alias] if alias else None,
+    )
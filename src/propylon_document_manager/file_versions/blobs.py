@@ -0,0 +1,170 @@
+import io
+import mmap
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse
+from django.utils.http import content_disposition_header
+
+from . import signing
+from .blob_cache import get_blob_cache
+from .metrics import record_blob_read, record_cache_lookup
+
+BLOB_CHUNK_SIZE = 64 * 1024
+# Slicing a memory map costs no read() syscalls, so ranges are handed out in larger pieces
+MMAP_CHUNK_SIZE = 512 * 1024
+
+RANGE_HEADER_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+DELIVERY_MODES = ("stream", "x-accel-redirect", "x-sendfile")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def blob_cache_control(expires):
+    """
+    Blobs are immutable, but are served to the holder of a signed URL, so only their browser may
+    keep one, and only until the URL expires. A shared cache would serve it without checking the
+    signature, expiry or revocation.
+    """
+    return f"private, max-age={max(0, int(expires - time.time()))}, immutable"
+
+
+def blob_url(request, file_hash, byte_range=None, max_age=None):
+    """Absolute, cacheable URL of a blob, signed for the requesting user."""
+    query = signing.sign(file_hash, request.user.id, byte_range=byte_range, max_age=max_age)
+    return request.build_absolute_uri(f"/api/blobs/{file_hash}?{query}")
+
+
+def parse_range_header(header, size):
+    """
+    Parses a single-range ``Range`` header into an inclusive (start, end) pair.
+    Returns None when there is no header, and raises RangeNotSatisfiable for ranges outside the blob.
+    """
+    if not header:
+        return None
+
+    match = RANGE_HEADER_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        raise RangeNotSatisfiable(header)
+
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+
+    if start > end or start >= size:
+        raise RangeNotSatisfiable(header)
+
+    return start, end
+
+
+def blob_file_response(download_path, content_type, **kwargs):
+    """
+    FileResponse over an open blob. WSGI servers that provide wsgi.file_wrapper (gunicorn, uWSGI,
+    mod_wsgi) send it with os.sendfile, so the bytes never pass through Python. Without a file
+    wrapper (runserver, ASGI) Django falls back to reading it in BLOB_CHUNK_SIZE chunks.
+    """
+    response = FileResponse(open(download_path, "rb"), content_type=content_type, **kwargs)
+    response.block_size = BLOB_CHUNK_SIZE
+    return response
+
+
+def cached_blob(file_hash, download_path):
+    """Returns the bytes of a blob from the blob cache, loading it on a miss, or None if it is not cacheable."""
+    blob_cache = get_blob_cache()
+    if not blob_cache.enabled:
+        return None
+
+    data = blob_cache.get(file_hash)
+    record_cache_lookup("blob", data is not None)
+    if data is None and blob_cache.admits(os.path.getsize(download_path)):
+        with open(download_path, "rb") as f:
+            data = f.read()
+        blob_cache.put(file_hash, data)
+
+    return data
+
+
+def blob_response(file_hash, download_path, content_type, filename=None):
+    """
+    Response with the bytes of a blob. Small blobs are served from the blob cache, and loaded
+    into it on a miss; everything else is streamed from disk by blob_file_response.
+    """
+    data = cached_blob(file_hash, download_path)
+    if data is not None:
+        response = FileResponse(io.BytesIO(data), content_type=content_type, filename=filename or "")
+        response.block_size = max(len(data), 1)
+        record_blob_read(len(data), "cache")
+        return response
+
+    response = blob_file_response(download_path, content_type, filename=filename or "")
+    record_blob_read(int(response.get("Content-Length", 0)), "disk")
+    return response
+
+
+def file_range_iterator(f, start, length):
+    """
+    Iterates over a byte range of an open blob, sliced from a read-only memory map when the file
+    can be mapped and read in chunks otherwise. The file is closed once the range is consumed.
+    """
+    try:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        # Empty files and files that are not mappable
+        return iter_file_range(f, start, length)
+
+    return iter_mmap_range(f, mapped, start, length)
+
+
+def iter_mmap_range(f, mapped, start, length, chunk_size=MMAP_CHUNK_SIZE):
+    with f, mapped:
+        end = start + length
+        for offset in range(start, end, chunk_size):
+            yield mapped[offset : min(offset + chunk_size, end)]
+
+
+def iter_file_range(f, start, length, chunk_size=BLOB_CHUNK_SIZE):
+    """Yields ``length`` bytes of an open file from ``start``, then closes it."""
+    with f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def offloaded_response(file_hash, download_path, content_type, filename=None):
+    """
+    Hands the transfer of a blob over to the front proxy according to FILE_VERSIONS_DELIVERY_MODE.
+    Django only answers with headers (nginx X-Accel-Redirect to the internal blob location, or
+    Apache/lighttpd X-Sendfile with the blob path) and the worker is free before the first byte
+    is sent. Returns None in the default "stream" mode, where Django serves the bytes itself.
+    """
+    mode = settings.FILE_VERSIONS_DELIVERY_MODE
+    if mode not in DELIVERY_MODES:
+        raise ImproperlyConfigured(f"FILE_VERSIONS_DELIVERY_MODE must be one of: {', '.join(DELIVERY_MODES)}")
+
+    if mode == "stream":
+        return None
+
+    response = HttpResponse(content_type=content_type)
+    if mode == "x-accel-redirect":
+        response["X-Accel-Redirect"] = f"{settings.FILE_VERSIONS_X_ACCEL_REDIRECT_LOCATION.rstrip('/')}/{file_hash}"
+    else:
+        response["X-Sendfile"] = download_path
+
+    response["ETag"] = f'"{file_hash}"'
+    if filename:
+        response["Content-Disposition"] = content_disposition_header(False, filename)
+
+    return response
@@ -0,0 +1,297 @@
+"""
+Synthetic datasets for performance testing.
+
+``generate_dataset`` creates users, documents, versions, blobs, shares and the folder index
+from a ``DatasetSpec``. The same spec and seed always produce the same rows and blobs. Every
+random aspect (version counts, deduplication, blob sizes, paths, shares) draws from its own
+generator, so changing one knob does not reshuffle the others.
+
+Rows are inserted in batches without signals: folders with ``bulk_create``, versions and
+permissions with a plain ``executemany``, and storage usage is counted once they are all stored.
+Blobs are generated, hashed and written by a process pool. Without a media path no blob is
+generated and hashes are derived from the blob number, which keeps datasets of tens of millions
+of versions within minutes.
+"""
+import math
+import os
+import random
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from hashlib import sha256
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+
+from .folders import aggregate_folders, create_folders
+from .models import FileVersion, User
+from .quotas import reconcile_usage
+
+DATASET_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+FOLDER_NAMES = ("bills", "acts", "amendments", "statutes", "drafts", "reports", "committee", "archive", "2023", "2024")
+FILE_EXTENSIONS = (".txt", ".pdf", ".docx", ".xml")
+
+# Blobs handed to a pool worker at a time
+BLOB_CHUNK = 256
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    users: int = 10
+    documents_per_user: int = 100
+    # Versions per document follow a geometric distribution with this mean
+    mean_versions: float = 3
+    max_versions: int = 50
+    # Blob sizes follow a log-normal distribution around this median
+    median_blob_size: int = 16 * 1024
+    blob_size_sigma: float = 1.0
+    max_blob_size: int = 4 * 1024 * 1024
+    # Share of versions whose content is an earlier blob
+    dedup_ratio: float = 0.1
+    # Documents sit at a random depth between 0 and folder_depth
+    folder_depth: int = 3
+    # Mean number of users each document is shared with (read permission on its latest version)
+    share_fan_out: float = 1
+    seed: int = 0
+    email_domain: str = "dataset.test"
+
+
+class DatasetRandom:
+    """One seeded generator per random aspect of a dataset."""
+
+    def __init__(self, seed):
+        for aspect in ("versions", "blobs", "sizes", "paths", "shares"):
+            setattr(self, aspect, random.Random(f"{seed}:{aspect}"))
+
+
+def geometric(rng, mean, maximum):
+    """Draws from the geometric distribution on 1, 2, ... with the given mean, capped at maximum."""
+    if mean <= 1:
+        return 1
+    return min(maximum, 1 + int(math.log(1 - rng.random()) / math.log(1 - 1 / mean)))
+
+
+def blob_content(seed, number, size):
+    return random.Random(f"{seed}:blob:{number}").randbytes(size)
+
+
+def generate_blobs(media_path, seed, start, sizes):
+    """Writes the blobs numbered from start that media_path lacks. Returns their concatenated sha256 digests."""
+    digests = bytearray()
+    for number, size in enumerate(sizes, start):
+        content = blob_content(seed, number, size)
+        digest = sha256(content)
+        path = os.path.join(media_path, digest.hexdigest())
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(content)
+        digests += digest.digest()
+
+    return bytes(digests)
+
+
+class BlobPool:
+    """Sizes and hashes of the distinct blobs of a dataset, by blob number."""
+
+    def __init__(self, seed, sizes, digests=None):
+        self.seed = seed
+        self.sizes = sizes
+        self.digests = digests
+
+    def file_hash(self, number):
+        if self.digests is None:
+            return sha256(f"{self.seed}:blob:{number}".encode()).hexdigest()
+        return self.digests[number * 32 : (number + 1) * 32].hex()
+
+
+def plan_versions(spec, rng):
+    """Draws the version count of every document and the blob number of every version."""
+    version_counts = array("L")
+    blob_numbers = array("L")
+    blobs = 0
+    for _ in range(spec.users * spec.documents_per_user):
+        count = geometric(rng.versions, spec.mean_versions, spec.max_versions)
+        version_counts.append(count)
+        for _ in range(count):
+            if blobs and rng.blobs.random() < spec.dedup_ratio:
+                blob_numbers.append(rng.blobs.randrange(blobs))
+            else:
+                blob_numbers.append(blobs)
+                blobs += 1
+
+    return version_counts, blob_numbers, blobs
+
+
+def plan_blobs(spec, rng, count, media_path=None, workers=None):
+    """Draws blob sizes and, given a media_path, generates and writes the blobs in parallel."""
+    mu = math.log(spec.median_blob_size)
+    sizes = array(
+        "Q",
+        (
+            min(spec.max_blob_size, max(1, int(rng.sizes.lognormvariate(mu, spec.blob_size_sigma))))
+            for _ in range(count)
+        ),
+    )
+    if media_path is None:
+        return BlobPool(spec.seed, sizes)
+
+    os.makedirs(media_path, exist_ok=True)
+    starts = range(0, count, BLOB_CHUNK)
+    with ProcessPoolExecutor(workers) as executor:
+        chunks = executor.map(
+            generate_blobs,
+            [media_path] * len(starts),
+            [spec.seed] * len(starts),
+            starts,
+            [sizes[start : start + BLOB_CHUNK].tolist() for start in starts],
+        )
+        digests = b"".join(chunks)
+
+    return BlobPool(spec.seed, sizes, digests)
+
+
+def document_url(rng, spec, document):
+    depth = rng.randint(0, spec.folder_depth)
+    directories = [rng.choice(FOLDER_NAMES) for _ in range(depth)]
+    return "/".join([*directories, f"document-{document:06d}{rng.choice(FILE_EXTENSIONS)}"])
+
+
+def create_users(spec, password=None):
+    password = make_password(password)
+    return User.objects.bulk_create(
+        User(email=f"user{number:07d}@{spec.email_domain}", name=f"Dataset user {number}", password=password)
+        for number in range(spec.users)
+    )
+
+
+VERSION_COLUMNS = (
+    "file_name",
+    "file_url",
+    "version_number",
+    "file_hash",
+    "file_size",
+    "created_at",
+    "is_latest",
+    "is_protected",
+    "user",
+    "folder",
+)
+
+
+def insert_rows(model, fields, rows):
+    """
+    Inserts rows of values for the given fields with a single executemany. Unlike bulk_create
+    it does not build model instances or prepare each value, which dominates at this scale,
+    so values must already be in their database form.
+    """
+    quote_name = connection.ops.quote_name
+    columns = ", ".join(quote_name(model._meta.get_field(field).column) for field in fields)
+    placeholders = ", ".join(["%s"] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(f"INSERT INTO {quote_name(model._meta.db_table)} ({columns}) VALUES ({placeholders})", rows)
+
+
+@transaction.atomic
+def store_batch(documents, shares):
+    """
+    Inserts a batch of documents, given as (user_id, file_url, [(file_hash, file_size), ...],
+    created_at), with their folders, and read permissions on their latest versions for
+    ``shares``, a list of user id lists in the same order.
+    """
+    folders = create_folders(
+        aggregate_folders(
+            (user_id, file_url, file_size, version_number == len(versions) - 1)
+            for user_id, file_url, versions, _ in documents
+            for version_number, (_, file_size) in enumerate(versions)
+        )
+    )
+
+    rows = []
+    for user_id, file_url, versions, created_at in documents:
+        file_name = file_url.rsplit("/", 1)[-1]
+        folder_id = folders[(user_id, file_url.rpartition("/")[0])].pk
+        for version_number, (file_hash, file_size) in enumerate(versions):
+            timestamp = connection.ops.adapt_datetimefield_value(created_at + timedelta(minutes=version_number))
+            is_latest = version_number == len(versions) - 1
+            rows.append(
+                (
+                    file_name,
+                    file_url,
+                    version_number,
+                    file_hash,
+                    file_size,
+                    timestamp,
+                    is_latest,
+                    False,
+                    user_id,
+                    folder_id,
+                )
+            )
+    insert_rows(FileVersion, VERSION_COLUMNS, rows)
+
+    # Batches hold whole users, so their latest versions are exactly the batch's documents
+    latest_ids = dict(
+        ((user_id, file_url), version_id)
+        for version_id, user_id, file_url in FileVersion.objects.filter(
+            user_id__in={user_id for user_id, _, _, _ in documents}, is_latest=True
+        ).values_list("id", "user_id", "file_url")
+    )
+    permissions = [
+        (latest_ids[(owner_id, file_url)], user_id)
+        for (owner_id, file_url, _, _), user_ids in zip(documents, shares)
+        for user_id in user_ids
+    ]
+    insert_rows(FileVersion.read_permissions.through, ("fileversion", "user"), permissions)
+
+    return len(rows), len(permissions), len(folders)
+
+
+def generate_dataset(spec, media_path=None, password=None, batch_size=10000, workers=None, progress=None):
+    """
+    Generates a dataset. Blobs are written to media_path, or not at all when it is None.
+    ``progress`` is called with the number of versions stored so far after every batch.
+    Returns counts of what was created.
+    """
+    rng = DatasetRandom(spec.seed)
+    version_counts, blob_numbers, blob_count = plan_versions(spec, rng)
+    blobs = plan_blobs(spec, rng, blob_count, media_path, workers)
+
+    users = create_users(spec, password)
+    user_ids = [user.id for user in users]
+
+    totals = {"users": len(users), "documents": 0, "versions": 0, "blobs": blob_count, "shares": 0, "folders": 0}
+    documents, shares = [], []
+    pending_versions = 0
+    version_position = 0
+    last = len(version_counts) - 1
+    for document_number, count in enumerate(version_counts):
+        user_number, document = divmod(document_number, spec.documents_per_user)
+        versions = [
+            (blobs.file_hash(blob_number), blobs.sizes[blob_number])
+            for blob_number in blob_numbers[version_position : version_position + count]
+        ]
+        created_at = DATASET_EPOCH + timedelta(minutes=version_position)
+        documents.append((user_ids[user_number], document_url(rng.paths, spec, document), versions, created_at))
+        version_position += count
+        pending_versions += count
+
+        fan_out = round(rng.shares.expovariate(1 / spec.share_fan_out)) if spec.share_fan_out > 0 else 0
+        targets = rng.shares.sample(user_ids, min(fan_out, len(user_ids)))
+        shares.append([user_id for user_id in targets if user_id != user_ids[user_number]])
+
+        # Batches end on a user boundary, so each folder is created by a single batch
+        if document == spec.documents_per_user - 1 and pending_versions >= batch_size or document_number == last:
+            version_total, share_total, folder_total = store_batch(documents, shares)
+            totals["documents"] += len(documents)
+            totals["versions"] += version_total
+            totals["shares"] += share_total
+            totals["folders"] += folder_total
+            documents, shares = [], []
+            pending_versions = 0
+            if progress:
+                progress(totals["versions"])
+
+    reconcile_usage(user_ids)
+    return totals
@@ -0,0 +1,180 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import FileVersion, Folder
+
+AGGREGATE_FIELDS = ("file_count", "total_file_count", "total_version_count", "total_size")
+
+
+def folder_paths(file_url):
+    """Returns the folder paths containing a file_url, from the root ("") down to its parent folder."""
+    directories = file_url.split("/")[:-1]
+    return [""] + ["/".join(directories[: depth + 1]) for depth in range(len(directories))]
+
+
+def ensure_folders(user_id, file_url):
+    """Creates any missing folders on the path of a file_url and returns the folder containing it."""
+    paths = folder_paths(file_url)
+    existing = {folder.path: folder for folder in Folder.objects.filter(user_id=user_id, path__in=paths)}
+
+    parent = None
+    for path in paths:
+        folder = existing.get(path)
+        if folder is None:
+            folder, _ = Folder.objects.get_or_create(user_id=user_id, path=path, defaults={"parent": parent})
+        parent = folder
+
+    return parent
+
+
+def record_upload(user_id, file_url, file_size, new_document):
+    """
+    Adds a newly stored version to the aggregates of every folder above it.
+    Must run in the same transaction as the FileVersion insert.
+    """
+    folder = ensure_folders(user_id, file_url)
+
+    Folder.objects.filter(user_id=user_id, path__in=folder_paths(file_url)).update(
+        total_file_count=F("total_file_count") + int(new_document),
+        total_version_count=F("total_version_count") + 1,
+        total_size=F("total_size") + file_size,
+    )
+    if new_document:
+        Folder.objects.filter(pk=folder.pk).update(file_count=F("file_count") + 1)
+
+    return folder
+
+
+def record_pruning(user_id, file_url, version_count, size):
+    """
+    Removes deleted superseded versions of a document from the aggregates of every folder above
+    it. Its latest version is left, so no folder loses a document. Must run in the same transaction
+    as the deletion.
+    """
+    Folder.objects.filter(user_id=user_id, path__in=folder_paths(file_url)).update(
+        total_version_count=F("total_version_count") - version_count,
+        total_size=F("total_size") - size,
+    )
+
+
+def aggregate_folders(rows):
+    """
+    Computes folder aggregates from (user_id, file_url, file_size, is_latest) rows.
+    Returns {(user_id, path): {aggregate: value}}.
+    """
+    folders = defaultdict(lambda: dict.fromkeys(AGGREGATE_FIELDS, 0))
+    for user_id, file_url, file_size, is_latest in rows:
+        paths = folder_paths(file_url)
+        for path in paths:
+            aggregates = folders[(user_id, path)]
+            aggregates["total_version_count"] += 1
+            aggregates["total_size"] += file_size
+            if is_latest:
+                aggregates["total_file_count"] += 1
+        if is_latest:
+            folders[(user_id, paths[-1])]["file_count"] += 1
+
+    return folders
+
+
+def expected_folders(user_ids=None):
+    """
+    Recomputes folder aggregates from FileVersion with a single streamed scan.
+    Returns {(user_id, path): {aggregate: value}}.
+    """
+    queryset = FileVersion.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+
+    rows = queryset.values_list("user_id", "file_url", "file_size", "is_latest")
+    return aggregate_folders(rows.iterator(chunk_size=2000))
+
+
+def create_folders(aggregates):
+    """
+    Creates folders from aggregate_folders output, one depth level at a time so parents exist
+    before their children. Returns {(user_id, path): folder}.
+    """
+    created = {}
+    by_depth = defaultdict(list)
+    for user_id, path in aggregates:
+        by_depth[path.count("/") + 1 if path else 0].append((user_id, path))
+
+    for depth in sorted(by_depth):
+        keys = by_depth[depth]
+        folders = Folder.objects.bulk_create(
+            Folder(
+                user_id=user_id,
+                path=path,
+                parent=created.get((user_id, path.rpartition("/")[0])) if path else None,
+                **aggregates[(user_id, path)],
+            )
+            for user_id, path in keys
+        )
+        created.update(zip(keys, folders))
+
+    return created
+
+
+@transaction.atomic
+def rebuild_folder_index(user_ids=None):
+    """Drops and recreates the folder index, and reassigns every version to its folder."""
+    expected = expected_folders(user_ids)
+
+    existing = Folder.objects.all()
+    if user_ids is not None:
+        existing = existing.filter(user_id__in=user_ids)
+    existing.delete()
+
+    created = create_folders(expected)
+
+    versions = FileVersion.objects.all()
+    if user_ids is not None:
+        versions = versions.filter(user_id__in=user_ids)
+
+    by_folder = defaultdict(list)
+    for version_id, user_id, file_url in versions.values_list("id", "user_id", "file_url").iterator(chunk_size=2000):
+        by_folder[created[(user_id, folder_paths(file_url)[-1])].pk].append(version_id)
+
+    for folder_id, version_ids in by_folder.items():
+        for start in range(0, len(version_ids), 500):
+            FileVersion.objects.filter(id__in=version_ids[start : start + 500]).update(folder_id=folder_id)
+
+    return len(created)
+
+
+def check_folder_index(user_ids=None):
+    """Compares the stored folder index with a fresh recomputation and returns a list of problems."""
+    expected = expected_folders(user_ids)
+
+    stored_folders = Folder.objects.all()
+    if user_ids is not None:
+        stored_folders = stored_folders.filter(user_id__in=user_ids)
+    stored_rows = stored_folders.values("user_id", "path", *AGGREGATE_FIELDS)
+    stored = {(row["user_id"], row["path"]): row for row in stored_rows}
+
+    problems = []
+    for key in sorted(expected.keys() | stored.keys(), key=lambda key: (key[0], key[1])):
+        user_id, path = key
+        if key not in stored:
+            problems.append(f"user {user_id}: folder '{path}' is missing")
+            continue
+        if key not in expected:
+            problems.append(f"user {user_id}: folder '{path}' has no files")
+            continue
+        for field in AGGREGATE_FIELDS:
+            if stored[key][field] != expected[key][field]:
+                problems.append(
+                    f"user {user_id}: folder '{path}' {field} is {stored[key][field]}, expected {expected[key][field]}"
+                )
+
+    unassigned = FileVersion.objects.filter(folder__isnull=True)
+    if user_ids is not None:
+        unassigned = unassigned.filter(user_id__in=user_ids)
+    unassigned_count = unassigned.count()
+    if unassigned_count:
+        problems.append(f"{unassigned_count} file versions are not assigned to a folder")
+
+    return problems
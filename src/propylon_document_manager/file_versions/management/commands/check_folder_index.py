@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from propylon_document_manager.file_versions.folders import check_folder_index, rebuild_folder_index
+from propylon_document_manager.file_versions.models import User
+
+
+class Command(BaseCommand):
+    help = "Check the materialized folder index against the stored file versions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", action="append", dest="emails", help="Only check folders of this user")
+        parser.add_argument("--fix", action="store_true", help="Rebuild the index when problems are found")
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options["emails"]:
+            user_ids = list(User.objects.filter(email__in=options["emails"]).values_list("id", flat=True))
+
+        problems = check_folder_index(user_ids)
+        if not problems:
+            self.stdout.write(self.style.SUCCESS('Folder index is consistent'))
+            return
+
+        for problem in problems:
+            self.stdout.write(problem)
+
+        if options["fix"]:
+            rebuild_folder_index(user_ids)
+            self.stdout.write(self.style.SUCCESS('Rebuilt the folder index to fix %s problems' % len(problems)))
+            return
+
+        raise CommandError('Found %s folder index problems' % len(problems))
@@ -0,0 +1,84 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from propylon_document_manager.file_versions.api.views import PATH_TO_MEDIA
+from propylon_document_manager.file_versions.datasets import DatasetSpec, generate_dataset
+from propylon_document_manager.file_versions.models import User
+
+
+class Command(BaseCommand):
+    help = "Generate a deterministic synthetic dataset of users, versions, blobs, shares and folders"
+
+    def add_arguments(self, parser):
+        defaults = DatasetSpec()
+        parser.add_argument("--users", type=int, default=defaults.users)
+        parser.add_argument("--documents-per-user", type=int, default=defaults.documents_per_user)
+        parser.add_argument(
+            "--mean-versions", type=float, default=defaults.mean_versions, help="Mean of the geometric version counts"
+        )
+        parser.add_argument("--max-versions", type=int, default=defaults.max_versions)
+        parser.add_argument(
+            "--median-blob-size", type=int, default=defaults.median_blob_size, help="Median of the log-normal sizes"
+        )
+        parser.add_argument("--blob-size-sigma", type=float, default=defaults.blob_size_sigma)
+        parser.add_argument("--max-blob-size", type=int, default=defaults.max_blob_size)
+        parser.add_argument(
+            "--dedup-ratio", type=float, default=defaults.dedup_ratio, help="Share of versions reusing an earlier blob"
+        )
+        parser.add_argument("--folder-depth", type=int, default=defaults.folder_depth)
+        parser.add_argument(
+            "--share-fan-out", type=float, default=defaults.share_fan_out, help="Mean sharees per document"
+        )
+        parser.add_argument("--seed", type=int, default=defaults.seed)
+        parser.add_argument("--email-domain", default=defaults.email_domain)
+        parser.add_argument("--password", help="Password of every generated user (unusable by default)")
+        parser.add_argument("--batch-size", type=int, default=10000, help="Versions inserted per transaction")
+        parser.add_argument("--workers", type=int, help="Processes writing blobs (default: one per CPU)")
+        parser.add_argument(
+            "--no-blobs", action="store_true", help="Only insert rows, with hashes of blobs that are not written"
+        )
+
+    def handle(self, *args, **options):
+        spec = DatasetSpec(
+            users=options["users"],
+            documents_per_user=options["documents_per_user"],
+            mean_versions=options["mean_versions"],
+            max_versions=options["max_versions"],
+            median_blob_size=options["median_blob_size"],
+            blob_size_sigma=options["blob_size_sigma"],
+            max_blob_size=options["max_blob_size"],
+            dedup_ratio=options["dedup_ratio"],
+            folder_depth=options["folder_depth"],
+            share_fan_out=options["share_fan_out"],
+            seed=options["seed"],
+            email_domain=options["email_domain"],
+        )
+        if not 0 <= spec.dedup_ratio <= 1:
+            raise CommandError("--dedup-ratio must be between 0 and 1")
+        if User.objects.filter(email__endswith=f"@{spec.email_domain}").exists():
+            raise CommandError(f"Users @{spec.email_domain} already exist, pick another --email-domain")
+
+        started = time.monotonic()
+
+        def progress(versions):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{versions} versions in {time.monotonic() - started:.0f}s")
+
+        totals = generate_dataset(
+            spec,
+            media_path=None if options["no_blobs"] else os.path.join(os.getcwd(), *PATH_TO_MEDIA),
+            password=options["password"],
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+            progress=progress,
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                'Successfully generated %(users)s users, %(documents)s documents, %(versions)s versions, '
+                '%(blobs)s blobs, %(shares)s shares and %(folders)s folders' % totals
+                + ' in %.0fs' % (time.monotonic() - started)
+            )
+        )
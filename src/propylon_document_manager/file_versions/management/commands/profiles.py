@@ -0,0 +1,52 @@
+import os
+import pstats
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from propylon_document_manager.file_versions.profiling import load_profiles
+
+SORT_KEYS = ("cumulative", "tottime", "calls", "ncalls")
+
+
+class Command(BaseCommand):
+    help = "List the captured request profiles, or summarise some of them with pstats"
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", help="Only these profiles")
+        parser.add_argument("--path", help="Only profiles of request paths starting with this prefix")
+        parser.add_argument("--min-duration", type=float, default=0, help="Only profiles of requests this slow (ms)")
+        parser.add_argument("--summary", action="store_true", help="Print the heaviest functions of the profiles")
+        parser.add_argument("--sort", choices=SORT_KEYS, default="cumulative", help="Order of the summary")
+        parser.add_argument("--limit", type=int, default=30, help="Functions in the summary")
+
+    def handle(self, *args, **options):
+        directory = settings.FILE_VERSIONS_PROFILE_DIR
+        profiles = [
+            (name, info)
+            for name, info in load_profiles(directory)
+            if (not options["names"] or name in options["names"])
+            and (not options["path"] or info["path"].startswith(options["path"]))
+            and info["duration_ms"] >= options["min_duration"]
+        ]
+        if not profiles:
+            raise CommandError("No profiles found in %s" % os.path.abspath(directory))
+
+        if options["summary"]:
+            # Statistics of several profiles add up, e.g. all slow requests to one path
+            paths = [os.path.join(directory, f"{name}.prof") for name, _ in profiles]
+            stats = pstats.Stats(*paths, stream=self.stdout)
+            stats.strip_dirs().sort_stats(options["sort"]).print_stats(options["limit"])
+        else:
+            self.stdout.write(
+                f"{'name':<30} {'time':<19} {'method':<7} {'status':>6} {'ms':>9} {'trigger':<7} {'user':>6}  path"
+            )
+            for name, info in profiles:
+                created_at = datetime.fromtimestamp(info["created_at"]).strftime("%Y-%m-%d %H:%M:%S")
+                self.stdout.write(
+                    f"{name:<30} {created_at:<19} {info['method']:<7} {info['status']:>6} {info['duration_ms']:>9.1f} "
+                    f"{info['trigger']:<7} {info['user_id'] or '-':>6}  {info['path']}"
+                )
+
+        self.stdout.write(self.style.SUCCESS('Successfully read %s profiles' % len(profiles)))
@@ -0,0 +1,53 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from propylon_document_manager.file_versions.api.views import PATH_TO_MEDIA
+from propylon_document_manager.file_versions.models import User
+from propylon_document_manager.file_versions.retention import prune_versions
+
+
+class Command(BaseCommand):
+    help = "Delete the file versions that retention policies do not keep, in small batched transactions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", action="append", dest="emails", help="Only prune documents of this user")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be pruned without deleting it")
+        parser.add_argument("--batch-size", type=int, default=100, help="Versions deleted per transaction")
+        parser.add_argument(
+            "--pause", type=float, default=0, help="Seconds to sleep between transactions, to yield to other writers"
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        user_ids = None
+        if options["emails"]:
+            user_ids = list(User.objects.filter(email__in=options["emails"]).values_list("id", flat=True))
+
+        report = prune_versions(
+            media_path=os.path.join(os.getcwd(), *PATH_TO_MEDIA),
+            user_ids=user_ids,
+            dry_run=options["dry_run"],
+            batch_size=options["batch_size"],
+            pause=options["pause"],
+        )
+
+        for user_id, (versions, size) in sorted(report["users"].items()):
+            self.stdout.write(f"user {user_id}: {versions} versions, {size} bytes")
+
+        if options["dry_run"]:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    'Would prune %(versions)s versions of %(documents)s documents, %(bytes)s bytes, '
+                    'and reclaim %(blob_bytes)s bytes of blobs' % report
+                )
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    'Successfully pruned %(versions)s versions of %(documents)s documents, %(bytes)s bytes, '
+                    'and reclaimed %(blob_bytes)s bytes of blobs' % report
+                )
+            )
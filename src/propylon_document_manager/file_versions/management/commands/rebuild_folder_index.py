@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from propylon_document_manager.file_versions.folders import rebuild_folder_index
+from propylon_document_manager.file_versions.models import User
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized folder index from the stored file versions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", action="append", dest="emails", help="Only rebuild folders of this user")
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options["emails"]:
+            user_ids = list(User.objects.filter(email__in=options["emails"]).values_list("id", flat=True))
+
+        folder_count = rebuild_folder_index(user_ids)
+
+        self.stdout.write(
+            self.style.SUCCESS('Successfully rebuilt %s folders' % folder_count)
+        )
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from propylon_document_manager.file_versions.models import User
+from propylon_document_manager.file_versions.quotas import USAGE_FIELDS, reconcile_usage
+
+
+class Command(BaseCommand):
+    help = "Recompute the storage usage of users from their file versions and repair any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", action="append", dest="emails", help="Only reconcile the usage of this user")
+        parser.add_argument("--dry-run", action="store_true", help="Report drift without repairing it")
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options["emails"]:
+            user_ids = list(User.objects.filter(email__in=options["emails"]).values_list("id", flat=True))
+
+        drifted = reconcile_usage(user_ids, dry_run=options["dry_run"])
+        for user_id, stored, expected in drifted:
+            if stored is None:
+                self.stdout.write(f"user {user_id}: no usage row, expected {self.describe(expected)}")
+            else:
+                self.stdout.write(
+                    f"user {user_id}: stored {self.describe(stored)}, expected {self.describe(expected)}"
+                )
+
+        if options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS('Found %s users with drifted storage usage' % len(drifted)))
+        else:
+            self.stdout.write(self.style.SUCCESS('Successfully reconciled storage usage of %s users' % len(drifted)))
+
+    def describe(self, usage):
+        return ", ".join(f"{field}={usage[field]}" for field in USAGE_FIELDS)
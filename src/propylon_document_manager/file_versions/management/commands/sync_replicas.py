@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from propylon_document_manager.file_versions.routers import replica_aliases
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy a SQLite primary database onto its SQLite replicas, for development and tests. "
+        "Other backends replicate on their own (e.g. PostgreSQL streaming replication)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", action="append", dest="aliases", help="Only sync this replica alias")
+
+    def handle(self, *args, **options):
+        aliases = options["aliases"] or replica_aliases()
+        primary = connections["default"]
+        if primary.vendor != "sqlite":
+            raise CommandError("Only SQLite primaries can be synced, other backends replicate on their own")
+
+        primary.ensure_connection()
+        for alias in aliases:
+            replica = connections[alias]
+            if replica.vendor != "sqlite":
+                raise CommandError(f"{alias} is not a SQLite database")
+
+            replica.ensure_connection()
+            primary.connection.backup(replica.connection)
+
+        self.stdout.write(
+            self.style.SUCCESS('Successfully synced %s replicas' % len(aliases))
+        )
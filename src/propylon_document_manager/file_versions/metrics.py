@@ -0,0 +1,138 @@
+"""
+Prometheus metrics of the file versions API.
+
+``metrics_middleware`` records the latency of every request by view, and the number and time
+of its database queries. The views and blob helpers record blob bytes read and written,
+uploads by outcome and size, and cache lookups by cache and result. ``metrics_view`` exposes
+them at /metrics in the Prometheus text format, to scrapers holding FILE_VERSIONS_METRICS_TOKEN.
+
+Under several worker processes (gunicorn, uvicorn --workers), set PROMETHEUS_MULTIPROC_DIR to
+an empty directory before the workers start. Each process then writes its samples to files
+there, and /metrics aggregates the files of all workers. All metrics are counters and
+histograms, which add up across processes.
+"""
+import contextvars
+import hmac
+import os
+import time
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+REQUEST_DURATION = Histogram(
+    "file_versions_request_duration_seconds", "Time to produce a response, by view", ["view", "method", "status"]
+)
+DB_QUERIES = Counter("file_versions_db_queries", "Database queries made by requests, by view", ["view"])
+DB_QUERY_DURATION = Counter("file_versions_db_query_seconds", "Time requests spent in database queries", ["view"])
+BLOB_READ_BYTES = Counter("file_versions_blob_read_bytes", "Blob bytes served from the blob cache or disk", ["source"])
+BLOB_WRITTEN_BYTES = Counter("file_versions_blob_written_bytes", "Blob bytes written by uploads")
+UPLOADS = Counter(
+    "file_versions_uploads",
+    "Uploads by outcome: stored (new blob), deduplicated (existing blob) or unchanged (same as the latest version)",
+    ["outcome"],
+)
+UPLOAD_SIZE = Histogram(
+    "file_versions_upload_size_bytes",
+    "Size of uploaded files",
+    buckets=[2**10, 2**14, 2**18, 2**20, 2**22, 2**24, 2**26, 2**28, 2**30],
+)
+CACHE_LOOKUPS = Counter("file_versions_cache_lookups", "Cache lookups by cache and result", ["cache", "result"])
+
+# [query count, query seconds] of the request being handled. asgiref copies the context into
+# the threads running sync code for async views, so their queries are counted as well.
+_request_queries = contextvars.ContextVar("file_versions_request_queries", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper adding each query to the current request's totals."""
+    totals = _request_queries.get()
+    if totals is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        totals[0] += 1
+        totals[1] += time.perf_counter() - started
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def start_request():
+    return _request_queries.set([0, 0.0])
+
+
+def request_queries():
+    """Query count and seconds of the request being handled so far, or None outside of metrics_middleware."""
+    totals = _request_queries.get()
+    return None if totals is None else tuple(totals)
+
+
+def finish_request(token, request, response, started):
+    queries, query_seconds = request_queries()
+    _request_queries.reset(token)
+
+    view = view_label(request)
+    REQUEST_DURATION.labels(view, request.method, response.status_code).observe(time.perf_counter() - started)
+    if queries:
+        DB_QUERIES.labels(view).inc(queries)
+        DB_QUERY_DURATION.labels(view).inc(query_seconds)
+
+
+def view_label(request):
+    """The URL name of the matched view, or its class or function name. Paths would make unbounded labels."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    if match.url_name:
+        return match.url_name
+    func = match.func
+    return getattr(func, "view_class", getattr(func, "cls", func)).__name__
+
+
+def record_blob_read(size, source):
+    BLOB_READ_BYTES.labels(source).inc(size)
+
+
+def record_upload(size, outcome):
+    UPLOADS.labels(outcome).inc()
+    UPLOAD_SIZE.observe(size)
+    if outcome == "stored":
+        BLOB_WRITTEN_BYTES.inc(size)
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def metrics_registry():
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint for ``Authorization: Bearer <FILE_VERSIONS_METRICS_TOKEN>``, off if it is unset."""
+    token = settings.FILE_VERSIONS_METRICS_TOKEN
+    if not token:
+        raise Http404()
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponseForbidden()
+
+    return HttpResponse(generate_latest(metrics_registry()), content_type=CONTENT_TYPE_LATEST)
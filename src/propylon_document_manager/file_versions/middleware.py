@@ -0,0 +1,74 @@
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics, profiling
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Records the latency and database queries of every request, see metrics.py."""
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            started = time.perf_counter()
+            token = metrics.start_request()
+            response = await get_response(request)
+            metrics.finish_request(token, request, response, started)
+            return response
+
+    else:
+
+        def middleware(request):
+            started = time.perf_counter()
+            token = metrics.start_request()
+            response = get_response(request)
+            metrics.finish_request(token, request, response, started)
+            return response
+
+    return middleware
+
+
+@sync_and_async_middleware
+def profiling_middleware(get_response):
+    """Profiles sampled requests and staff requests asking for it, see profiling.py."""
+    if not profiling.profiling_enabled():
+        raise MiddlewareNotUsed()
+
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            user = await request.auser() if profiling.wants_profile(request) else None
+            trigger = profiling.profile_trigger(request, user)
+            if trigger is None:
+                return await get_response(request)
+
+            profile, started = profiling.start_profile()
+            try:
+                response = await get_response(request)
+            finally:
+                duration = profiling.stop_profile(profile, started)
+            user = await profiling.arequest_user(request)
+            profiling.keep_profile(profile, duration, trigger, request, response, user)
+            return response
+
+    else:
+
+        def middleware(request):
+            user = request.user if profiling.wants_profile(request) else None
+            trigger = profiling.profile_trigger(request, user)
+            if trigger is None:
+                return get_response(request)
+
+            profile, started = profiling.start_profile()
+            try:
+                response = get_response(request)
+            finally:
+                duration = profiling.stop_profile(profile, started)
+            user = getattr(request, "user", None)
+            profiling.keep_profile(profile, duration, trigger, request, response, user)
+            return response
+
+    return middleware
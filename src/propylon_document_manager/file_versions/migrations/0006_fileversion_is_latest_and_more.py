@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:49
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def mark_superseded_versions(apps, schema_editor):
+    FileVersion = apps.get_model("file_versions", "FileVersion")
+    newer_versions = FileVersion.objects.filter(
+        user_id=OuterRef("user_id"),
+        file_url=OuterRef("file_url"),
+        version_number__gt=OuterRef("version_number"),
+    )
+    FileVersion.objects.filter(Exists(newer_versions)).update(is_latest=False)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0005_fileversion_read_permissions_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fileversion",
+            name="is_latest",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.RunPython(mark_superseded_versions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="fileversion",
+            index=models.Index(fields=["file_url", "user", "version_number"], name="fileversion_document_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="fileversion",
+            index=models.Index(
+                condition=models.Q(("is_latest", True)), fields=["file_url", "id"], name="fileversion_latest_idx"
+            ),
+        ),
+    ]
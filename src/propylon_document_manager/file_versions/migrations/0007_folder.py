@@ -0,0 +1,135 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:51
+
+import os
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Blob store of the upload views, relative to the working directory
+PATH_TO_MEDIA = ["src", "propylon_document_manager", "media"]
+
+
+def folder_paths(file_url):
+    directories = file_url.split("/")[:-1]
+    return [""] + ["/".join(directories[: depth + 1]) for depth in range(len(directories))]
+
+
+def index_existing_versions(apps, schema_editor):
+    """Sizes existing versions from their blobs and builds their folder index, like rebuild_folder_index."""
+    FileVersion = apps.get_model("file_versions", "FileVersion")
+    Folder = apps.get_model("file_versions", "Folder")
+
+    media_path = os.path.join(os.getcwd(), *PATH_TO_MEDIA)
+    for file_hash in FileVersion.objects.values_list("file_hash", flat=True).distinct().iterator():
+        blob_path = os.path.join(media_path, file_hash)
+        if file_hash and os.path.exists(blob_path):
+            FileVersion.objects.filter(file_hash=file_hash).update(file_size=os.path.getsize(blob_path))
+
+    folders = defaultdict(lambda: {"file_count": 0, "total_file_count": 0, "total_version_count": 0, "total_size": 0})
+    rows = FileVersion.objects.values_list("id", "user_id", "file_url", "file_size", "is_latest")
+    by_folder = defaultdict(list)
+    for version_id, user_id, file_url, file_size, is_latest in rows.iterator(chunk_size=2000):
+        paths = folder_paths(file_url)
+        for path in paths:
+            aggregates = folders[(user_id, path)]
+            aggregates["total_version_count"] += 1
+            aggregates["total_size"] += file_size
+            if is_latest:
+                aggregates["total_file_count"] += 1
+        if is_latest:
+            folders[(user_id, paths[-1])]["file_count"] += 1
+        by_folder[(user_id, paths[-1])].append(version_id)
+
+    # Parents are created before their children, one depth level at a time
+    created = {}
+    by_depth = defaultdict(list)
+    for user_id, path in folders:
+        by_depth[path.count("/") + 1 if path else 0].append((user_id, path))
+
+    for depth in sorted(by_depth):
+        keys = by_depth[depth]
+        created.update(
+            zip(
+                keys,
+                Folder.objects.bulk_create(
+                    Folder(
+                        user_id=user_id,
+                        path=path,
+                        parent=created.get((user_id, path.rpartition("/")[0])) if path else None,
+                        **folders[(user_id, path)],
+                    )
+                    for user_id, path in keys
+                ),
+            )
+        )
+
+    for key, version_ids in by_folder.items():
+        for start in range(0, len(version_ids), 500):
+            FileVersion.objects.filter(id__in=version_ids[start : start + 500]).update(folder_id=created[key].pk)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0006_fileversion_is_latest_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fileversion",
+            name="file_size",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="Folder",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("path", models.CharField(max_length=255)),
+                ("file_count", models.PositiveIntegerField(default=0)),
+                ("total_file_count", models.PositiveIntegerField(default=0)),
+                ("total_version_count", models.PositiveIntegerField(default=0)),
+                ("total_size", models.PositiveBigIntegerField(default=0)),
+                (
+                    "parent",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="children",
+                        to="file_versions.folder",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="folders",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="fileversion",
+            name="folder",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="file_versions",
+                to="file_versions.folder",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="fileversion",
+            index=models.Index(
+                condition=models.Q(("is_latest", True)),
+                fields=["folder", "file_url"],
+                name="fileversion_folder_latest_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="folder",
+            constraint=models.UniqueConstraint(fields=("user", "path"), name="unique_user_folder_path"),
+        ),
+        migrations.RunPython(index_existing_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:52
+
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import groupby
+
+import django.utils.timezone
+from django.db import migrations, models
+
+# Blob store of the upload views, relative to the working directory
+PATH_TO_MEDIA = ["src", "propylon_document_manager", "media"]
+
+
+def backfill_created_at(apps, schema_editor):
+    """Dates existing versions from the modification time of their blobs.
+
+    Blobs are shared by identical uploads, so a blob's mtime is when its content was first stored,
+    and some blobs may be missing. The dates are therefore made strictly increasing along each
+    document's version numbers: a version without a blob takes the date of the next version that
+    has one, and a version dated before its predecessor is moved just after it. Documents without
+    any blob keep the migration time.
+    """
+    FileVersion = apps.get_model("file_versions", "FileVersion")
+
+    media_path = os.path.join(os.getcwd(), *PATH_TO_MEDIA)
+    now = django.utils.timezone.now()
+    blob_times = {}
+
+    def blob_time(file_hash):
+        if file_hash not in blob_times:
+            blob_path = os.path.join(media_path, file_hash)
+            blob_times[file_hash] = (
+                datetime.fromtimestamp(os.path.getmtime(blob_path), dt_timezone.utc)
+                if file_hash and os.path.exists(blob_path)
+                else None
+            )
+        return blob_times[file_hash]
+
+    versions = FileVersion.objects.only("id", "user_id", "file_url", "version_number", "file_hash").order_by(
+        "user_id", "file_url", "version_number"
+    )
+    dated = []
+    for _, document in groupby(versions.iterator(chunk_size=2000), key=lambda v: (v.user_id, v.file_url)):
+        document = list(document)
+        times = [blob_time(version.file_hash) for version in document]
+
+        following = None
+        for index in reversed(range(len(times))):
+            times[index] = following = times[index] or following
+
+        previous = None
+        for version, created_at in zip(document, times):
+            created_at = created_at or now
+            if previous is not None and created_at <= previous:
+                created_at = previous + timedelta(microseconds=1)
+            version.created_at = previous = created_at
+            dated.append(version)
+
+        if len(dated) >= 500:
+            FileVersion.objects.bulk_update(dated, ["created_at"])
+            dated = []
+
+    FileVersion.objects.bulk_update(dated, ["created_at"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0007_folder"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fileversion",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0008_fileversion_created_at"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="fileversion",
+            index=models.Index(fields=["file_url", "created_at"], name="fileversion_as_of_idx"),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file_versions", "0009_fileversion_as_of_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AuditEvent",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[("read", "Read"), ("write", "Write"), ("share", "Share")], max_length=16
+                    ),
+                ),
+                ("file_url", models.CharField(blank=True, default="", max_length=255)),
+                ("file_hash", models.CharField(blank=True, default="", max_length=64)),
+                ("file_version_id", models.BigIntegerField(null=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["user", "created_at"], name="auditevent_user_idx"),
+                    models.Index(fields=["file_url", "created_at"], name="auditevent_file_url_idx"),
+                    models.Index(fields=["file_hash", "created_at"], name="auditevent_file_hash_idx"),
+                    models.Index(fields=["created_at"], name="auditevent_created_at_idx"),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def count_storage_usage(apps, schema_editor):
+    FileVersion = apps.get_model("file_versions", "FileVersion")
+    StorageUsage = apps.get_model("file_versions", "StorageUsage")
+
+    usage = {}
+    totals = FileVersion.objects.values("user_id").annotate(logical_bytes=Sum("file_size"), version_count=Count("id"))
+    for row in totals:
+        usage[row["user_id"]] = StorageUsage(
+            user_id=row["user_id"], logical_bytes=row["logical_bytes"], version_count=row["version_count"]
+        )
+
+    blobs = FileVersion.objects.values("user_id", "file_hash").annotate(size=Max("file_size"))
+    for user_id, size in blobs.values_list("user_id", "size").iterator():
+        usage[user_id].physical_bytes += size
+
+    StorageUsage.objects.bulk_create(usage.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file_versions", "0010_auditevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StorageUsage",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="storage_usage",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("logical_bytes", models.PositiveBigIntegerField(default=0)),
+                ("physical_bytes", models.PositiveBigIntegerField(default=0)),
+                ("version_count", models.PositiveIntegerField(default=0)),
+                ("quota_bytes", models.PositiveBigIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(count_storage_usage, migrations.RunPython.noop),
+    ]
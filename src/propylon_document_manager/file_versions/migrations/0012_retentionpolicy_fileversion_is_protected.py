@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file_versions", "0011_storageusage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fileversion",
+            name="is_protected",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name="RetentionPolicy",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("prefix", models.CharField(blank=True, default="", max_length=255)),
+                ("keep_last", models.PositiveIntegerField(blank=True, null=True)),
+                ("keep_daily_days", models.PositiveIntegerField(blank=True, null=True)),
+                ("keep_monthly_months", models.PositiveIntegerField(blank=True, null=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="retention_policies",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [models.UniqueConstraint(fields=("user", "prefix"), name="unique_retention_policy")],
+            },
+        ),
+    ]
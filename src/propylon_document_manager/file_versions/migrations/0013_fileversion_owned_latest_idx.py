@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file_versions", "0012_retentionpolicy_fileversion_is_protected"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="fileversion",
+            index=models.Index(
+                condition=models.Q(("is_latest", True)),
+                fields=["user", "file_url", "id"],
+                name="fileversion_owned_latest_idx",
+            ),
+        ),
+    ]
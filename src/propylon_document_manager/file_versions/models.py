@@ -1,7 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db.models import CharField, EmailField
+from django.db.models import CharField, EmailField, Exists, OuterRef, Q
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
@@ -57,11 +58,169 @@ class User(AbstractUser):
         return reverse("users:detail", kwargs={"pk": self.id})
 
 
+class FileVersionQuerySet(models.QuerySet):
+    def shared_with(self, user_id):
+        """Versions the user has been granted read or write permission on.
+
+        The permission tables are matched through ``IN`` subqueries rather than joins,
+        so the result never needs a ``DISTINCT`` and keeps the ordering of the base index.
+        """
+        return self.filter(
+            Q(id__in=self._permitted_ids(user_id, "read_permissions"))
+            | Q(id__in=self._permitted_ids(user_id, "write_permissions"))
+        )
+
+    def visible_to(self, user_id):
+        """Versions the user either uploaded or has been granted a permission on."""
+        return self.filter(
+            Q(user_id=user_id)
+            | Q(id__in=self._permitted_ids(user_id, "read_permissions"))
+            | Q(id__in=self._permitted_ids(user_id, "write_permissions"))
+        )
+
+    def latest_shared_with(self, user_id):
+        """
+        The newest version of each document of other users that is shared with the user.
+        Permissions are granted per version, so a document whose newer versions are not shared
+        is at the newest version that is, the one the user retrieves.
+        """
+        shared = self.shared_with(user_id).exclude(user_id=user_id)
+        newer = self.model.objects.shared_with(user_id).filter(
+            user_id=OuterRef("user_id"), file_url=OuterRef("file_url"), version_number__gt=OuterRef("version_number")
+        )
+        return shared.exclude(Exists(newer))
+
+    def _permitted_ids(self, user_id, permission):
+        through = getattr(self.model, permission).through
+        return through.objects.filter(user_id=user_id).values("fileversion_id")
+
+
+class Folder(models.Model):
+    """
+    Materialized folder tree of a user's file_urls, maintained on upload so folder listings
+    and sizes are answered without scanning FileVersion. The root folder has an empty path.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="folders")
+    path = models.CharField(max_length=255)
+    parent = models.ForeignKey("self", on_delete=models.CASCADE, null=True, related_name="children")
+    # Documents directly inside this folder
+    file_count = models.PositiveIntegerField(default=0)
+    # Aggregates over the whole subtree
+    total_file_count = models.PositiveIntegerField(default=0)
+    total_version_count = models.PositiveIntegerField(default=0)
+    total_size = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "path"], name="unique_user_folder_path")]
+
+    @property
+    def name(self):
+        return self.path.rsplit("/", 1)[-1]
+
+
 class FileVersion(models.Model):
     file_name = models.fields.CharField(max_length=512)
     version_number = models.fields.IntegerField()
     file_url = models.fields.CharField(max_length=255, default="")
     file_hash = models.CharField(max_length=64, default="")
+    file_size = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    # Marks the newest version of a (user, file_url) document, so document listings
+    # can walk an index instead of grouping the whole version history.
+    is_latest = models.BooleanField(default=True)
+    # Protected versions are never pruned by retention policies
+    is_protected = models.BooleanField(default=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, default=None)
+    folder = models.ForeignKey(Folder, on_delete=models.SET_NULL, null=True, related_name="file_versions")
     read_permissions = models.ManyToManyField(User, related_name="read_permissions")
     write_permissions = models.ManyToManyField(User, related_name="write_permissions")
+
+    objects = FileVersionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["file_url", "user", "version_number"], name="fileversion_document_idx"),
+            models.Index(fields=["file_url", "created_at"], name="fileversion_as_of_idx"),
+            models.Index(
+                fields=["file_url", "id"],
+                condition=Q(is_latest=True),
+                name="fileversion_latest_idx",
+            ),
+            models.Index(
+                fields=["folder", "file_url"],
+                condition=Q(is_latest=True),
+                name="fileversion_folder_latest_idx",
+            ),
+            models.Index(
+                fields=["user", "file_url", "id"],
+                condition=Q(is_latest=True),
+                name="fileversion_owned_latest_idx",
+            ),
+        ]
+
+
+class StorageUsage(models.Model):
+    """
+    Storage a user's versions take, maintained on upload and deletion by quotas.py. Logical
+    bytes count every version, physical bytes every distinct blob once, as deduplication stores
+    it. ``reconcile_storage_usage`` repairs any drift.
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="storage_usage")
+    logical_bytes = models.PositiveBigIntegerField(default=0)
+    physical_bytes = models.PositiveBigIntegerField(default=0)
+    version_count = models.PositiveIntegerField(default=0)
+    # Physical bytes the user may store, overriding FILE_VERSIONS_STORAGE_QUOTA when set
+    quota_bytes = models.PositiveBigIntegerField(null=True, blank=True)
+
+
+class RetentionPolicy(models.Model):
+    """
+    Which superseded versions of a user's documents, or of everyone's, ``prune_versions`` keeps.
+    A version is kept when any rule keeps it; unset rules keep nothing. A document follows the
+    most specific policy: the user's own before global ones, then the longest ``prefix``.
+    """
+
+    # None applies the policy to every user
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name="retention_policies")
+    # Applies to the file_urls starting with it; empty for all of them
+    prefix = models.CharField(max_length=255, blank=True, default="")
+    # The newest versions of a document
+    keep_last = models.PositiveIntegerField(null=True, blank=True)
+    # The newest version of each day, for this many days
+    keep_daily_days = models.PositiveIntegerField(null=True, blank=True)
+    # The newest version of each month, for this many months
+    keep_monthly_months = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "prefix"], name="unique_retention_policy")]
+
+
+class AuditEvent(models.Model):
+    """
+    A read, upload or permission change of a document, written in batches by audit.py. Events
+    outlive the users and versions they refer to, so neither is a database constraint.
+    """
+
+    READ = "read"
+    WRITE = "write"
+    SHARE = "share"
+    ACTION_CHOICES = [(READ, "Read"), (WRITE, "Write"), (SHARE, "Share")]
+
+    # When the event happened, which precedes the batched insert
+    created_at = models.DateTimeField(default=timezone.now)
+    action = models.CharField(max_length=16, choices=ACTION_CHOICES)
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name="+")
+    file_url = models.CharField(max_length=255, blank=True, default="")
+    # Reads through signed blob URLs only know the content hash
+    file_hash = models.CharField(max_length=64, blank=True, default="")
+    file_version_id = models.BigIntegerField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "created_at"], name="auditevent_user_idx"),
+            models.Index(fields=["file_url", "created_at"], name="auditevent_file_url_idx"),
+            models.Index(fields=["file_hash", "created_at"], name="auditevent_file_hash_idx"),
+            models.Index(fields=["created_at"], name="auditevent_created_at_idx"),
+        ]
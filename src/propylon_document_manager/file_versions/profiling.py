@@ -0,0 +1,146 @@
+"""
+On-demand cProfile of individual requests to the file versions views.
+
+A request is profiled when it is sampled at FILE_VERSIONS_PROFILE_SAMPLE_RATE, or when it
+carries an ``X-Profile: 1`` header, FILE_VERSIONS_PROFILING is on and the session user is
+staff. The header is checked before profiling starts, against the user of Django's
+AuthenticationMiddleware, which ``profiling_middleware`` must follow. Users of API tokens are
+only authenticated by the view, so their requests can be sampled but never ask for a
+profile. Profiles are written to FILE_VERSIONS_PROFILE_DIR as
+pstats files, each with a JSON file describing its request. Only the newest
+FILE_VERSIONS_PROFILE_LIMIT are kept. The ``profiles`` command lists and summarises them.
+
+With neither setting on, ``profiling_middleware`` removes itself from the middleware chain and
+costs nothing. cProfile follows a single thread, so a profile covers the view but not the
+streaming of its response. Under ASGI it also covers any other coroutine that ran on the event
+loop meanwhile, and none of the work done in threads. Only one request per thread is profiled
+at a time.
+"""
+import cProfile
+import glob
+import json
+import os
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from django.utils.functional import SimpleLazyObject
+
+PROFILE_HEADER = "X-Profile"
+
+_profiling = threading.local()
+
+
+def profiling_enabled():
+    return settings.FILE_VERSIONS_PROFILING or settings.FILE_VERSIONS_PROFILE_SAMPLE_RATE > 0
+
+
+def wants_profile(request):
+    """Whether the request asks for a profile, which profile_trigger grants to staff users only."""
+    return settings.FILE_VERSIONS_PROFILING and request.headers.get(PROFILE_HEADER) == "1"
+
+
+def profile_trigger(request, user=None):
+    """Why the request should be profiled ("header" or "sample"), or None. ``user`` is the session user."""
+    if user is not None and user.is_staff and wants_profile(request):
+        trigger = "header"
+    elif random.random() < settings.FILE_VERSIONS_PROFILE_SAMPLE_RATE:
+        trigger = "sample"
+    else:
+        return None
+
+    if getattr(_profiling, "active", False):
+        return None
+    try:
+        view = resolve(request.path_info).func
+    except Resolver404:
+        return None
+    if not view.__module__.startswith(__package__):
+        return None
+
+    return trigger
+
+
+def start_profile():
+    _profiling.active = True
+    profile = cProfile.Profile()
+    profile.enable()
+    return profile, time.perf_counter()
+
+
+def stop_profile(profile, started):
+    """Stops a profile and returns the seconds it ran."""
+    profile.disable()
+    _profiling.active = False
+    return time.perf_counter() - started
+
+
+async def arequest_user(request):
+    """The user of a handled request, without a blocking session lookup unless the view replaced it."""
+    user = getattr(request, "user", None)
+    if isinstance(user, SimpleLazyObject):
+        return await request.auser()
+    return user
+
+
+def keep_profile(profile, duration, trigger, request, response, user):
+    """Saves the profile of a request. Returns its name."""
+    info = {
+        "created_at": time.time(),
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "duration_ms": round(duration * 1000, 3),
+        "trigger": trigger,
+        "user_id": user.pk if user else None,
+    }
+    return save_profile(profile, info)
+
+
+def save_profile(profile, info):
+    """Writes a profile and its request info to the ring buffer and drops the oldest beyond the limit."""
+    directory = settings.FILE_VERSIONS_PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    # Zero-padded nanoseconds sort by age, the process id keeps workers apart
+    name = f"{time.time_ns():020d}-{os.getpid()}"
+    path = os.path.join(directory, name)
+
+    profile.dump_stats(f"{path}.prof.tmp")
+    with open(f"{path}.json.tmp", "w") as f:
+        json.dump(info, f)
+    os.replace(f"{path}.json.tmp", f"{path}.json")
+    os.replace(f"{path}.prof.tmp", f"{path}.prof")
+
+    prune_profiles(directory, settings.FILE_VERSIONS_PROFILE_LIMIT)
+    return name
+
+
+def profile_names(directory):
+    """Names of the stored profiles, oldest first."""
+    return sorted(os.path.basename(path)[: -len(".prof")] for path in glob.glob(os.path.join(directory, "*.prof")))
+
+
+def prune_profiles(directory, limit):
+    names = profile_names(directory)
+    for name in names[: max(0, len(names) - limit)]:
+        for extension in (".prof", ".json"):
+            try:
+                os.unlink(os.path.join(directory, name + extension))
+            except FileNotFoundError:
+                # Another worker pruned it first
+                pass
+
+
+def load_profiles(directory):
+    """Returns (name, info) of the stored profiles, oldest first."""
+    profiles = []
+    for name in profile_names(directory):
+        try:
+            with open(os.path.join(directory, f"{name}.json")) as f:
+                profiles.append((name, json.load(f)))
+        except FileNotFoundError:
+            continue
+
+    return profiles
@@ -0,0 +1,197 @@
+"""
+Per-user storage usage and quotas.
+
+StorageUsage counts the logical bytes (every version), physical bytes (every distinct blob
+once) and versions of each user. ``add_version_usage`` updates them in the transaction that
+stores a version, and ``remove_versions_usage`` in the one that deletes versions. An upload of a new
+blob that takes the user over their quota rolls back, so concurrent uploads cannot overshoot
+it together.
+
+Uploads are also checked before their body is read. ``limit_upload`` rejects a Content-Length
+that cannot fit, and installs a ``QuotaUploadHandler`` that stops reading the file as soon as it
+outgrows the remaining quota. Both checks count the whole upload, even if it turns out to be a
+blob the user already stores. Requests authenticated by session have their body parsed by the
+CSRF check before the view runs, so only the Content-Length check applies to them.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum, Value
+from django.db.models.functions import Greatest
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import FileVersion, StorageUsage, User
+
+# Bytes of a multipart upload that are not file content: boundaries, part headers and file_url
+MULTIPART_ALLOWANCE = 64 * 1024
+
+USAGE_FIELDS = ("logical_bytes", "physical_bytes", "version_count")
+
+
+class StorageQuotaExceeded(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "Storage quota exceeded"
+    default_code = "storage_quota_exceeded"
+
+
+def user_quota(quota_bytes):
+    """A user's quota: their own when set, otherwise FILE_VERSIONS_STORAGE_QUOTA. None is unlimited."""
+    return quota_bytes if quota_bytes is not None else settings.FILE_VERSIONS_STORAGE_QUOTA
+
+
+def remaining_quota(user_id):
+    """Physical bytes the user may still store, or None without a quota."""
+    usage = StorageUsage.objects.filter(user_id=user_id).values_list("physical_bytes", "quota_bytes").first()
+    physical_bytes, quota_bytes = usage or (0, None)
+    quota = user_quota(quota_bytes)
+    if quota is None:
+        return None
+
+    return max(0, quota - physical_bytes)
+
+
+class QuotaUploadHandler(FileUploadHandler):
+    """Stops reading an upload, and the rest of the request body, once its files exceed the remaining quota."""
+
+    def __init__(self, remaining, request=None):
+        super().__init__(request)
+        self.remaining = remaining
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.remaining:
+            raise StorageQuotaExceeded()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def limit_upload(request, user_id):
+    """Rejects an upload that cannot fit in the user's quota before its body is read. Call before parsing it."""
+    remaining = remaining_quota(user_id)
+    if remaining is None:
+        return
+
+    try:
+        content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > remaining + MULTIPART_ALLOWANCE:
+        raise StorageQuotaExceeded()
+
+    request.upload_handlers.insert(0, QuotaUploadHandler(remaining, request))
+
+
+def stores_blob(user_id, file_hash):
+    return FileVersion.objects.filter(user_id=user_id, file_hash=file_hash).exists()
+
+
+def add_version_usage(user_id, file_size, new_blob):
+    """
+    Counts a newly stored version, whose blob is new to the user when ``new_blob``. Must run in
+    the transaction that inserted it, which is rolled back if a new blob exceeds the quota.
+    """
+    updated = StorageUsage.objects.filter(user_id=user_id).update(
+        logical_bytes=F("logical_bytes") + file_size,
+        physical_bytes=F("physical_bytes") + (file_size if new_blob else 0),
+        version_count=F("version_count") + 1,
+    )
+    if not updated:
+        # Users whose versions were inserted without going through here, e.g. by generate_dataset
+        reconcile_usage([user_id])
+
+    if new_blob:
+        physical_bytes, quota_bytes = StorageUsage.objects.filter(user_id=user_id).values_list(
+            "physical_bytes", "quota_bytes"
+        ).get()
+        quota = user_quota(quota_bytes)
+        if quota is not None and physical_bytes > quota:
+            raise StorageQuotaExceeded()
+
+
+def remove_versions_usage(rows):
+    """
+    Uncounts deleted versions, given as rows with user_id, file_hash and file_size. Must run in
+    the transaction that deleted them, after the deletion. A blob stops counting once the user
+    has no other version of it, and is released once however many of its versions were deleted.
+    """
+    removed = defaultdict(lambda: {"logical_bytes": 0, "version_count": 0, "blobs": {}})
+    for row in rows:
+        usage = removed[row["user_id"]]
+        usage["logical_bytes"] += row["file_size"]
+        usage["version_count"] += 1
+        usage["blobs"][row["file_hash"]] = row["file_size"]
+
+    still_stored = set(
+        FileVersion.objects.filter(
+            user_id__in=removed, file_hash__in={row["file_hash"] for row in rows}
+        ).values_list("user_id", "file_hash").distinct()
+    )
+    for user_id, usage in removed.items():
+        released = sum(
+            size for file_hash, size in usage["blobs"].items() if (user_id, file_hash) not in still_stored
+        )
+        StorageUsage.objects.filter(user_id=user_id).update(
+            logical_bytes=Greatest(F("logical_bytes") - usage["logical_bytes"], Value(0)),
+            physical_bytes=Greatest(F("physical_bytes") - released, Value(0)),
+            version_count=Greatest(F("version_count") - usage["version_count"], Value(0)),
+        )
+
+
+def expected_usage(user_ids):
+    """Recomputes the usage of the given users from their versions. Returns {user_id: {field: value}}."""
+    usage = defaultdict(lambda: dict.fromkeys(USAGE_FIELDS, 0))
+    versions = FileVersion.objects.filter(user_id__in=user_ids)
+
+    for row in versions.values("user_id").annotate(logical_bytes=Sum("file_size"), version_count=Count("id")):
+        usage[row["user_id"]].update(logical_bytes=row["logical_bytes"], version_count=row["version_count"])
+
+    blobs = versions.values("user_id", "file_hash").annotate(size=Max("file_size")).values_list("user_id", "size")
+    for user_id, size in blobs.iterator(chunk_size=2000):
+        usage[user_id]["physical_bytes"] += size
+
+    return usage
+
+
+def reconcile_usage(user_ids=None, dry_run=False, batch_size=1000):
+    """
+    Compares the stored usage of users, or of all users, with a recomputation and repairs it
+    unless ``dry_run``. Each batch of users is locked and repaired in its own transaction.
+    Returns (user_id, stored, expected) for every user that had drifted, stored being None
+    for users without a usage row.
+    """
+    if user_ids is None:
+        user_ids = User.objects.order_by("id").values_list("id", flat=True)
+    user_ids = list(user_ids)
+
+    drifted = []
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start : start + batch_size]
+        with transaction.atomic():
+            rows = StorageUsage.objects.select_for_update().filter(user_id__in=batch)
+            stored = {usage.user_id: usage for usage in rows}
+            expected = expected_usage(batch)
+
+            created, changed = [], []
+            for user_id in batch:
+                values = expected[user_id]
+                usage = stored.get(user_id)
+                if usage is None:
+                    drifted.append((user_id, None, values))
+                    created.append(StorageUsage(user_id=user_id, **values))
+                elif any(getattr(usage, field) != value for field, value in values.items()):
+                    drifted.append((user_id, {field: getattr(usage, field) for field in USAGE_FIELDS}, values))
+                    for field, value in values.items():
+                        setattr(usage, field, value)
+                    changed.append(usage)
+
+            if not dry_run:
+                StorageUsage.objects.bulk_create(created)
+                StorageUsage.objects.bulk_update(changed, USAGE_FIELDS)
+
+    return drifted
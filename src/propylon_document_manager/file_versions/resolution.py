@@ -0,0 +1,251 @@
+import asyncio
+import secrets
+import time
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Q, Value, When
+
+from .metrics import record_cache_lookup
+from .models import FileVersion
+from .routers import reading_from_replica
+
+RESOLVED_FIELDS = ("id", "file_url", "file_name", "version_number", "file_hash", "file_size", "user_id")
+
+GENERATION_CACHE_KEY = "file_versions:resolution_generation:{document}"
+RESOLUTION_CACHE_KEY = "file_versions:resolution:{document}:{generation}:{user_id}:{revision}"
+# Cached for lookups that found nothing, so unknown documents do not hit the database either
+NOT_FOUND = "not-found"
+# How long a resolution may hold the stampede lock, and how long others wait for its result
+RESOLUTION_LOCK_TIMEOUT = 5
+RESOLUTION_LOCK_WAIT = 0.5
+
+
+def resolve_file_versions(user_id, keys):
+    """
+    Resolves many (file_url, revision) pairs for a user with a single query.
+
+    A revision of None means the latest version. Resolution follows the retrieve view: the
+    user's own version wins, otherwise the newest version shared with the user. Returns
+    {(file_url, revision): row} for the keys that resolved; the others are not visible.
+    """
+    keys = set(keys)
+    latest = {file_url for file_url, revision in keys if revision is None}
+
+    # Own documents only need their latest row; shared ones may be readable at an older version
+    condition = Q(file_url__in=latest) & (Q(is_latest=True) | ~Q(user_id=user_id)) if latest else Q()
+    for file_url, revision in keys:
+        if revision is not None:
+            condition |= Q(file_url=file_url, version_number=revision)
+
+    if not condition:
+        return {}
+
+    rows = (
+        FileVersion.objects.filter(condition)
+        .visible_to(user_id)
+        .annotate(is_shared=Case(When(user_id=user_id, then=Value(0)), default=Value(1)))
+        .order_by("file_url", "is_shared", "-version_number")
+        .values(*RESOLVED_FIELDS)
+    )
+
+    resolved = {}
+    for row in rows:
+        for key in ((row["file_url"], None), (row["file_url"], row["version_number"])):
+            if key in keys and key not in resolved:
+                resolved[key] = row
+
+    return resolved
+
+
+def document_key(file_url):
+    return sha1(file_url.encode()).hexdigest()
+
+
+def document_generation(file_url):
+    """
+    The current generation of a document's cached resolutions. A missing generation is
+    initialised to a random one, so entries of an evicted generation can never be reused.
+    """
+    key = GENERATION_CACHE_KEY.format(document=document_key(file_url))
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, secrets.token_hex(8), timeout=None)
+        generation = cache.get(key)
+
+    return generation
+
+
+async def adocument_generation(file_url):
+    key = GENERATION_CACHE_KEY.format(document=document_key(file_url))
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, secrets.token_hex(8), timeout=None)
+        generation = await cache.aget(key)
+
+    return generation
+
+
+def invalidate_resolution(file_url):
+    """Drops every cached resolution of a document, for all users and revisions."""
+    key = GENERATION_CACHE_KEY.format(document=document_key(file_url))
+    cache.set(key, secrets.token_hex(8), timeout=None)
+    # A request resolving before the transaction commits caches the old rows under the new
+    # generation, so the generation is bumped again once they are visible
+    transaction.on_commit(lambda: cache.set(key, secrets.token_hex(8), timeout=None))
+
+
+def resolve_file_version(user_id, file_url, revision=None, as_of=None):
+    """
+    Resolves the version of a document a user retrieves: their own version first, otherwise the
+    newest version shared with them. Returns {"file_hash", "file_name"} or None.
+
+    Latest and pinned revisions are cached per document generation, so a cache hit costs no
+    queries. Pinned revisions only change when permissions do, and are cached for longer.
+    Lookups as of a point in time are not cached.
+    """
+    if as_of is not None:
+        return query_file_version(user_id, file_url, revision, as_of)
+
+    cache_key = RESOLUTION_CACHE_KEY.format(
+        document=document_key(file_url),
+        generation=document_generation(file_url),
+        user_id=user_id,
+        revision="latest" if revision is None else revision,
+    )
+    timeout = resolution_timeout(revision)
+
+    resolved = cached_resolution(
+        cache_key, timeout, lambda: query_file_version(user_id, file_url, revision, as_of) or NOT_FOUND
+    )
+    return None if resolved == NOT_FOUND else resolved
+
+
+async def aresolve_file_version(user_id, file_url, revision=None, as_of=None):
+    """Async counterpart of resolve_file_version, using the async cache and ORM APIs."""
+    if as_of is not None:
+        return await aquery_file_version(user_id, file_url, revision, as_of)
+
+    cache_key = RESOLUTION_CACHE_KEY.format(
+        document=document_key(file_url),
+        generation=await adocument_generation(file_url),
+        user_id=user_id,
+        revision="latest" if revision is None else revision,
+    )
+    timeout = resolution_timeout(revision)
+
+    async def resolve():
+        return await aquery_file_version(user_id, file_url, revision, as_of) or NOT_FOUND
+
+    resolved = await acached_resolution(cache_key, timeout, resolve)
+    return None if resolved == NOT_FOUND else resolved
+
+
+def resolution_timeout(revision):
+    if revision is None:
+        timeout = settings.FILE_VERSIONS_RESOLUTION_CACHE_TTL
+    else:
+        timeout = settings.FILE_VERSIONS_RESOLUTION_CACHE_PINNED_TTL
+
+    # A lagging replica may return rows from before the last invalidation, so what it returned
+    # is only trusted for as long as writers are pinned to the primary
+    if reading_from_replica():
+        timeout = min(timeout, settings.FILE_VERSIONS_REPLICA_PIN_SECONDS)
+
+    return timeout
+
+
+def cached_resolution(cache_key, timeout, resolve):
+    """
+    Returns the cached value of a key, or resolves and caches it. Only one request resolves a
+    missing key at a time; the others wait briefly for its result instead of all querying at once.
+    """
+    value = cache.get(cache_key)
+    record_cache_lookup("resolution", value is not None)
+    if value is not None:
+        return value
+
+    lock_key = f"{cache_key}:lock"
+    locked = cache.add(lock_key, 1, timeout=RESOLUTION_LOCK_TIMEOUT)
+    if not locked:
+        deadline = time.monotonic() + RESOLUTION_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(0.01)
+            value = cache.get(cache_key)
+            if value is not None:
+                return value
+
+    try:
+        value = resolve()
+        cache.set(cache_key, value, timeout=timeout)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+    return value
+
+
+async def acached_resolution(cache_key, timeout, resolve):
+    value = await cache.aget(cache_key)
+    record_cache_lookup("resolution", value is not None)
+    if value is not None:
+        return value
+
+    lock_key = f"{cache_key}:lock"
+    locked = await cache.aadd(lock_key, 1, timeout=RESOLUTION_LOCK_TIMEOUT)
+    if not locked:
+        deadline = time.monotonic() + RESOLUTION_LOCK_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+            value = await cache.aget(cache_key)
+            if value is not None:
+                return value
+
+    try:
+        value = await resolve()
+        await cache.aset(cache_key, value, timeout=timeout)
+    finally:
+        if locked:
+            await cache.adelete(lock_key)
+
+    return value
+
+
+def retrieval_query(file_url, revision=None, as_of=None):
+    if revision is not None:
+        return FileVersion.objects.filter(file_url=file_url, version_number=revision)
+
+    if as_of is not None:
+        # The version current at that moment: one seek on the (file_url, created_at) index
+        return FileVersion.objects.filter(file_url=file_url, created_at__lte=as_of).order_by(
+            "-created_at", "-version_number"
+        )
+
+    return FileVersion.objects.filter(file_url=file_url).order_by("-version_number")
+
+
+def query_file_version(user_id, file_url, revision=None, as_of=None):
+    base_query = retrieval_query(file_url, revision, as_of)
+
+    # Currently two or more users can upload files with the same url and share the files between them
+    # This could maybe be fixed with an optional query param like user_id or is_uploader.
+
+    # Searching for user's files first
+    file_version = base_query.filter(user_id=user_id).values("file_hash", "file_name").first()
+    if not file_version:
+        # If no files are found, searching for files where user has permission
+        file_version = base_query.shared_with(user_id).values("file_hash", "file_name").first()
+
+    return file_version
+
+
+async def aquery_file_version(user_id, file_url, revision=None, as_of=None):
+    base_query = retrieval_query(file_url, revision, as_of)
+
+    file_version = await base_query.filter(user_id=user_id).values("file_hash", "file_name").afirst()
+    if not file_version:
+        file_version = await base_query.shared_with(user_id).values("file_hash", "file_name").afirst()
+
+    return file_version
@@ -0,0 +1,241 @@
+"""
+Version retention policies and pruning.
+
+RetentionPolicy rows decide which superseded versions of a document are kept: the newest
+``keep_last``, and the newest of each day for ``keep_daily_days`` days and of each month for
+``keep_monthly_months`` months. The latest version of a document and protected versions are
+always kept, and documents no policy applies to keep their whole history.
+
+``prune_versions`` walks documents in pages along the latest-version index and deletes what
+their policy does not keep in transactions of at most ``batch_size`` versions, so locks are
+only held briefly. Each transaction also updates the folder index and storage usage, and the
+post_delete signal drops cached resolutions. Since only superseded versions are deleted, no
+is_latest flag changes. Once a transaction commits, blobs that no version references any more
+are removed from disk.
+"""
+import os
+import time
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .folders import record_pruning
+from .models import FileVersion, RetentionPolicy
+from .uploads import delete_file_versions
+
+# Documents whose versions are read, and judged, together
+DOCUMENT_PAGE_SIZE = 500
+
+VERSION_FIELDS = ("id", "user_id", "file_url", "file_hash", "file_size", "created_at", "is_protected")
+
+
+def load_policies(user_ids=None):
+    """The policies that may apply to the given users, or to all, in order of precedence."""
+    policies = RetentionPolicy.objects.all()
+    if user_ids is not None:
+        policies = policies.filter(Q(user__isnull=True) | Q(user_id__in=user_ids))
+
+    # The user's own policies before global ones, then longer prefixes first
+    return sorted(policies, key=lambda policy: (policy.user_id is None, -len(policy.prefix)))
+
+
+def applicable_policy(policies, user_id, file_url):
+    for policy in policies:
+        if policy.user_id in (None, user_id) and file_url.startswith(policy.prefix):
+            return policy
+    return None
+
+
+def month_number(day):
+    return day.year * 12 + day.month - 1
+
+
+def kept_versions(versions, policy, today):
+    """
+    Returns the ids of the versions of a document that a policy keeps. ``versions`` are rows
+    with VERSION_FIELDS, newest first.
+    """
+    kept = {versions[0]["id"]}
+    if policy.keep_last:
+        kept.update(version["id"] for version in versions[: policy.keep_last])
+
+    days, months = set(), set()
+    for version in versions:
+        if version["is_protected"]:
+            kept.add(version["id"])
+
+        day = timezone.localdate(version["created_at"])
+        if policy.keep_daily_days and (today - day).days < policy.keep_daily_days and day not in days:
+            days.add(day)
+            kept.add(version["id"])
+
+        month = month_number(day)
+        if policy.keep_monthly_months and month_number(today) - month < policy.keep_monthly_months:
+            if month not in months:
+                months.add(month)
+                kept.add(version["id"])
+
+    return kept
+
+
+def prunable_versions(documents, policies, today):
+    """Returns the versions of a page of (user_id, file_url) documents that their policies do not keep."""
+    documents = {document for document in documents if applicable_policy(policies, *document)}
+    if not documents:
+        return []
+
+    versions = FileVersion.objects.filter(
+        user_id__in={user_id for user_id, _ in documents}, file_url__in={file_url for _, file_url in documents}
+    ).order_by("file_url", "user_id", "-version_number")
+
+    by_document = defaultdict(list)
+    for version in versions.values(*VERSION_FIELDS):
+        document = (version["user_id"], version["file_url"])
+        if document in documents:
+            by_document[document].append(version)
+
+    prunable = []
+    for document, document_versions in by_document.items():
+        kept = kept_versions(document_versions, applicable_policy(policies, *document), today)
+        prunable.extend(version for version in document_versions if version["id"] not in kept)
+
+    return prunable
+
+
+@transaction.atomic
+def delete_versions(version_ids):
+    """
+    Deletes the given versions that are still superseded and unprotected, and removes them from
+    the folder index and storage usage. Returns the deleted rows.
+    """
+    versions = FileVersion.objects.select_for_update().filter(id__in=version_ids, is_latest=False, is_protected=False)
+    rows = delete_file_versions(versions)
+
+    pruned = defaultdict(lambda: [0, 0])
+    for row in rows:
+        document = pruned[(row["user_id"], row["file_url"])]
+        document[0] += 1
+        document[1] += row["file_size"]
+    for (user_id, file_url), (version_count, size) in pruned.items():
+        record_pruning(user_id, file_url, version_count, size)
+
+    return rows
+
+
+def release_blob(media_path, file_hash, since):
+    """
+    Removes a blob no version references from disk, and returns whether it did. The blob is
+    moved aside before it is checked once more, and put back if it has been written since
+    ``since``, when its versions were deleted, or is referenced again. An upload deduplicated
+    against it in the meantime finds it missing after storing its version, and rewrites it.
+    """
+    path = os.path.join(media_path, file_hash)
+    moved = f"{path}.pruned"
+    try:
+        os.replace(path, moved)
+    except FileNotFoundError:
+        return False
+
+    if os.path.getmtime(moved) >= since or FileVersion.objects.filter(file_hash=file_hash).exists():
+        os.replace(moved, path)
+        return False
+
+    os.remove(moved)
+    return True
+
+
+def release_blobs(media_path, rows, since):
+    """Removes the blobs of deleted rows that are no longer referenced. Returns the bytes freed."""
+    sizes = {row["file_hash"]: row["file_size"] for row in rows}
+    referenced = set(FileVersion.objects.filter(file_hash__in=sizes).values_list("file_hash", flat=True).distinct())
+
+    return sum(
+        size
+        for file_hash, size in sizes.items()
+        if file_hash not in referenced and release_blob(media_path, file_hash, since)
+    )
+
+
+def unreferenced_bytes(pruned_blobs):
+    """Bytes of the blobs whose every version would be pruned. ``pruned_blobs`` is {file_hash: (count, size)}."""
+    file_hashes = list(pruned_blobs)
+    reclaimed = 0
+    for start in range(0, len(file_hashes), 500):
+        references = (
+            FileVersion.objects.filter(file_hash__in=file_hashes[start : start + 500])
+            .values("file_hash")
+            .annotate(count=Count("id"))
+            .values_list("file_hash", "count")
+        )
+        for file_hash, count in references:
+            pruned_count, size = pruned_blobs[file_hash]
+            if count == pruned_count:
+                reclaimed += size
+
+    return reclaimed
+
+
+def prune_versions(media_path=None, user_ids=None, dry_run=False, batch_size=100, pause=0, today=None):
+    """
+    Deletes the versions of the given users, or of all, that retention policies do not keep.
+    Unreferenced blobs are removed from media_path, unless it is None. ``pause`` seconds are
+    slept between transactions to leave room for other writers. With ``dry_run`` nothing is
+    deleted and the report is of what would be.
+
+    Returns counts of pruned documents, versions and bytes of versions, bytes of blobs freed on
+    disk, and {user_id: [versions, bytes]}.
+    """
+    report = {"documents": 0, "versions": 0, "bytes": 0, "blob_bytes": 0, "users": defaultdict(lambda: [0, 0])}
+    policies = load_policies(user_ids)
+    if not policies:
+        return report
+
+    today = today or timezone.localdate()
+    documents = FileVersion.objects.filter(is_latest=True)
+    if user_ids is not None:
+        documents = documents.filter(user_id__in=user_ids)
+    if all(policy.user_id is not None for policy in policies):
+        documents = documents.filter(user_id__in={policy.user_id for policy in policies})
+    documents = documents.order_by("file_url", "id").values_list("id", "user_id", "file_url")
+
+    pruned_blobs = defaultdict(lambda: [0, 0])
+    last = None
+    while True:
+        page = documents
+        if last:
+            page = page.filter(Q(file_url__gt=last[2]) | Q(file_url=last[2], id__gt=last[0]))
+        page = list(page[:DOCUMENT_PAGE_SIZE])
+        if not page:
+            break
+        last = page[-1]
+
+        prunable = prunable_versions([(user_id, file_url) for _, user_id, file_url in page], policies, today)
+        pruned_documents = set()
+        for start in range(0, len(prunable), batch_size):
+            if dry_run:
+                rows = prunable[start : start + batch_size]
+            else:
+                deleted_at = time.time()
+                rows = delete_versions([version["id"] for version in prunable[start : start + batch_size]])
+                if media_path is not None:
+                    report["blob_bytes"] += release_blobs(media_path, rows, since=deleted_at)
+                if pause:
+                    time.sleep(pause)
+
+            for row in rows:
+                pruned_documents.add((row["user_id"], row["file_url"]))
+                report["versions"] += 1
+                report["bytes"] += row["file_size"]
+                report["users"][row["user_id"]][0] += 1
+                report["users"][row["user_id"]][1] += row["file_size"]
+                if dry_run:
+                    pruned_blobs[row["file_hash"]][0] += 1
+                    pruned_blobs[row["file_hash"]][1] = row["file_size"]
+        report["documents"] += len(pruned_documents)
+
+    if dry_run:
+        report["blob_bytes"] = unreferenced_bytes(pruned_blobs)
+
+    return report
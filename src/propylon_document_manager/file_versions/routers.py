@@ -0,0 +1,75 @@
+"""
+Read-replica routing with read-your-writes stickiness.
+
+Writes always go to the primary (``default``). Reads only go to a replica inside
+``replica_reads()``, which the views wrap around resolution and listing queries once the user
+is known. Everything else, notably reads inside write transactions, stays on the primary.
+
+After a user writes, ``pin_to_primary`` keeps their reads on the primary for
+``FILE_VERSIONS_REPLICA_PIN_SECONDS``, so they see their new version even while the replicas
+lag. The pin lives in the cache and is shared by all processes, whichever session or token the
+user comes back with.
+"""
+
+import contextvars
+import random
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+PRIMARY_PIN_CACHE_KEY = "file_versions:primary_pin:{user_id}"
+
+_read_alias = contextvars.ContextVar("file_versions_read_alias", default=None)
+
+
+def replica_aliases():
+    return settings.FILE_VERSIONS_REPLICA_DATABASES
+
+
+def pin_to_primary(user_id):
+    """Sends the reads of a user who just wrote to the primary for the pin window."""
+    if replica_aliases():
+        cache.set(PRIMARY_PIN_CACHE_KEY.format(user_id=user_id), 1, timeout=settings.FILE_VERSIONS_REPLICA_PIN_SECONDS)
+
+
+def choose_replica(pinned):
+    aliases = replica_aliases()
+    return random.choice(aliases) if aliases and not pinned else None
+
+
+@contextmanager
+def replica_reads(user_id):
+    """Routes the reads made in the block to a replica, unless the user is pinned to the primary."""
+    pinned = bool(replica_aliases()) and cache.get(PRIMARY_PIN_CACHE_KEY.format(user_id=user_id)) is not None
+    token = _read_alias.set(choose_replica(pinned))
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+@asynccontextmanager
+async def areplica_reads(user_id):
+    pinned = bool(replica_aliases()) and await cache.aget(PRIMARY_PIN_CACHE_KEY.format(user_id=user_id)) is not None
+    token = _read_alias.set(choose_replica(pinned))
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def reading_from_replica():
+    return _read_alias.get() is not None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
@@ -0,0 +1,85 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .api.authentication import invalidate_token
+from .metrics import install_query_recorder
+from .models import FileVersion, User
+from .resolution import invalidate_resolution
+from .signing import revoke_signed_urls
+
+# Saving only these user fields keeps cached tokens. Every login saves last_login this way.
+TOKEN_NEUTRAL_USER_FIELDS = frozenset({"last_login"})
+
+
+@receiver(post_save, sender=User)
+def revoke_urls_of_deactivated_users(sender, instance, **kwargs):
+    if not instance.is_active:
+        revoke_signed_urls(instance.id)
+
+
+@receiver(m2m_changed, sender=FileVersion.read_permissions.through)
+@receiver(m2m_changed, sender=FileVersion.write_permissions.through)
+def revoke_urls_of_removed_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Signed URLs are not re-checked against permissions, so users losing a permission lose their
+    URLs. Permission lists are replaced with set(), which removes exactly the users who lost
+    access; clearing a version's list is not a revocation of its users' other URLs.
+    """
+    if reverse and action in ("pre_clear", "post_remove"):
+        user_ids = [instance.pk]
+    elif not reverse and action == "post_remove":
+        user_ids = pk_set
+    else:
+        return
+
+    for user_id in user_ids:
+        revoke_signed_urls(user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_tokens_of_changed_users(sender, instance, created, update_fields, **kwargs):
+    """Cached tokens carry their user, so any change to it, deactivation included, refetches them."""
+    if created or update_fields is not None and update_fields <= TOKEN_NEUTRAL_USER_FIELDS:
+        return
+
+    for key in Token.objects.filter(user=instance).values_list("key", flat=True):
+        invalidate_token(key)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_tokens(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=FileVersion)
+@receiver(post_delete, sender=FileVersion)
+def invalidate_resolution_of_changed_version(sender, instance, **kwargs):
+    invalidate_resolution(instance.file_url)
+
+
+@receiver(m2m_changed, sender=FileVersion.read_permissions.through)
+@receiver(m2m_changed, sender=FileVersion.write_permissions.through)
+def invalidate_resolution_of_changed_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """Granting or removing a permission changes which version a user resolves to."""
+    if action not in ("pre_clear", "post_add", "post_remove"):
+        return
+
+    if not reverse:
+        invalidate_resolution(instance.file_url)
+        return
+
+    if action == "pre_clear":
+        relation = "read_permissions" if sender is FileVersion.read_permissions.through else "write_permissions"
+        file_versions = getattr(instance, relation).all()
+    else:
+        file_versions = FileVersion.objects.filter(pk__in=pk_set)
+
+    for file_url in set(file_versions.values_list("file_url", flat=True)):
+        invalidate_resolution(file_url)
+
+
+@receiver(connection_created)
+def record_queries_of_new_connections(sender, connection, **kwargs):
+    install_query_recorder(connection)
@@ -0,0 +1,45 @@
+from django.db import transaction
+
+from .folders import record_upload
+from .models import FileVersion
+from .quotas import add_version_usage, remove_versions_usage, stores_blob
+
+
+@transaction.atomic
+def store_file_version(user_id, file_url, file_name, file_hash, file_size, version_number, save_blob=None):
+    """
+    Inserts a new latest version of a document and adds it to the folder index and the user's
+    storage usage. Raises StorageQuotaExceeded, storing nothing, if a blob new to the user takes
+    them over their quota. ``save_blob``, when the blob is not on disk yet, is called once the
+    version fits in the quota, so a rejected upload leaves no blob behind, and a failed write
+    no version.
+    """
+    new_blob = not stores_blob(user_id, file_hash)
+    FileVersion.objects.filter(file_url=file_url, user_id=user_id, is_latest=True).update(is_latest=False)
+    folder = record_upload(user_id, file_url, file_size, new_document=version_number == 0)
+    file_version = FileVersion.objects.create(
+        file_name=file_name,
+        version_number=version_number,
+        file_url=file_url,
+        file_hash=file_hash,
+        file_size=file_size,
+        user_id=user_id,
+        folder=folder,
+    )
+    add_version_usage(user_id, file_size, new_blob)
+    if save_blob:
+        save_blob()
+    return file_version
+
+
+@transaction.atomic
+def delete_file_versions(versions):
+    """
+    Deletes a queryset of versions and releases their storage usage, all at once so that blobs
+    shared by several of them are released once. Returns the deleted rows.
+    """
+    rows = list(versions.values("id", "user_id", "file_url", "file_hash", "file_size"))
+    # Through the ORM, so post_delete signals drop cached resolutions of each version
+    FileVersion.objects.filter(id__in=[row["id"] for row in rows]).delete()
+    remove_versions_usage(rows)
+    return rows
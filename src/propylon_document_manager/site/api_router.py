@@ -1,7 +1,12 @@
 from django.conf import settings
 from rest_framework.routers import DefaultRouter, SimpleRouter
 
-from propylon_document_manager.file_versions.api.views import FileVersionViewSet
+from propylon_document_manager.file_versions.api.views import (
+    AuditEventViewSet,
+    FileVersionViewSet,
+    FolderViewSet,
+    RetentionPolicyViewSet,
+)
 
 if settings.DEBUG:
     router = DefaultRouter()
@@ -9,6 +14,9 @@ else:
     router = SimpleRouter()
 
 router.register("file_versions", FileVersionViewSet)
+router.register("folders", FolderViewSet)
+router.register("audit", AuditEventViewSet)
+router.register("retention_policies", RetentionPolicyViewSet)
 
 
 app_name = "api"
@@ -0,0 +1,14 @@
+"""
+ASGI entry point, serving the native async retrieve and upload views unless
+FILE_VERSIONS_ASYNC_VIEWS is set to false.
+
+    python -m propylon_document_manager.site.asgi_server
+"""
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "propylon_document_manager.site.settings.production")
+os.environ.setdefault("FILE_VERSIONS_ASYNC_VIEWS", "true")
+
+application = get_asgi_application()
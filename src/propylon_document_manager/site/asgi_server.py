@@ -0,0 +1,34 @@
+"""
+Runs the ASGI application under uvicorn, configured from the environment.
+
+    UVICORN_WORKERS=4 python -m propylon_document_manager.site.asgi_server
+"""
+import os
+
+import uvicorn
+
+
+def uvicorn_config():
+    limit_concurrency = os.environ.get("UVICORN_LIMIT_CONCURRENCY")
+    return {
+        "host": os.environ.get("UVICORN_HOST", "0.0.0.0"),
+        "port": int(os.environ.get("UVICORN_PORT", 8001)),
+        "workers": int(os.environ.get("UVICORN_WORKERS", os.cpu_count() or 1)),
+        # Thousands of slow clients are the reason to run under ASGI, so leave room for them to connect
+        "backlog": int(os.environ.get("UVICORN_BACKLOG", 4096)),
+        "limit_concurrency": int(limit_concurrency) if limit_concurrency else None,
+        "timeout_keep_alive": int(os.environ.get("UVICORN_TIMEOUT_KEEP_ALIVE", 5)),
+        "proxy_headers": True,
+        "forwarded_allow_ips": os.environ.get("UVICORN_FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        # Django does not implement the lifespan protocol
+        "lifespan": "off",
+        "access_log": os.environ.get("UVICORN_ACCESS_LOG", "false").lower() == "true",
+    }
+
+
+def main():
+    uvicorn.run("propylon_document_manager.site.asgi:application", **uvicorn_config())
+
+
+if __name__ == "__main__":
+    main()
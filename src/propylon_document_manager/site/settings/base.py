@@ -50,6 +50,15 @@ DATABASES = {
         "NAME": "propylon_document_manager.sqlite",
     }
 }
+# Read replicas, as database URLs. They are named replica0, replica1, ...
+DATABASES.update(
+    {
+        f"replica{index}": env.db_url_config(url)
+        for index, url in enumerate(env.list("DATABASE_REPLICA_URLS", default=[]))
+    }
+)
+# https://docs.djangoproject.com/en/dev/ref/settings/#database-routers
+DATABASE_ROUTERS = ["propylon_document_manager.file_versions.routers.ReplicaRouter"]
 # https://docs.djangoproject.com/en/stable/ref/settings/#std:setting-DEFAULT_AUTO_FIELD
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -57,6 +66,8 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#root-urlconf
 ROOT_URLCONF = "propylon_document_manager.site.urls"
+# https://docs.djangoproject.com/en/dev/ref/settings/#wsgi-application
+WSGI_APPLICATION = "propylon_document_manager.site.wsgi.application"
 
 # APPS
 # ------------------------------------------------------------------------------
@@ -124,6 +135,7 @@ AUTH_PASSWORD_VALIDATORS = [
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#middleware
 MIDDLEWARE = [
+    "propylon_document_manager.file_versions.middleware.metrics_middleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -132,6 +144,8 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # Checks the session user before profiling a request
+    "propylon_document_manager.file_versions.middleware.profiling_middleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "allauth.account.middleware.AccountMiddleware"
@@ -269,7 +283,7 @@ ACCOUNT_EMAIL_VERIFICATION = "mandatory"
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework.authentication.SessionAuthentication",
-        "rest_framework.authentication.TokenAuthentication",
+        "propylon_document_manager.file_versions.api.authentication.CachedTokenAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
 }
@@ -279,3 +293,63 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 # Your stuff...
 # ------------------------------------------------------------------------------
+
+# File versions
+# ------------------------------------------------------------------------------
+# Maximum number of files a single batch request may ask for
+FILE_VERSIONS_BATCH_MAX_ITEMS = env.int("FILE_VERSIONS_BATCH_MAX_ITEMS", default=100)
+# Files up to this size are returned inline by the batch endpoint, larger ones as links
+FILE_VERSIONS_BATCH_INLINE_MAX_SIZE = env.int("FILE_VERSIONS_BATCH_INLINE_MAX_SIZE", default=64 * 1024)
+# Upper bound on the inlined bytes of one batch response
+FILE_VERSIONS_BATCH_INLINE_BUDGET = env.int("FILE_VERSIONS_BATCH_INLINE_BUDGET", default=1024 * 1024)
+# Seconds a signed blob URL handed out with file metadata stays valid
+FILE_VERSIONS_BLOB_URL_MAX_AGE = env.int("FILE_VERSIONS_BLOB_URL_MAX_AGE", default=300)
+# HMAC keys for signed blob URLs, by key id (e.g. "2024a=secret,2024b=secret"). New URLs are signed
+# with FILE_VERSIONS_URL_SIGNING_KEY_ID; keep retired ids until their URLs have expired.
+# Defaults to SECRET_KEY under the "default" id.
+FILE_VERSIONS_URL_SIGNING_KEYS = env.dict("FILE_VERSIONS_URL_SIGNING_KEYS", default={})
+FILE_VERSIONS_URL_SIGNING_KEY_ID = env("FILE_VERSIONS_URL_SIGNING_KEY_ID", default="default")
+# Bump to revoke every outstanding signed URL at once
+FILE_VERSIONS_URL_SIGNING_EPOCH = env.int("FILE_VERSIONS_URL_SIGNING_EPOCH", default=0)
+# How file bytes are delivered: "stream" (by Django), "x-accel-redirect" (nginx) or "x-sendfile" (Apache, lighttpd)
+FILE_VERSIONS_DELIVERY_MODE = env("FILE_VERSIONS_DELIVERY_MODE", default="stream")
+# Internal nginx location aliased to the blob directory, used in x-accel-redirect mode
+FILE_VERSIONS_X_ACCEL_REDIRECT_LOCATION = env("FILE_VERSIONS_X_ACCEL_REDIRECT_LOCATION", default="/internal/blobs/")
+# Per-process LRU of small blobs, keyed by content hash: byte budget (0 disables it) and largest blob admitted
+FILE_VERSIONS_BLOB_CACHE_SIZE = env.int("FILE_VERSIONS_BLOB_CACHE_SIZE", default=64 * 1024 * 1024)
+FILE_VERSIONS_BLOB_CACHE_MAX_ITEM_SIZE = env.int("FILE_VERSIONS_BLOB_CACHE_MAX_ITEM_SIZE", default=256 * 1024)
+# Optional entry of CACHES (e.g. Redis) shared by all workers behind the per-process blob cache
+FILE_VERSIONS_BLOB_CACHE_ALIAS = env("FILE_VERSIONS_BLOB_CACHE_ALIAS", default=None)
+# Seconds a resolved (user, file_url, revision) lookup is cached, for the latest and for pinned revisions.
+# Entries are dropped on upload or permission change regardless.
+FILE_VERSIONS_RESOLUTION_CACHE_TTL = env.int("FILE_VERSIONS_RESOLUTION_CACHE_TTL", default=300)
+FILE_VERSIONS_RESOLUTION_CACHE_PINNED_TTL = env.int("FILE_VERSIONS_RESOLUTION_CACHE_PINNED_TTL", default=7 * 24 * 3600)
+# Seconds an API token and its user are cached in the default cache, and in each process
+FILE_VERSIONS_TOKEN_CACHE_TTL = env.int("FILE_VERSIONS_TOKEN_CACHE_TTL", default=60)
+FILE_VERSIONS_TOKEN_LOCAL_CACHE_TTL = env.int("FILE_VERSIONS_TOKEN_LOCAL_CACHE_TTL", default=5)
+# Route retrieve and upload to the native async views, on by default under the ASGI entry point
+FILE_VERSIONS_ASYNC_VIEWS = env.bool("FILE_VERSIONS_ASYNC_VIEWS", default=False)
+# Database aliases that resolution and listing reads are spread over, when not pinned to the primary
+FILE_VERSIONS_REPLICA_DATABASES = [alias for alias in DATABASES if alias.startswith("replica")]
+# Seconds a user's reads stay on the primary after they write, so they read their own writes despite replica lag
+FILE_VERSIONS_REPLICA_PIN_SECONDS = env.int("FILE_VERSIONS_REPLICA_PIN_SECONDS", default=10)
+# Bearer token required to scrape /metrics; empty turns the endpoint off
+FILE_VERSIONS_METRICS_TOKEN = env("FILE_VERSIONS_METRICS_TOKEN", default="")
+# Let staff users profile a request with an "X-Profile: 1" header
+FILE_VERSIONS_PROFILING = env.bool("FILE_VERSIONS_PROFILING", default=False)
+# Share of requests to the file versions views profiled at random, 0 disables sampling
+FILE_VERSIONS_PROFILE_SAMPLE_RATE = env.float("FILE_VERSIONS_PROFILE_SAMPLE_RATE", default=0.0)
+# Directory keeping the newest FILE_VERSIONS_PROFILE_LIMIT profiles, relative to the working directory
+FILE_VERSIONS_PROFILE_DIR = env("FILE_VERSIONS_PROFILE_DIR", default="profiles")
+FILE_VERSIONS_PROFILE_LIMIT = env.int("FILE_VERSIONS_PROFILE_LIMIT", default=100)
+# Where audit events of document reads, uploads and permission changes go: "database", "file" or "" (off)
+FILE_VERSIONS_AUDIT_BACKEND = env("FILE_VERSIONS_AUDIT_BACKEND", default="database")
+# "async" buffers events and writes them in the background, "sync" writes each one before the request goes on
+FILE_VERSIONS_AUDIT_DURABILITY = env("FILE_VERSIONS_AUDIT_DURABILITY", default="async")
+# Buffered events are written once this many are pending, or after this many seconds
+FILE_VERSIONS_AUDIT_BATCH_SIZE = env.int("FILE_VERSIONS_AUDIT_BATCH_SIZE", default=500)
+FILE_VERSIONS_AUDIT_FLUSH_SECONDS = env.float("FILE_VERSIONS_AUDIT_FLUSH_SECONDS", default=1.0)
+# JSON lines file of the "file" backend, relative to the working directory
+FILE_VERSIONS_AUDIT_FILE = env("FILE_VERSIONS_AUDIT_FILE", default="audit.log")
+# Physical (deduplicated) bytes each user may store, unless set per user; unset means unlimited
+FILE_VERSIONS_STORAGE_QUOTA = env.int("FILE_VERSIONS_STORAGE_QUOTA", default=None)
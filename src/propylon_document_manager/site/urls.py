@@ -3,7 +3,15 @@ from django.urls import include, path, re_path
 
 from rest_framework.authtoken.views import obtain_auth_token
 
-from propylon_document_manager.file_versions.api.views import FileVersionRetrieveView
+from propylon_document_manager.file_versions.api.async_views import file_versions_root, retrieve_file_version
+from propylon_document_manager.file_versions.api.views import (
+    BlobView,
+    FileVersionHistoryView,
+    FileVersionRetrieveView,
+)
+from propylon_document_manager.file_versions.metrics import metrics_view
+
+FILE_URL_PATTERN = r"(?P<file_url>[^/].*[^/]+\.[a-zA-Z0-9]+)"
 
 # API URLS
 urlpatterns = [
@@ -12,9 +20,21 @@ urlpatterns = [
     # DRF auth token
     path("api-auth/", include("rest_framework.urls")),
     path("auth-token/", obtain_auth_token),
-    re_path(r"^api/file_versions/(?P<file_url>[^/].*[^/]+\.[a-zA-Z0-9]+$)", FileVersionRetrieveView.as_view()),
+    path("metrics", metrics_view),
+    re_path(r"^api/blobs/(?P<file_hash>[0-9a-f]{64})$", BlobView.as_view()),
+    re_path(rf"^api/file_versions/{FILE_URL_PATTERN}/history$", FileVersionHistoryView.as_view()),
+    re_path(rf"^api/file_versions/{FILE_URL_PATTERN}$", FileVersionRetrieveView.as_view()),
+]
+
+# Native async retrieve and upload, routed ahead of the DRF views in ASGI deployments
+async_urlpatterns = [
+    path("api/file_versions/", file_versions_root),
+    re_path(rf"^api/file_versions/{FILE_URL_PATTERN}$", retrieve_file_version),
 ]
 
+if settings.FILE_VERSIONS_ASYNC_VIEWS:
+    urlpatterns = async_urlpatterns + urlpatterns
+
 if settings.DEBUG:
     if "debug_toolbar" in settings.INSTALLED_APPS:
         import debug_toolbar
@@ -0,0 +1,13 @@
+"""
+WSGI entry point. Serve it with a server that provides wsgi.file_wrapper (gunicorn, uWSGI) so
+blobs are sent with os.sendfile.
+
+    gunicorn propylon_document_manager.site.wsgi:application
+"""
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "propylon_document_manager.site.settings.production")
+
+application = get_wsgi_application()
@@ -0,0 +1,3 @@
+from propylon_document_manager.site.urls import async_urlpatterns, urlpatterns
+
+urlpatterns = async_urlpatterns + urlpatterns
@@ -0,0 +1,109 @@
+"""
+pytest-benchmark suite for the upload, retrieve and permission hot paths.
+
+    make benchmark
+
+The file does not match the test file patterns, so it only runs when named on the command
+line. Each benchmark runs against every ``--dataset-size`` given (100 by default). ``make
+benchmark`` compares the results with the baseline stored under tests/benchmarks/baseline and
+fails on a regression; ``make benchmark-baseline`` stores a new baseline.
+"""
+import itertools
+
+import pytest
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework import status
+
+from propylon_document_manager.file_versions.api.views import FileVersionViewSet, get_directories
+from propylon_document_manager.file_versions.models import FileVersion, User
+
+from ..conftest import client_for
+from .conftest import DOCUMENT_URL, DOCUMENT_VERSIONS, SHARED_DOCUMENT_URL
+
+pytest.importorskip("pytest_benchmark")
+
+UPLOAD_SIZES = {"small": 1024, "large": 8 * 1024 * 1024}
+PERMISSION_LIST_SIZES = [10, 100, 1000]
+
+
+@pytest.mark.parametrize("upload", ["small", "large", "dedup-hit"])
+def test_create(benchmark, dataset, upload):
+    client = client_for(dataset["owner"])
+    counter = itertools.count()
+
+    def setup():
+        if upload == "dedup-hit":
+            content = b"x" * UPLOAD_SIZES["small"]
+        else:
+            # A new content on each round, so every round stores a new version and blob
+            content = str(next(counter)).encode().ljust(UPLOAD_SIZES[upload], b"x")
+        return (), {"file_url": DOCUMENT_URL, "file": SimpleUploadedFile("target.txt", content)}
+
+    def create(**data):
+        response = client.post("/api/file_versions/", data)
+        assert response.status_code == status.HTTP_201_CREATED
+
+    if upload == "dedup-hit":
+        create(**setup()[1])
+
+    benchmark.pedantic(create, setup=setup, rounds=5 if upload == "large" else 50)
+
+
+@pytest.mark.parametrize("resolution_cache", ["cold", "warm"])
+@pytest.mark.parametrize(
+    "document, params",
+    [
+        (DOCUMENT_URL, {}),
+        (SHARED_DOCUMENT_URL, {}),
+        (DOCUMENT_URL, {"revision": 0}),
+    ],
+    ids=["owner", "shared", "pinned-revision"],
+)
+def test_retrieve(benchmark, dataset, document, params, resolution_cache):
+    client = client_for(dataset["owner"])
+
+    def setup():
+        if resolution_cache == "cold":
+            cache.clear()
+
+    def retrieve():
+        response = client.get(f"/api/file_versions/{document}", params)
+        assert response.status_code == status.HTTP_200_OK
+        b"".join(response.streaming_content)
+
+    retrieve()
+    benchmark.pedantic(retrieve, setup=setup, rounds=200)
+
+
+@pytest.mark.parametrize("permission_list_size", PERMISSION_LIST_SIZES)
+def test_partial_update(benchmark, dataset, permission_list_size):
+    users = dataset["users"][:permission_list_size]
+    # Lists larger than the dataset are filled with users of no documents
+    users += User.objects.bulk_create(
+        User(email=f"grantee{number}@example.com", name=f"Grantee {number}")
+        for number in range(permission_list_size - len(users))
+    )
+
+    client = client_for(dataset["owner"])
+    file_version = FileVersion.objects.get(file_url=DOCUMENT_URL, version_number=DOCUMENT_VERSIONS - 1)
+    emails = [user.email for user in users]
+
+    def partial_update():
+        response = client.patch(
+            f"/api/file_versions/{file_version.id}/",
+            {"read_permissions": emails, "write_permissions": emails},
+            format="json",
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+    benchmark.pedantic(partial_update, rounds=10)
+
+
+@pytest.mark.parametrize("file_url", ["a.txt", "/docs/reports/2024/q1/summary.pdf"])
+def test_validate_file_url(benchmark, file_url):
+    benchmark(FileVersionViewSet.validate_file_url, file_url)
+
+
+def test_get_directories(benchmark):
+    benchmark(get_directories, "docs/reports/2024/q1/summary.pdf")
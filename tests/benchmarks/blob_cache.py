@@ -0,0 +1,81 @@
+"""
+Latency of serving blobs with and without the in-process blob cache.
+
+    python -m tests.benchmarks.blob_cache --blobs 2000 --requests 50000
+
+Requests follow a Zipf distribution over the blobs, like a few templates and statutes taking
+most of the reads, and each response is built by blob_response and fully consumed. Reports
+p50/p99 per configuration along with the cache counters. The OS page cache already holds the
+blobs on a warm machine, so the difference is the open/stat/read work saved per request.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from hashlib import sha256
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+django.setup()
+
+from django.test import override_settings  # noqa: E402
+
+from propylon_document_manager.file_versions.blob_cache import get_blob_cache  # noqa: E402
+from propylon_document_manager.file_versions.blobs import blob_response  # noqa: E402
+
+
+def create_blobs(directory, count, max_size, rng):
+    blobs = []
+    for _ in range(count):
+        content = rng.randbytes(rng.randint(512, max_size))
+        file_hash = sha256(content).hexdigest()
+        path = os.path.join(directory, file_hash)
+        with open(path, "wb") as f:
+            f.write(content)
+        blobs.append((file_hash, path))
+    return blobs
+
+
+def measure(blobs, requests, zipf_s, rng):
+    weights = [1 / rank**zipf_s for rank in range(1, len(blobs) + 1)]
+    timings = []
+    for file_hash, path in rng.choices(blobs, weights=weights, k=requests):
+        started = time.perf_counter()
+        response = blob_response(file_hash, path, "application/octet-stream")
+        b"".join(response.streaming_content)
+        response.close()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--blobs", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--max-blob-kb", type=int, default=128, help="Blob sizes are uniform up to this size")
+    parser.add_argument("--cache-mb", type=int, nargs="+", default=[0, 16, 64], help="Cache budgets, 0 disables")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Skew of the access distribution")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        blobs = create_blobs(directory, args.blobs, args.max_blob_kb * 1024, random.Random(args.seed))
+
+        print(f"{'cache MB':>8} {'p50 us':>8} {'p99 us':>8} {'hits':>8} {'misses':>8} {'evictions':>9}")
+        for cache_mb in args.cache_mb:
+            with override_settings(FILE_VERSIONS_BLOB_CACHE_SIZE=cache_mb * 1024 * 1024):
+                get_blob_cache.cache_clear()
+                timings = measure(blobs, args.requests, args.zipf, random.Random(args.seed))
+                stats = get_blob_cache().stats()
+            percentiles = statistics.quantiles(timings, n=100)
+            print(
+                f"{cache_mb:>8} {percentiles[49] * 1e6:>8.1f} {percentiles[98] * 1e6:>8.1f} "
+                f"{stats['hits']:>8} {stats['misses']:>8} {stats['evictions']:>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Throughput of the ways a blob can be written to a client socket.
+
+    python -m tests.benchmarks.blob_delivery --size-mb 256 --clients 1 8 32
+
+Compares the three paths the blob views can take:
+
+* ``read``: read() into a Python buffer and sendall() it, what Django does without a file wrapper
+* ``sendfile``: os.sendfile() from the page cache, what wsgi.file_wrapper does under gunicorn/uWSGI
+* ``mmap``: sendall() slices of a memory map, the path used for Range responses
+
+Every client downloads the whole file over loopback TCP at the same time, and the aggregate
+throughput is reported. Run it against a file on the disk that actually holds the media directory.
+"""
+import argparse
+import mmap
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from propylon_document_manager.file_versions.blobs import BLOB_CHUNK_SIZE, MMAP_CHUNK_SIZE
+
+
+def send_read(conn, path, size):
+    with open(path, "rb") as f:
+        while chunk := f.read(BLOB_CHUNK_SIZE):
+            conn.sendall(chunk)
+
+
+def send_sendfile(conn, path, size):
+    with open(path, "rb") as f:
+        offset = 0
+        while offset < size:
+            offset += os.sendfile(conn.fileno(), f.fileno(), offset, size - offset)
+
+
+def send_mmap(conn, path, size):
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for offset in range(0, size, MMAP_CHUNK_SIZE):
+            conn.sendall(mapped[offset : offset + MMAP_CHUNK_SIZE])
+
+
+STRATEGIES = {"read": send_read, "sendfile": send_sendfile, "mmap": send_mmap}
+
+
+def receive(port, size):
+    received = 0
+    with socket.create_connection(("127.0.0.1", port)) as conn:
+        while data := conn.recv(1024 * 1024):
+            received += len(data)
+    if received != size:
+        raise RuntimeError(f"Received {received} of {size} bytes")
+
+
+def run(strategy, path, clients):
+    """Serves the file to ``clients`` concurrent downloads and returns the elapsed seconds."""
+    size = os.path.getsize(path)
+    send = STRATEGIES[strategy]
+
+    with socket.create_server(("127.0.0.1", 0), backlog=clients) as server:
+        port = server.getsockname()[1]
+
+        def serve():
+            with ThreadPoolExecutor(clients) as pool:
+                for _ in range(clients):
+                    conn, _ = server.accept()
+                    pool.submit(lambda conn=conn: (send(conn, path, size), conn.close()))
+
+        server_thread = threading.Thread(target=serve)
+        started = time.perf_counter()
+        server_thread.start()
+        with ThreadPoolExecutor(clients) as pool:
+            list(pool.map(lambda _: receive(port, size), range(clients)))
+        elapsed = time.perf_counter() - started
+        server_thread.join()
+
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--file", help="Existing file to serve, a random one is generated otherwise")
+    parser.add_argument("--size-mb", type=int, default=64, help="Size of the generated file")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32], help="Concurrent downloads")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the best one is reported")
+    parser.add_argument("--strategies", nargs="+", choices=STRATEGIES, default=list(STRATEGIES))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.file
+        if path is None:
+            path = os.path.join(directory, "blob")
+            with open(path, "wb") as f:
+                for _ in range(args.size_mb):
+                    f.write(os.urandom(1024 * 1024))
+
+        size = os.path.getsize(path)
+        print(f"{'strategy':<10} {'clients':>7} {'seconds':>9} {'MB/s':>9}")
+        for clients in args.clients:
+            for strategy in args.strategies:
+                elapsed = min(run(strategy, path, clients) for _ in range(args.repeat))
+                throughput = size * clients / elapsed / (1024 * 1024)
+                print(f"{strategy:<10} {clients:>7} {elapsed:>9.3f} {throughput:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
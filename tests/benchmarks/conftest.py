@@ -0,0 +1,79 @@
+import pytest
+from django.utils import timezone
+
+from propylon_document_manager.file_versions.folders import rebuild_folder_index
+from propylon_document_manager.file_versions.models import FileVersion, User
+
+DOCUMENT_URL = "docs/target.txt"
+SHARED_DOCUMENT_URL = "shared/target.txt"
+DOCUMENT_VERSIONS = 3
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--dataset-size",
+        action="append",
+        type=int,
+        dest="dataset_sizes",
+        help="Users and documents per owner in the benchmark dataset; repeat to benchmark several sizes (default 100)",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "dataset_size" in metafunc.fixturenames:
+        metafunc.parametrize("dataset_size", metafunc.config.getoption("dataset_sizes") or [100])
+
+
+def blob_hash(owner, number):
+    return f"{owner:032d}{number:032d}"
+
+
+@pytest.fixture
+def dataset(dataset_size, media):
+    """
+    ``dataset_size`` users. The first one owns ``dataset_size`` documents, the others one each, all
+    of two versions. On top, the owner has a document of DOCUMENT_VERSIONS versions and another
+    user has one that is shared with the owner. Only the blobs of those two documents are on disk.
+    """
+    users = User.objects.bulk_create(
+        [User(email=f"user{number}@example.com", name=f"User {number}") for number in range(max(dataset_size, 2))]
+    )
+    owner, other = users[0], users[1]
+    documents = [(owner, document) for document in range(dataset_size)] + [(user, 0) for user in users[1:]]
+
+    now = timezone.now()
+    versions = [
+        FileVersion(
+            file_name=f"{document:05d}.txt",
+            file_url=f"docs/{document:05d}.txt",
+            version_number=number,
+            file_hash=blob_hash(user.id, document * 2 + number),
+            file_size=1024,
+            is_latest=number == 1,
+            created_at=now,
+            user=user,
+        )
+        for user, document in documents
+        for number in range(2)
+    ]
+    for file_url, user in [(DOCUMENT_URL, owner), (SHARED_DOCUMENT_URL, other)]:
+        for number in range(DOCUMENT_VERSIONS):
+            file_hash = blob_hash(user.id, 10**9 + number)
+            (media / file_hash).write_bytes(f"{file_url} {number}".encode() * 64)
+            versions.append(
+                FileVersion(
+                    file_name="target.txt",
+                    file_url=file_url,
+                    version_number=number,
+                    file_hash=file_hash,
+                    file_size=len(file_url) * 64,
+                    is_latest=number == DOCUMENT_VERSIONS - 1,
+                    created_at=now,
+                    user=user,
+                )
+            )
+    FileVersion.objects.bulk_create(versions, batch_size=5000)
+    FileVersion.objects.get(file_url=SHARED_DOCUMENT_URL, is_latest=True).read_permissions.add(owner)
+    rebuild_folder_index()
+
+    return {"owner": owner, "users": users}
@@ -0,0 +1,249 @@
+"""
+End-to-end load test with a mix of uploads, downloads, range reads and permission updates.
+
+    python -m tests.benchmarks.load --server asgi --clients 64 --duration 30 --mix latest=60,range=30,upload=10
+
+Generates a dataset with generate_dataset in a temp directory and starts the project under
+uvicorn with the native async views, or under a threaded WSGI server (see slow_downloads). The
+mix is then driven by ``--clients`` threads, each with its own keep-alive connection. The
+report has, for each operation, the throughput, p50/p95/p99 latency, the error rate and the
+mean number of database queries the server made for it. Query counts come from the
+X-Query-Count header that the benchmark settings add to every response.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import django
+
+from .slow_downloads import ENVIRONMENT, percentile, start_server
+
+OPERATIONS = ("latest", "pinned", "range", "upload", "permissions")
+DEFAULT_MIX = "latest=50,pinned=20,range=15,upload=10,permissions=5"
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(","):
+        operation, _, weight = item.partition("=")
+        if operation not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {operation}, expected one of {', '.join(OPERATIONS)}")
+        mix[operation] = float(weight or 1)
+    return mix
+
+
+def prepare(directory, args):
+    """
+    Migrates a database in ``directory``, generates the dataset with its blobs and gives every
+    user a token. Returns the documents the clients work on.
+    """
+    os.chdir(directory)
+    os.environ["DJANGO_SETTINGS_MODULE"] = ENVIRONMENT["DJANGO_SETTINGS_MODULE"]
+    django.setup()
+
+    from django.core.management import call_command
+    from rest_framework.authtoken.models import Token
+
+    from propylon_document_manager.file_versions import signing
+    from propylon_document_manager.file_versions.models import FileVersion, User
+
+    call_command("migrate", verbosity=0)
+    call_command(
+        "generate_dataset",
+        users=args.users,
+        documents_per_user=args.documents_per_user,
+        median_blob_size=args.median_blob_size,
+        seed=args.seed,
+        verbosity=0,
+    )
+    users = list(User.objects.all())
+    tokens = Token.objects.bulk_create(Token(user=user, key=Token.generate_key()) for user in users)
+    tokens = {token.user_id: token.key for token in tokens}
+    emails = [user.email for user in users]
+
+    documents = []
+    latest_versions = FileVersion.objects.filter(is_latest=True).values_list(
+        "id", "user_id", "file_url", "file_hash", "file_size"
+    )
+    for version_id, user_id, file_url, file_hash, file_size in latest_versions:
+        # Range URLs are signed for the whole run; clients pick the range with a Range header
+        query = signing.sign(file_hash, user_id, max_age=int(args.duration) + 3600)
+        documents.append(
+            {
+                "id": version_id,
+                "token": tokens[user_id],
+                "file_url": file_url,
+                "blob_url": f"/api/blobs/{file_hash}?{query}",
+                "size": file_size,
+            }
+        )
+
+    return documents, emails
+
+
+def multipart(fields, file_name, content):
+    boundary = uuid.uuid4().hex
+    body = "".join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n' for name, value in fields
+    ).encode()
+    body += (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{file_name}"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    body += content + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def build_request(operation, document, rng, emails, args):
+    """Returns (method, path, body, headers, expected statuses) for an operation on a document."""
+    headers = {"Authorization": f"Token {document['token']}"}
+
+    if operation == "latest":
+        return "GET", f"/api/file_versions/{document['file_url']}", None, headers, {200}
+    if operation == "pinned":
+        return "GET", f"/api/file_versions/{document['file_url']}?revision=0", None, headers, {200}
+    if operation == "range":
+        start = rng.randrange(document["size"])
+        end = min(document["size"], start + args.range_size) - 1
+        return "GET", document["blob_url"], None, {"Range": f"bytes={start}-{end}"}, {206}
+    if operation == "upload":
+        content = rng.randbytes(args.upload_size)
+        body, content_type = multipart([("file_url", document["file_url"])], "upload.bin", content)
+        return "POST", "/api/file_versions/", body, {**headers, "Content-Type": content_type}, {201}
+
+    body = json.dumps({"read_permissions": rng.sample(emails, min(args.share_size, len(emails)))}).encode()
+    headers["Content-Type"] = "application/json"
+    return "PATCH", f"/api/file_versions/{document['id']}/", body, headers, {200}
+
+
+def client(port, mix, documents, emails, deadline, seed, args, results):
+    """Sends requests over one keep-alive connection until the deadline and records (seconds, ok, queries)."""
+    rng = random.Random(seed)
+    operations, weights = list(mix), list(mix.values())
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    while time.monotonic() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        document = rng.choice(documents)
+        method, path, body, headers, expected = build_request(operation, document, rng, emails, args)
+        started = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if operation == "range" and response.status == 403:
+                # Permission updates revoke the owner's signed URLs; like a real client, get a new one and
+                # retry. The sample times all three requests, so revocations show in the latencies.
+                refresh_blob_url(connection, document)
+                connection.request(method, document["blob_url"], body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            ok = response.status in expected
+            queries = response.getheader("X-Query-Count")
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            ok, queries = False, None
+        results[operation].append((time.perf_counter() - started, ok, int(queries) if queries else None))
+    connection.close()
+
+
+def refresh_blob_url(connection, document):
+    connection.request(
+        "GET", f"/api/file_versions/{document['id']}/download_url/", headers={"Authorization": f"Token {document['token']}"}
+    )
+    response = connection.getresponse()
+    url = urlsplit(json.loads(response.read())["url"])
+    document["blob_url"] = f"{url.path}?{url.query}"
+
+
+def report(results, elapsed):
+    rows = []
+    for operation in OPERATIONS:
+        if not results.get(operation):
+            continue
+        samples = results[operation]
+        latencies = [seconds for seconds, ok, _ in samples if ok]
+        queries = [count for _, _, count in samples if count is not None]
+        rows.append(
+            {
+                "operation": operation,
+                "requests": len(samples),
+                "throughput": len(samples) / elapsed,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "error_rate": 1 - len(latencies) / len(samples),
+                "queries": sum(queries) / len(queries) if queries else float("nan"),
+            }
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--server", choices=["wsgi", "asgi"], default="asgi")
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent clients, each with its own connection")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of load")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help=f"Operation weights ({DEFAULT_MIX})")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--documents-per-user", type=int, default=20)
+    parser.add_argument("--median-blob-size", type=int, default=16 * 1024)
+    parser.add_argument("--upload-size", type=int, default=16 * 1024, help="Bytes per upload")
+    parser.add_argument("--range-size", type=int, default=4096, help="Bytes per range read")
+    parser.add_argument("--share-size", type=int, default=10, help="Users per permission update")
+    parser.add_argument("--workers", type=int, default=1, help="Server processes")
+    parser.add_argument("--threads", type=int, default=32, help="Threads per WSGI worker")
+    parser.add_argument("--port", type=int, default=18101)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", type=os.path.abspath, help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        documents, emails = prepare(directory, args)
+        process = start_server(args.server, directory, args.port, args)
+        results = {operation: [] for operation in args.mix}
+        try:
+            deadline = time.monotonic() + args.duration
+            started = time.monotonic()
+            clients = [
+                threading.Thread(
+                    target=client,
+                    args=(args.port, args.mix, documents, emails, deadline, args.seed + number, args, results),
+                )
+                for number in range(args.clients)
+            ]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            elapsed = time.monotonic() - started
+        finally:
+            process.terminate()
+            process.wait()
+
+    rows = report(results, elapsed)
+    print(
+        f"{'operation':<12} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'errors':>7} {'queries':>8}"
+    )
+    for row in rows:
+        print(
+            f"{row['operation']:<12} {row['requests']:>9} {row['throughput']:>8.1f} {row['p50_ms']:>8.1f} "
+            f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['error_rate']:>7.1%} {row['queries']:>8.1f}"
+        )
+    total = sum(row["requests"] for row in rows)
+    print(f"{'total':<12} {total:>9} {total / elapsed:>8.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"server": args.server, "clients": args.clients, "duration": elapsed, "operations": rows}, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Middleware reporting the number of database queries a request made in an X-Query-Count header.
+
+The count is the one metrics_middleware records for the request (see metrics.py), so this
+middleware must come after it. Queries made by middleware above this one are not included.
+"""
+from asgiref.sync import iscoroutinefunction
+from django.utils.decorators import sync_and_async_middleware
+
+from propylon_document_manager.file_versions.metrics import request_queries
+
+
+def query_count():
+    totals = request_queries()
+    if totals is None:
+        raise RuntimeError("query_count_middleware must come after metrics_middleware")
+    return totals[0]
+
+
+@sync_and_async_middleware
+def query_count_middleware(get_response):
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            response = await get_response(request)
+            response["X-Query-Count"] = query_count()
+            return response
+
+    else:
+
+        def middleware(request):
+            response = get_response(request)
+            response["X-Query-Count"] = query_count()
+            return response
+
+    return middleware
@@ -0,0 +1,23 @@
+"""Settings for benchmarks that run the project under real servers."""
+
+import django
+
+from tests.settings import *  # noqa
+
+ALLOWED_HOSTS = ["localhost", "127.0.0.1", "testserver"]
+
+# Reports the queries metrics_middleware counts, so it must come right after it
+MIDDLEWARE = list(MIDDLEWARE)  # noqa: F405
+MIDDLEWARE.insert(
+    MIDDLEWARE.index("propylon_document_manager.file_versions.middleware.metrics_middleware") + 1,
+    "tests.benchmarks.query_count.query_count_middleware",
+)
+
+# Concurrent writers queue for SQLite's write lock. In the default deferred mode, a transaction
+# that read before writing fails at once with "database is locked" when another one writes.
+DATABASES["default"]["OPTIONS"] = {"timeout": 30}  # noqa: F405
+if django.VERSION >= (5, 1):
+    DATABASES["default"]["OPTIONS"]["transaction_mode"] = "IMMEDIATE"  # noqa: F405
+
+# As in production, audit events are written in the background rather than by each request
+FILE_VERSIONS_AUDIT_BACKEND = "database"
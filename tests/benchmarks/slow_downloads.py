@@ -0,0 +1,224 @@
+"""
+WSGI vs ASGI under many concurrent slow downloads.
+
+    python -m tests.benchmarks.slow_downloads --clients 2000 --size-kb 8192 --rate-kb 1024
+
+Sets up a throwaway database and blob in a temp directory, then starts the project under a
+threaded WSGI server (gunicorn gthread if installed, otherwise a wsgiref server with a fixed
+thread pool, the same model) and under uvicorn with the native async views. Against each
+server, ``--clients`` clients download a blob while reading it at ``--rate-kb`` KB/s. Small
+probe requests are sent at the same time. Reports how the slow downloads fared and the
+latency of the probes, which shows whether slow clients starve everyone else.
+
+The blob must be larger than the kernel's maximum socket send buffer (the last value of
+net.ipv4.tcp_wmem, often 4 MiB). Otherwise the server hands the whole response to the kernel
+at once, and no server is held up by a slow reader.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ENVIRONMENT = {
+    **os.environ,
+    "PYTHONPATH": os.pathsep.join([REPO_ROOT, os.path.join(REPO_ROOT, "src")]),
+    "DJANGO_SETTINGS_MODULE": "tests.benchmarks.settings",
+}
+
+
+class PooledWSGIServer(ThreadingMixIn, WSGIServer):
+    """wsgiref server handling requests on a fixed pool of threads, like a gunicorn gthread worker."""
+
+    request_queue_size = 4096
+
+    def __init__(self, *args, threads, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = ThreadPoolExecutor(threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve_wsgi(port, threads):
+    from propylon_document_manager.site.wsgi import application
+
+    server = make_server(
+        "127.0.0.1",
+        port,
+        application,
+        server_class=lambda *args, **kwargs: PooledWSGIServer(*args, threads=threads, **kwargs),
+        handler_class=QuietHandler,
+    )
+    server.serve_forever()
+
+
+def prepare(directory, size):
+    """Creates the database, a user with a token and two documents: a large one and a small probe."""
+    subprocess.run(
+        [sys.executable, "-m", "django", "migrate", "-v", "0"], cwd=directory, env=ENVIRONMENT, check=True
+    )
+    script = f"""
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from tests.factories import UserFactory
+
+user = UserFactory()
+client = APIClient()
+client.force_authenticate(user)
+for file_url, content in [("large.bin", b"x" * {size}), ("probe.txt", b"probe")]:
+    response = client.post("/api/file_versions/", {{"file_url": file_url, "file": SimpleUploadedFile(file_url, content)}})
+    assert response.status_code == 201, response.content
+print(Token.objects.create(user=user).key)
+"""
+    result = subprocess.run(
+        [sys.executable, "-m", "django", "shell", "-c", script],
+        cwd=directory,
+        env=ENVIRONMENT,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip().splitlines()[-1]
+
+
+def start_server(kind, directory, port, args):
+    if kind == "asgi":
+        command = [
+            sys.executable, "-m", "uvicorn", "propylon_document_manager.site.asgi:application",
+            "--port", str(port), "--workers", str(args.workers), "--lifespan", "off",
+            "--backlog", "4096", "--log-level", "warning", "--no-access-log",
+        ]  # fmt: skip
+    elif shutil.which("gunicorn"):
+        command = [
+            "gunicorn", "propylon_document_manager.site.wsgi:application", "--bind", f"127.0.0.1:{port}",
+            "--worker-class", "gthread", "--workers", str(args.workers), "--threads", str(args.threads),
+            "--backlog", "4096", "--log-level", "warning",
+        ]  # fmt: skip
+    else:
+        command = [sys.executable, "-m", "tests.benchmarks.slow_downloads", "--serve-wsgi", str(port)]
+        command += ["--threads", str(args.threads)]
+
+    process = subprocess.Popen(command, cwd=directory, env=ENVIRONMENT)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+
+    process.kill()
+    raise RuntimeError(f"{kind} server did not start")
+
+
+async def download(port, path, token, rate=None, receive_buffer=16 * 1024):
+    """Downloads a file, optionally reading it at ``rate`` bytes per second. Returns (seconds, bytes)."""
+    started = time.perf_counter()
+    sock = socket.socket()
+    # A small receive buffer makes the server feel the slow reader instead of the kernel absorbing it
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ("127.0.0.1", port))
+    reader, writer = await asyncio.open_connection(sock=sock)
+    writer.write(
+        f"GET {path} HTTP/1.1\r\nHost: localhost\r\nAuthorization: Token {token}\r\nConnection: close\r\n\r\n".encode()
+    )
+    received = 0
+    chunk_size = 4096
+    while data := await reader.read(chunk_size):
+        received += len(data)
+        if rate:
+            await asyncio.sleep(len(data) / rate)
+    writer.close()
+    return time.perf_counter() - started, received
+
+
+def succeeded(result, size):
+    # Anything shorter than the body is an error response or a dropped connection
+    return not isinstance(result, BaseException) and result[1] >= size
+
+
+async def load(port, token, args):
+    slow = [
+        asyncio.create_task(download(port, "/api/file_versions/large.bin", token, rate=args.rate_kb * 1024))
+        for _ in range(args.clients)
+    ]
+    await asyncio.sleep(1)
+
+    probes = []
+    for _ in range(args.probes):
+        try:
+            result = await asyncio.wait_for(download(port, "/api/file_versions/probe.txt", token), 60)
+        except (asyncio.TimeoutError, OSError):
+            result = None
+        probes.append(result[0] if result and succeeded(result, len(b"probe")) else float("inf"))
+        await asyncio.sleep(0.1)
+
+    results = await asyncio.gather(*slow, return_exceptions=True)
+    completed = [result[0] for result in results if succeeded(result, args.size_kb * 1024)]
+    return completed, probes
+
+
+def percentile(values, q):
+    if len(values) < 2:
+        return values[0] if values else float("nan")
+    return statistics.quantiles(values, n=100)[q - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=1000, help="Concurrent slow downloads")
+    parser.add_argument("--size-kb", type=int, default=8192, help="Size of the downloaded blob")
+    parser.add_argument("--rate-kb", type=int, default=1024, help="Read rate of each slow client, in KB/s")
+    parser.add_argument("--probes", type=int, default=20, help="Fast requests sent during the load")
+    parser.add_argument("--workers", type=int, default=1, help="Server processes")
+    parser.add_argument("--threads", type=int, default=32, help="Threads per WSGI worker")
+    parser.add_argument("--servers", nargs="+", choices=["wsgi", "asgi"], default=["wsgi", "asgi"])
+    parser.add_argument("--serve-wsgi", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_wsgi:
+        import django
+
+        django.setup()
+        serve_wsgi(args.serve_wsgi, args.threads)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        token = prepare(directory, args.size_kb * 1024)
+        print(
+            f"{'server':<6} {'completed':>10} {'download p50 s':>15} {'download p99 s':>15} "
+            f"{'probe p50 ms':>13} {'probe p99 ms':>13}"
+        )
+        for port, kind in enumerate(args.servers, start=18001):
+            process = start_server(kind, directory, port, args)
+            try:
+                completed, probes = asyncio.run(load(port, token, args))
+            finally:
+                process.terminate()
+                process.wait()
+            print(
+                f"{kind:<6} {len(completed):>5}/{args.clients:<4} {percentile(completed, 50):>15.2f} "
+                f"{percentile(completed, 99):>15.2f} {percentile(probes, 50) * 1000:>13.0f} "
+                f"{percentile(probes, 99) * 1000:>13.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
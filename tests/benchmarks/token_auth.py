@@ -0,0 +1,71 @@
+"""
+Per-request overhead of token authentication.
+
+    python -m tests.benchmarks.token_auth --requests 20000
+
+Authenticates the same token repeatedly with DRF's TokenAuthentication and with
+CachedTokenAuthentication (local tier on, and shared cache only), against a throwaway test
+database, and reports the mean time and database queries per request.
+"""
+import argparse
+import os
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment  # noqa: E402
+from rest_framework.authentication import TokenAuthentication  # noqa: E402
+from rest_framework.authtoken.models import Token  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+
+from propylon_document_manager.file_versions.api.authentication import (  # noqa: E402
+    CachedTokenAuthentication,
+    clear_local_token_cache,
+)
+from tests.factories import UserFactory  # noqa: E402
+
+CONFIGURATIONS = [
+    ("TokenAuthentication", TokenAuthentication, 0),
+    ("Cached, shared cache only", CachedTokenAuthentication, 0),
+    ("Cached, local + shared", CachedTokenAuthentication, 5),
+]
+
+
+def measure(authentication, request, requests):
+    authentication.authenticate(request)
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        for _ in range(requests):
+            authentication.authenticate(request)
+        elapsed = time.perf_counter() - started
+    return elapsed / requests, len(queries) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        token = Token.objects.create(user=UserFactory())
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Token {token.key}")
+
+        print(f"{'authentication':<28} {'us/request':>10} {'queries/request':>15}")
+        for name, authentication_class, local_ttl in CONFIGURATIONS:
+            clear_local_token_cache()
+            with override_settings(FILE_VERSIONS_TOKEN_LOCAL_CACHE_TTL=local_ttl):
+                per_request, queries = measure(authentication_class(), request, args.requests)
+            print(f"{name:<28} {per_request * 1e6:>10.1f} {queries:>15.2f}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
 from unittest import mock
 
 import pytest
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework import status
+from rest_framework.test import APIClient
 
+from propylon_document_manager.file_versions.api.authentication import clear_local_token_cache
+from propylon_document_manager.file_versions.audit import get_audit_log
+from propylon_document_manager.file_versions.blob_cache import get_blob_cache
 from propylon_document_manager.file_versions.models import User
 from .factories import UserFactory
 
@@ -13,11 +20,46 @@ def enable_db_access_for_all_tests(db):
 def media_storage(settings, tmpdir):
     settings.MEDIA_ROOT = tmpdir.strpath
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    yield
+    cache.clear()
+    get_blob_cache.cache_clear()
+    clear_local_token_cache()
+    get_audit_log.cache_clear()
+
 
 @pytest.fixture
 def user(db) -> User:
     return UserFactory()
 
+@pytest.fixture
+def media(tmp_path):
+    """Stores the blobs of the views in a temporary directory."""
+    with mock.patch("propylon_document_manager.file_versions.api.views.PATH_TO_MEDIA", [str(tmp_path)]):
+        yield tmp_path
+
+def client_for(user):
+    """An API client authenticated as ``user``."""
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+@pytest.fixture
+def api_client(user):
+    return client_for(user)
+
+@pytest.fixture
+def authenticated_client(api_client, media):
+    """An API client of ``user`` whose uploads are stored in ``media``."""
+    return api_client
+
+def upload(client, file_url, content, expected_status=status.HTTP_201_CREATED):
+    """Uploads a version of a document through the API and checks the response status."""
+    response = client.post("/api/file_versions/", {"file_url": file_url, "file": SimpleUploadedFile("a", content)})
+    assert response.status_code == expected_status
+    return response
+
 @pytest.fixture
 def patch_file_version():
     mock_file_version = mock.Mock()
@@ -29,3 +71,11 @@ def patch_file_version():
     mock_file_version.write_permissions.all.return_value = []
 
     return mock_file_version
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--update-budgets",
+        action="store_true",
+        help="Record the measured query and allocation budgets of the endpoints in tests/budgets.json",
+    )
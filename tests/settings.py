@@ -30,3 +30,19 @@ EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
 TEMPLATES[0]["OPTIONS"]["debug"] = True  # type: ignore # noqa: F405
 # Your stuff...
 # ------------------------------------------------------------------------------
+
+# DATABASES
+# ------------------------------------------------------------------------------
+# A second SQLite database for the read-replica tests. Reads are only routed to it by tests
+# that set FILE_VERSIONS_REPLICA_DATABASES.
+DATABASES["replica"] = {  # noqa: F405
+    "ENGINE": "django.db.backends.sqlite3",
+    "NAME": "propylon_document_manager_replica.sqlite",
+}
+FILE_VERSIONS_REPLICA_DATABASES = []
+
+# AUDIT
+# ------------------------------------------------------------------------------
+# Off, so query counts are those of production, where events are written in the background.
+# The audit tests turn it on.
+FILE_VERSIONS_AUDIT_BACKEND = ""
@@ -0,0 +1,111 @@
+import io
+import zipfile
+from datetime import datetime, timezone
+
+import pytest
+from rest_framework import status
+
+from propylon_document_manager.file_versions.archives import archive_name, stream_zip
+from propylon_document_manager.file_versions.models import FileVersion
+
+from .factories import UserFactory
+
+
+@pytest.fixture
+def store(media):
+    def _store(user, file_url, version_number, content, day=1):
+        file_hash = f"{file_url}-{user.id}-{version_number}".replace("/", "_")
+        (media / file_hash).write_bytes(content)
+        FileVersion.objects.filter(user=user, file_url=file_url).update(is_latest=False)
+        return FileVersion.objects.create(
+            user=user,
+            file_url=file_url,
+            file_name=file_url.split("/")[-1],
+            version_number=version_number,
+            file_hash=file_hash,
+            file_size=len(content),
+            created_at=datetime(2024, 1, day, tzinfo=timezone.utc),
+        )
+
+    return _store
+
+
+def _archive(response):
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"] == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+    return {name: archive.read(name) for name in archive.namelist()}
+
+
+def test_stream_zip_yields_bounded_chunks(tmp_path):
+    """Tests that a large blob is streamed in chunks rather than buffered whole"""
+    blob = tmp_path / "blob"
+    blob.write_bytes(b"x" * 1024 * 1024)
+    modified = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    chunks = list(stream_zip([("a/b.bin", str(blob), modified)], chunk_size=16 * 1024))
+
+    assert max(len(chunk) for chunk in chunks) < 17 * 1024
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.testzip() is None
+    assert archive.read("a/b.bin") == b"x" * 1024 * 1024
+
+
+def test_stream_zip_skips_missing_blobs(tmp_path):
+    """Tests that entries whose blob is missing are left out of the archive"""
+    modified = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(stream_zip([("a.txt", str(tmp_path / "missing"), modified)]))))
+
+    assert archive.namelist() == []
+
+
+def test_archive_name():
+    """Tests the download name of an archive"""
+    assert archive_name("matters/acme/") == "acme.zip"
+    assert archive_name("") == "documents.zip"
+
+
+def test_archive_latest_versions_under_prefix(api_client, user, store):
+    """Tests that the archive holds the latest version of each document under the prefix"""
+    store(user, "matters/a.txt", 0, b"a0")
+    store(user, "matters/a.txt", 1, b"a1")
+    store(user, "matters/sub/b.txt", 0, b"b0")
+    store(user, "other/c.txt", 0, b"c0")
+
+    response = api_client.get("/api/file_versions/archive/", {"prefix": "matters/"})
+
+    assert _archive(response) == {"matters/a.txt": b"a1", "matters/sub/b.txt": b"b0"}
+    assert response["Content-Disposition"] == 'attachment; filename="matters.zip"'
+
+
+def test_archive_respects_permissions(api_client, user, store):
+    """Tests that only documents the user may read are archived, own copies first"""
+    other = UserFactory()
+    store(user, "matters/a.txt", 0, b"mine")
+    store(other, "matters/a.txt", 0, b"theirs").read_permissions.add(user)
+    store(other, "matters/shared.txt", 0, b"shared").read_permissions.add(user)
+    store(other, "matters/private.txt", 0, b"private")
+
+    response = api_client.get("/api/file_versions/archive/", {"prefix": "matters/"})
+
+    assert _archive(response) == {"matters/a.txt": b"mine", "matters/shared.txt": b"shared"}
+
+
+def test_archive_as_of_and_all_revisions(api_client, user, store):
+    """Tests the as_of and revisions=all policies"""
+    store(user, "matters/a.txt", 0, b"a0", day=1)
+    store(user, "matters/a.txt", 1, b"a1", day=10)
+
+    response = api_client.get("/api/file_versions/archive/", {"prefix": "matters/", "as_of": "2024-01-05"})
+    assert _archive(response) == {"matters/a.txt": b"a0"}
+
+    response = api_client.get("/api/file_versions/archive/", {"prefix": "matters/", "revisions": "all"})
+    assert _archive(response) == {"matters/a.v1.txt": b"a1", "matters/a.v0.txt": b"a0"}
+
+
+def test_archive_invalid_revisions(api_client):
+    """Tests that unknown revision policies are rejected"""
+    response = api_client.get("/api/file_versions/archive/", {"revisions": "some"})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
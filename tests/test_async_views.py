@@ -0,0 +1,109 @@
+from hashlib import sha256
+from unittest import mock
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from propylon_document_manager.file_versions.models import FileVersion
+
+from .factories import UserFactory
+
+pytestmark = pytest.mark.urls("tests.async_urls")
+
+
+def _headers(user):
+    return {"Authorization": f"Token {Token.objects.get_or_create(user=user)[0].key}"}
+
+
+async def _content(response):
+    return b"".join([chunk async for chunk in response.streaming_content])
+
+
+def _get(path, headers=None, **params):
+    async def get():
+        response = await AsyncClient().get(path, params, headers=headers or {})
+        content = await _content(response) if response.streaming else response.content
+        return response, content
+
+    return async_to_sync(get)()
+
+
+def _upload(user, file_url, content):
+    upload = SimpleUploadedFile("upload.txt", content)
+    return async_to_sync(AsyncClient().post)(
+        "/api/file_versions/", {"file_url": file_url, "file": upload}, headers=_headers(user)
+    )
+
+
+def test_async_upload_and_retrieve(user, media):
+    """Tests that documents uploaded and retrieved through the async views are stored like the sync ones"""
+    for content in (b"first", b"second", b"second"):
+        response = _upload(user, "/docs/a.txt", content)
+        assert response.status_code == status.HTTP_201_CREATED
+
+    assert response.json() == {"file_url": "docs/a.txt", "version_number": 1}
+    assert (media / sha256(b"second").hexdigest()).read_bytes() == b"second"
+    latest = FileVersion.objects.get(file_url="docs/a.txt", is_latest=True)
+    assert (latest.version_number, latest.file_size, latest.folder.path) == (1, 6, "docs")
+
+    response, content = _get("/api/file_versions/docs/a.txt", _headers(user))
+    assert response.status_code == status.HTTP_200_OK
+    assert content == b"second"
+    assert response["Content-Type"].startswith("text/plain")
+
+    response, content = _get("/api/file_versions/docs/a.txt", _headers(user), revision=0)
+    assert content == b"first"
+
+
+def test_async_retrieve_streams_uncached_blobs(settings, user, media):
+    """Tests that blobs above the blob cache threshold are streamed from disk"""
+    settings.FILE_VERSIONS_BLOB_CACHE_MAX_ITEM_SIZE = 16
+    _upload(user, "docs/large.bin", b"x" * 200_000)
+
+    response, content = _get("/api/file_versions/docs/large.bin", _headers(user))
+
+    assert content == b"x" * 200_000
+    assert response["Content-Length"] == "200000"
+
+
+def test_async_views_errors(user, media):
+    """Tests that the async views answer with the same errors as the DRF views"""
+    response, content = _get("/api/file_versions/docs/missing.txt", _headers(user))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": "File not found"}
+
+    response, _ = _get("/api/file_versions/docs/missing.txt")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    response, _ = _get("/api/file_versions/docs/missing.txt", _headers(user), revision="latest")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = async_to_sync(AsyncClient().post)("/api/file_versions/", {"file_url": "a.txt"}, headers=_headers(user))
+    assert response.json() == {"detail": "No file provided"}
+
+
+def test_async_uploads_rejected_while_storing_leave_no_blob(settings, user, media):
+    """Tests that an async upload admitted before a concurrent one used up the quota writes no blob"""
+    settings.FILE_VERSIONS_STORAGE_QUOTA = 100
+    _upload(user, "docs/a.txt", b"a" * 60)
+
+    with mock.patch("propylon_document_manager.file_versions.api.async_views.limit_upload"):
+        assert _upload(user, "docs/b.txt", b"b" * 60).status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    assert [path.read_bytes() for path in media.iterdir()] == [b"a" * 60]
+    assert FileVersion.objects.count() == 1
+
+def test_async_root_lists_through_drf(user, media):
+    """Tests that GET on the upload URL is still served by the DRF listing"""
+    _upload(user, "docs/a.txt", b"content")
+    other_user = UserFactory()
+
+    response, _ = _get("/api/file_versions/", _headers(user))
+    assert [row["file_url"] for row in response.json()["results"]] == ["docs/a.txt"]
+
+    response, _ = _get("/api/file_versions/", _headers(other_user))
+    assert response.json()["results"] == []
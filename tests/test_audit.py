@@ -0,0 +1,185 @@
+import json
+import threading
+from unittest import mock
+
+import pytest
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions import signing
+from propylon_document_manager.file_versions.audit import AuditLog
+from propylon_document_manager.file_versions.models import AuditEvent, FileVersion
+
+from .conftest import upload
+from .factories import UserFactory
+
+
+@pytest.fixture
+def audited(settings):
+    settings.FILE_VERSIONS_AUDIT_BACKEND = "database"
+    settings.FILE_VERSIONS_AUDIT_DURABILITY = "sync"
+
+
+def _event(action, user_id):
+    return AuditEvent(created_at=timezone.now(), action=action, user_id=user_id)
+
+
+def test_reads_writes_and_shares_are_audited(audited, authenticated_client, user):
+    """Tests that uploads, permission changes and every way of reading content are audited"""
+    reader = UserFactory()
+    file_id = upload(authenticated_client, "docs/a.txt", b"abc").data["id"]
+    file_hash = FileVersion.objects.get(pk=file_id).file_hash
+
+    authenticated_client.patch(f"/api/file_versions/{file_id}/", {"read_permissions": [reader.email]}, format="json")
+    b"".join(authenticated_client.get("/api/file_versions/docs/a.txt").streaming_content)
+    authenticated_client.post("/api/file_versions/batch/", {"files": [{"file_url": "docs/a.txt"}]}, format="json")
+    b"".join(authenticated_client.get("/api/file_versions/archive/").streaming_content)
+    authenticated_client.get(f"/api/blobs/{file_hash}?{signing.sign(file_hash, reader.id)}")
+    # Metadata reads are not audited
+    authenticated_client.get(f"/api/file_versions/{file_id}/")
+
+    events = AuditEvent.objects.order_by("id").values_list("action", "user_id", "file_url", "file_version_id")
+    assert list(events) == [
+        ("write", user.id, "docs/a.txt", file_id),
+        ("share", user.id, "docs/a.txt", file_id),
+        ("read", user.id, "docs/a.txt", None),
+        ("read", user.id, "docs/a.txt", None),
+        ("read", user.id, "docs/a.txt", None),
+        ("read", reader.id, "", None),
+    ]
+    assert set(AuditEvent.objects.values_list("file_hash", flat=True)) == {file_hash}
+
+
+def test_file_backend(settings, authenticated_client, user, tmp_path):
+    """Tests that the file backend appends JSON lines"""
+    settings.FILE_VERSIONS_AUDIT_BACKEND = "file"
+    settings.FILE_VERSIONS_AUDIT_DURABILITY = "sync"
+    settings.FILE_VERSIONS_AUDIT_FILE = str(tmp_path / "audit.log")
+
+    upload(authenticated_client, "docs/a.txt", b"abc")
+    upload(authenticated_client, "docs/a.txt", b"abc")
+
+    lines = [json.loads(line) for line in (tmp_path / "audit.log").read_text().splitlines()]
+    assert [(line["action"], line["user_id"], line["file_url"]) for line in lines] == [
+        ("write", user.id, "docs/a.txt"),
+        ("write", user.id, "docs/a.txt"),
+    ]
+    assert not AuditEvent.objects.exists()
+
+
+def test_buffered_log_flushes_on_size_and_time():
+    """Tests that buffered events are written in batches, by size or after the flush interval"""
+    batches = []
+    written = threading.Event()
+
+    def writer(events):
+        batches.append([event.user_id for event in events])
+        written.set()
+
+    audit_log = AuditLog(writer, batch_size=3, flush_seconds=60)
+    for user_id in range(2):
+        audit_log.record(_event("read", user_id))
+    assert not written.wait(0.1)
+
+    audit_log.record(_event("read", 2))
+    assert written.wait(5)
+    assert batches == [[0, 1, 2]]
+
+    written.clear()
+    audit_log = AuditLog(writer, batch_size=3, flush_seconds=0.05)
+    audit_log.record(_event("read", 3))
+    assert written.wait(5)
+    assert batches == [[0, 1, 2], [3]]
+
+
+def test_failed_batches_are_kept():
+    """Tests that events of a batch the backend failed to write are written by the next flush"""
+    writer = mock.Mock(side_effect=[OSError("disk full"), None])
+    audit_log = AuditLog(writer, batch_size=10)
+    audit_log.thread = mock.Mock()
+    audit_log.record(_event("read", 1))
+    audit_log.record(_event("read", 2))
+
+    with pytest.raises(OSError):
+        audit_log.flush()
+    audit_log.flush()
+
+    assert [event.user_id for event in writer.call_args.args[0]] == [1, 2]
+    assert not audit_log.pending
+
+
+
+def test_log_thread_recycles_its_connection():
+    """Tests that the thread closes stale connections before flushing, and its connection after a failed flush"""
+    calls = mock.Mock()
+    closed = threading.Event()
+    calls.writer.side_effect = OSError("connection lost")
+    calls.connection.close.side_effect = lambda: closed.set()
+    audit_log = AuditLog(calls.writer, batch_size=10, flush_seconds=0.05)
+
+    with mock.patch.multiple(
+        "propylon_document_manager.file_versions.audit",
+        close_old_connections=calls.close_old,
+        connection=calls.connection,
+    ):
+        audit_log.record(_event("read", 1))
+        assert closed.wait(5)
+    calls.writer.side_effect = None
+
+    names = [name for name, _, _ in calls.mock_calls]
+    failed = names.index("writer")
+    assert names[failed - 1 : failed + 2] == ["close_old", "writer", "connection.close"]
+    assert calls.writer.call_args.args[0][0].user_id == 1
+
+def test_audit_api(audited, authenticated_client, user):
+    """Tests that staff can list audit events by user, document, action and time"""
+    other = UserFactory()
+    upload(authenticated_client, "docs/a.txt", b"a")
+    upload(authenticated_client, "docs/b.txt", b"b")
+    b"".join(authenticated_client.get("/api/file_versions/docs/a.txt").streaming_content)
+    AuditEvent.objects.create(action="read", user=other, file_url="docs/a.txt")
+
+    assert authenticated_client.get("/api/audit/").status_code == status.HTTP_403_FORBIDDEN
+
+    staff = APIClient()
+    staff.force_authenticate(UserFactory(is_staff=True))
+
+    def listed(**params):
+        response = staff.get("/api/audit/", params)
+        assert response.status_code == status.HTTP_200_OK
+        return [(event["action"], event["user"], event["file_url"]) for event in response.data["results"]]
+
+    assert listed() == [
+        ("read", other.id, "docs/a.txt"),
+        ("read", user.id, "docs/a.txt"),
+        ("write", user.id, "docs/b.txt"),
+        ("write", user.id, "docs/a.txt"),
+    ]
+    assert listed(user=user.email, file_url="/docs/a.txt") == [
+        ("read", user.id, "docs/a.txt"),
+        ("write", user.id, "docs/a.txt"),
+    ]
+    assert listed(action="write", page_size=1) == [("write", user.id, "docs/b.txt")]
+    assert listed(since=timezone.now().isoformat()) == []
+    assert staff.get("/api/audit/", {"action": "delete"}).status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_audit_pages_events_of_the_same_millisecond(user):
+    """Tests that keyset paging visits every event, even those created within one millisecond"""
+    created_at = timezone.now().replace(microsecond=123456)
+    events = AuditEvent.objects.bulk_create(
+        AuditEvent(created_at=created_at.replace(microsecond=123456 + offset), action="read", user=user)
+        for offset in range(4)
+    )
+    staff = APIClient()
+    staff.force_authenticate(UserFactory(is_staff=True))
+
+    seen = []
+    url = "/api/audit/?page_size=1"
+    while url:
+        response = staff.get(url)
+        seen.extend(event["id"] for event in response.data["results"])
+        url = response.data["next"]
+
+    assert seen == [event.id for event in reversed(events)]
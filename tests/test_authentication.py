@@ -0,0 +1,96 @@
+import pytest
+from django.contrib.auth.models import update_last_login
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory
+
+from propylon_document_manager.file_versions.api.authentication import (
+    CachedTokenAuthentication,
+    clear_local_token_cache,
+)
+
+
+@pytest.fixture
+def token(user):
+    return Token.objects.create(user=user)
+
+
+def _authenticate(key):
+    request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Token {key}")
+    return CachedTokenAuthentication().authenticate(request)
+
+
+@pytest.mark.parametrize("local_ttl", [5, 0])
+def test_cached_token_needs_no_queries(settings, user, token, django_assert_num_queries, local_ttl):
+    """Tests that a token is authenticated from the local or shared cache without database queries"""
+    settings.FILE_VERSIONS_TOKEN_LOCAL_CACHE_TTL = local_ttl
+    _authenticate(token.key)
+    clear_local_token_cache()
+    _authenticate(token.key)
+
+    with django_assert_num_queries(0):
+        authenticated_user, auth = _authenticate(token.key)
+
+    assert (authenticated_user, auth) == (user, token)
+
+
+def test_cached_users_are_not_shared(settings, user, token):
+    """Tests that requests served from the local cache get their own user instances"""
+    settings.FILE_VERSIONS_TOKEN_LOCAL_CACHE_TTL = 5
+    first_user, first_token = _authenticate(token.key)
+    first_user.name = "Changed by a request"
+
+    second_user, second_token = _authenticate(token.key)
+
+    assert second_user is not first_user and second_user.name == user.name
+    assert second_token.user is second_user
+
+
+def test_last_login_keeps_cached_tokens(user, token, django_assert_num_queries):
+    """Tests that logging in, which only saves last_login, neither queries tokens nor drops them"""
+    _authenticate(token.key)
+
+    with django_assert_num_queries(1):
+        update_last_login(None, user)
+
+    with django_assert_num_queries(0):
+        _authenticate(token.key)
+
+
+def test_invalid_token():
+    """Tests that unknown tokens fail as with TokenAuthentication"""
+    with pytest.raises(AuthenticationFailed, match="Invalid token"):
+        _authenticate("0" * 40)
+
+
+def test_deactivated_user(user, token):
+    """Tests that deactivating a user invalidates their cached token"""
+    _authenticate(token.key)
+
+    user.is_active = False
+    user.save()
+
+    with pytest.raises(AuthenticationFailed, match="User inactive or deleted"):
+        _authenticate(token.key)
+
+
+def test_deleted_token(user, token):
+    """Tests that deleting a token invalidates it"""
+    _authenticate(token.key)
+
+    token.delete()
+
+    with pytest.raises(AuthenticationFailed, match="Invalid token"):
+        _authenticate(token.key)
+
+
+def test_api_uses_cached_token(token):
+    """Tests that the API accepts tokens through the cached authentication"""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    assert client.get("/api/file_versions/").status_code == status.HTTP_200_OK
+    client.credentials(HTTP_AUTHORIZATION="Token invalid")
+    # SessionAuthentication comes first, so failures are 403 as with TokenAuthentication
+    assert client.get("/api/file_versions/").status_code == status.HTTP_403_FORBIDDEN
@@ -0,0 +1,118 @@
+import email
+import json
+from base64 import b64decode
+from datetime import datetime, timezone
+from unittest import mock
+
+import pytest
+from rest_framework import status
+
+from propylon_document_manager.file_versions.models import FileVersion
+from propylon_document_manager.file_versions.resolution import resolve_file_versions
+
+from .factories import UserFactory
+
+
+@pytest.fixture
+def store(media):
+    def _store(user, file_url, version_number, content):
+        file_hash = f"{file_url}-{user.id}-{version_number}".replace("/", "_")
+        (media / file_hash).write_bytes(content)
+        FileVersion.objects.filter(user=user, file_url=file_url).update(is_latest=False)
+        return FileVersion.objects.create(
+            user=user,
+            file_url=file_url,
+            file_name=file_url.split("/")[-1],
+            version_number=version_number,
+            file_hash=file_hash,
+            file_size=len(content),
+            created_at=datetime(2024, 1, 1, tzinfo=timezone.utc),
+        )
+
+    return _store
+
+
+def test_resolve_file_versions(user, store):
+    """Tests that own versions win over shared ones and that pinned revisions are honoured"""
+    other = UserFactory()
+    store(user, "a.txt", 0, b"a0")
+    store(user, "a.txt", 1, b"a1")
+    store(other, "a.txt", 5, b"theirs").read_permissions.add(user)
+    store(other, "b.txt", 0, b"b0").write_permissions.add(user)
+    store(other, "b.txt", 1, b"b1")
+    store(other, "c.txt", 0, b"c0")
+
+    resolved = resolve_file_versions(user.id, [("a.txt", None), ("a.txt", 0), ("b.txt", None), ("c.txt", None)])
+
+    assert resolved[("a.txt", None)]["version_number"] == 1
+    assert resolved[("a.txt", 0)]["version_number"] == 0
+    assert resolved[("b.txt", None)]["version_number"] == 0
+    assert ("c.txt", None) not in resolved
+
+
+def test_batch_json(api_client, user, store, settings, django_assert_num_queries):
+    """Tests that a batch returns small contents inline, large ones as links and reports missing files"""
+    settings.FILE_VERSIONS_BATCH_INLINE_MAX_SIZE = 4
+    store(user, "docs/small.txt", 0, b"tiny")
+    store(user, "docs/large.txt", 0, b"too large")
+    files = [{"file_url": "docs/small.txt"}, {"file_url": "docs/large.txt"}, {"file_url": "docs/missing.txt"}]
+
+    with django_assert_num_queries(1):
+        response = api_client.post("/api/file_versions/batch/", {"files": files}, format="json")
+
+    assert response.status_code == status.HTTP_200_OK
+    small, large, missing = response.data["results"]
+    assert b64decode(small["content"]) == b"tiny"
+    assert small["content_type"] == "text/plain"
+    assert "content" not in large
+    assert "/api/blobs/docs_large.txt-" in large["url"]
+    assert missing["status"] == 404
+
+
+def test_batch_multipart(api_client, user, store):
+    """Tests the multipart/mixed rendering of a batch"""
+    store(user, "docs/a.txt", 0, b"first")
+    store(user, "docs/b.txt", 0, b"second")
+
+    response = api_client.post(
+        "/api/file_versions/batch/",
+        {"files": [{"file_url": "docs/a.txt"}, {"file_url": "docs/b.txt"}]},
+        format="json",
+        HTTP_ACCEPT="multipart/mixed",
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    message = email.message_from_bytes(
+        b"Content-Type: " + response["Content-Type"].encode() + b"\r\n\r\n" + response.content
+    )
+    metadata, *contents = message.get_payload()
+    assert [part.get_payload(decode=True) for part in contents] == [b"first", b"second"]
+    assert [part["Content-Location"] for part in contents] == ["docs/a.txt", "docs/b.txt"]
+    assert [item["content_id"] for item in json.loads(metadata.get_payload(decode=True))["results"]] == ["0", "1"]
+
+
+def test_batch_too_many_items(api_client, settings):
+    """Tests that batches over the configured size are rejected"""
+    settings.FILE_VERSIONS_BATCH_MAX_ITEMS = 1
+
+    response = api_client.post(
+        "/api/file_versions/batch/", {"files": [{"file_url": "a.txt"}, {"file_url": "b.txt"}]}, format="json"
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"detail": "A batch may request at most 1 files"}
+
+    # Items are not validated one by one when there are too many
+    with mock.patch("propylon_document_manager.file_versions.api.views.BatchItemSerializer") as serializer:
+        response = api_client.post("/api/file_versions/batch/", {"files": [{}] * 1000}, format="json")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    serializer.assert_not_called()
+
+
+@pytest.mark.parametrize("body", [[{"file_url": "a.txt"}], "a.txt", 1])
+def test_batch_body_must_be_an_object(api_client, body):
+    """Tests that a body other than an object is rejected"""
+    response = api_client.post("/api/file_versions/batch/", body, format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"detail": "Expected an object with a files list"}
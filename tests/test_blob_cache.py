@@ -0,0 +1,72 @@
+from hashlib import sha256
+
+import pytest
+from django.core.cache import cache
+from rest_framework import status
+
+from propylon_document_manager.file_versions.blob_cache import BlobCache, get_blob_cache
+from propylon_document_manager.file_versions.models import FileVersion
+
+
+def test_lru_eviction_by_bytes():
+    """Tests that the least recently used blobs are evicted once the byte budget is exceeded"""
+    blob_cache = BlobCache(max_size=10, max_item_size=10)
+    blob_cache.put("a", b"aaaa")
+    blob_cache.put("b", b"bbbb")
+    assert blob_cache.get("a") == b"aaaa"
+
+    blob_cache.put("c", b"cccc")
+
+    assert blob_cache.get("b") is None
+    assert blob_cache.get("a") == b"aaaa"
+    assert blob_cache.get("c") == b"cccc"
+    assert blob_cache.stats() == {
+        "entries": 2,
+        "size": 8,
+        "max_size": 10,
+        "hits": 3,
+        "shared_hits": 0,
+        "misses": 1,
+        "evictions": 1,
+    }
+
+
+def test_admission_threshold():
+    """Tests that blobs above the item size threshold are not cached"""
+    blob_cache = BlobCache(max_size=100, max_item_size=4)
+    blob_cache.put("small", b"1234")
+    blob_cache.put("large", b"12345")
+
+    assert blob_cache.get("small") == b"1234"
+    assert blob_cache.get("large") is None
+    assert not BlobCache(max_size=0, max_item_size=4).enabled
+
+
+def test_shared_tier():
+    """Tests that a blob evicted from one process is still found in the shared tier"""
+    blob_cache = BlobCache(max_size=100, max_item_size=100, shared=cache)
+    blob_cache.put("a", b"aaaa")
+    other_process = BlobCache(max_size=100, max_item_size=100, shared=cache)
+
+    assert other_process.get("a") == b"aaaa"
+    assert other_process.get("a") == b"aaaa"
+    assert (other_process.stats()["shared_hits"], other_process.stats()["hits"]) == (1, 1)
+
+
+@pytest.mark.parametrize("content, cached", [(b"small template", True), (b"x" * 2048, False)])
+def test_retrieve_uses_blob_cache(settings, authenticated_client, user, media, content, cached):
+    """Tests that small blobs are served from the cache after the first read, and large ones are not admitted"""
+    settings.FILE_VERSIONS_BLOB_CACHE_MAX_ITEM_SIZE = 1024
+    file_hash = sha256(content).hexdigest()
+    (media / file_hash).write_bytes(content)
+    FileVersion.objects.create(
+        file_name="template.txt", file_url="templates/template.txt", version_number=0, file_hash=file_hash, user=user
+    )
+
+    for _ in range(2):
+        response = authenticated_client.get("/api/file_versions/templates/template.txt")
+        assert response.status_code == status.HTTP_200_OK
+        assert b"".join(response.streaming_content) == content
+
+    stats = get_blob_cache().stats()
+    assert (stats["hits"], stats["entries"]) == ((1, 1) if cached else (0, 0))
@@ -0,0 +1,250 @@
+from hashlib import sha256
+from unittest import mock
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions import signing
+from propylon_document_manager.file_versions.blobs import (
+    BLOB_CHUNK_SIZE,
+    blob_file_response,
+    file_range_iterator,
+    parse_range_header,
+)
+from propylon_document_manager.file_versions.models import FileVersion
+
+from .factories import UserFactory
+
+CONTENT = b"0123456789abcdefghij"
+FILE_HASH = sha256(CONTENT).hexdigest()
+
+
+@pytest.fixture
+def blob(media):
+    (media / FILE_HASH).write_bytes(CONTENT)
+    return FILE_HASH
+
+
+def _params(query):
+    return dict(parse_qsl(query))
+
+
+def _blob_url(user_id=1, **kwargs):
+    return f"/api/blobs/{FILE_HASH}?{signing.sign(FILE_HASH, user_id, **kwargs)}"
+
+
+def test_signed_url_round_trip():
+    """Tests that a signed URL verifies and carries its grant"""
+    grant = signing.verify(FILE_HASH, _params(signing.sign(FILE_HASH, 7, byte_range=(0, 9))))
+
+    assert grant.user_id == 7
+    assert grant.byte_range == (0, 9)
+
+
+@pytest.mark.parametrize(
+    "tamper",
+    [
+        {"u": "8"},
+        {"r": "0-19"},
+        {"e": "9999999999"},
+        {"s": "forged"},
+        {"k": "unknown"},
+        {"u": "not-a-number"},
+    ],
+)
+def test_tampered_signed_url(tamper):
+    """Tests that changing any signed parameter invalidates the URL"""
+    params = {**_params(signing.sign(FILE_HASH, 7, byte_range=(0, 9))), **tamper}
+
+    with pytest.raises(signing.InvalidSignature):
+        signing.verify(FILE_HASH, params)
+
+
+def test_signed_url_bound_to_blob():
+    """Tests that a signed URL cannot be reused for another blob"""
+    with pytest.raises(signing.InvalidSignature):
+        signing.verify("0" * 64, _params(signing.sign(FILE_HASH, 7)))
+
+
+def test_signed_url_expiry():
+    """Tests that signed URLs stop working once expired"""
+    params = _params(signing.sign(FILE_HASH, 7, max_age=60))
+
+    with mock.patch("propylon_document_manager.file_versions.signing.time.time", return_value=10**10):
+        with pytest.raises(signing.InvalidSignature):
+            signing.verify(FILE_HASH, params)
+
+
+def test_signing_key_rotation(settings):
+    """Tests that URLs signed with a retired key stay valid until the key is dropped"""
+    settings.FILE_VERSIONS_URL_SIGNING_KEYS = {"old": "old-secret"}
+    settings.FILE_VERSIONS_URL_SIGNING_KEY_ID = "old"
+    params = _params(signing.sign(FILE_HASH, 7))
+
+    settings.FILE_VERSIONS_URL_SIGNING_KEYS = {"old": "old-secret", "new": "new-secret"}
+    settings.FILE_VERSIONS_URL_SIGNING_KEY_ID = "new"
+    assert signing.verify(FILE_HASH, params)
+    assert _params(signing.sign(FILE_HASH, 7))["k"] == "new"
+
+    settings.FILE_VERSIONS_URL_SIGNING_KEYS = {"new": "new-secret"}
+    with pytest.raises(signing.InvalidSignature):
+        signing.verify(FILE_HASH, params)
+
+
+def test_signed_url_revocation(settings):
+    """Tests revocation by the global epoch and by per-user epochs"""
+    params = _params(signing.sign(FILE_HASH, 7))
+    other_params = _params(signing.sign(FILE_HASH, 8))
+
+    signing.revoke_signed_urls(7)
+    with pytest.raises(signing.InvalidSignature):
+        signing.verify(FILE_HASH, params)
+    assert signing.verify(FILE_HASH, other_params)
+    assert signing.verify(FILE_HASH, _params(signing.sign(FILE_HASH, 7)))
+
+    settings.FILE_VERSIONS_URL_SIGNING_EPOCH += 1
+    with pytest.raises(signing.InvalidSignature):
+        signing.verify(FILE_HASH, other_params)
+
+
+def test_lost_epoch_revokes_signed_urls():
+    """Tests that URLs signed before their user's epoch was evicted no longer verify"""
+    params = _params(signing.sign(FILE_HASH, 7))
+    signing.revoke_signed_urls(7)
+    revoked_params = _params(signing.sign(FILE_HASH, 7))
+    signing.revoke_signed_urls(7)
+
+    cache.clear()
+
+    for lost_params in (params, revoked_params):
+        with pytest.raises(signing.InvalidSignature):
+            signing.verify(FILE_HASH, lost_params)
+    assert signing.verify(FILE_HASH, _params(signing.sign(FILE_HASH, 7)))
+
+
+def test_blob_served_without_database_queries(blob, django_assert_num_queries):
+    """Tests that a blob is served without touching the database, cacheable privately until its URL expires"""
+    with django_assert_num_queries(0):
+        response = APIClient().get(_blob_url(max_age=60))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert b"".join(response.streaming_content) == CONTENT
+    assert response["Cache-Control"] in ("private, max-age=60, immutable", "private, max-age=59, immutable")
+    assert response["ETag"] == f'"{blob}"'
+
+
+def test_blob_not_modified(blob):
+    """Tests that a matching If-None-Match is answered with 304"""
+    response = APIClient().get(_blob_url(), HTTP_IF_NONE_MATCH=f'"{blob}"')
+
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test_blob_requires_valid_signature(blob):
+    """Tests that blobs cannot be fetched without a valid signed URL"""
+    assert APIClient().get(f"/api/blobs/{blob}").status_code == status.HTTP_403_FORBIDDEN
+    response = APIClient().get(_blob_url() + "0")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    response = APIClient().get(_blob_url().replace("&s=", "&s=%C3%A9"))
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.parametrize(
+    "byte_range, range_header, expected_status, expected_content",
+    [
+        (None, "bytes=2-4", status.HTTP_206_PARTIAL_CONTENT, b"234"),
+        (None, "bytes=-3", status.HTTP_206_PARTIAL_CONTENT, b"hij"),
+        ((5, 9), None, status.HTTP_206_PARTIAL_CONTENT, b"56789"),
+        ((5, 9), "bytes=6-7", status.HTTP_206_PARTIAL_CONTENT, b"67"),
+        ((5, 9), "bytes=0-7", status.HTTP_403_FORBIDDEN, None),
+        (None, "bytes=30-40", status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, None),
+    ],
+)
+def test_blob_ranges(blob, byte_range, range_header, expected_status, expected_content):
+    """Tests Range requests and ranges bound into signed URLs"""
+    headers = {"HTTP_RANGE": range_header} if range_header else {}
+
+    response = APIClient().get(_blob_url(byte_range=byte_range), **headers)
+
+    assert response.status_code == expected_status
+    if expected_content is not None:
+        assert b"".join(response.streaming_content) == expected_content
+        assert response["Content-Range"].endswith(f"/{len(CONTENT)}")
+
+
+def test_blob_file_response(tmp_path):
+    """Tests that blobs are streamed from an open file, which WSGI servers can hand to os.sendfile"""
+    path = tmp_path / FILE_HASH
+    path.write_bytes(CONTENT)
+
+    response = blob_file_response(path, "text/plain")
+
+    assert response.file_to_stream is not None
+    assert response.block_size == BLOB_CHUNK_SIZE
+    assert response["Content-Length"] == str(len(CONTENT))
+    assert b"".join(response.streaming_content) == CONTENT
+    response.close()
+
+
+@pytest.mark.parametrize("content", [b"", CONTENT, bytes(range(256)) * 5000])
+def test_file_range_iterator(tmp_path, content):
+    """Tests that memory-mapped and chunked range reads return the same bytes across chunk boundaries"""
+    path = tmp_path / "blob"
+    path.write_bytes(content)
+
+    for start, length in [(0, len(content)), (len(content) // 3, len(content) // 2), (len(content), 0)]:
+        assert b"".join(file_range_iterator(open(path, "rb"), start, length)) == content[start : start + length]
+
+
+def test_parse_range_header():
+    """Tests parsing of single-range Range headers"""
+    assert parse_range_header(None, 10) is None
+    assert parse_range_header("bytes=0-", 10) == (0, 9)
+    assert parse_range_header("bytes=8-20", 10) == (8, 9)
+
+
+def test_download_url(blob, user):
+    """Tests that the download_url action mints a working range-bound URL for visible versions only"""
+    file_version = FileVersion.objects.create(
+        user=user, file_url="docs/a.txt", file_name="a.txt", version_number=0, file_hash=blob
+    )
+    client = APIClient()
+    client.force_authenticate(user)
+
+    response = client.get(f"/api/file_versions/{file_version.id}/download_url/", {"range": "0-3"})
+
+    assert response.status_code == status.HTTP_200_OK
+    url = urlsplit(response.data["url"])
+    assert b"".join(APIClient().get(f"{url.path}?{url.query}").streaming_content) == b"0123"
+
+    client.force_authenticate(UserFactory())
+    response = client.get(f"/api/file_versions/{file_version.id}/download_url/")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_removing_permission_revokes_signed_urls(blob, api_client, user):
+    """Tests that only the users who lose a permission lose their outstanding signed URLs"""
+    reader, other_reader = UserFactory(), UserFactory()
+    file_version = FileVersion.objects.create(
+        user=user, file_url="docs/a.txt", file_name="a.txt", version_number=0, file_hash=blob
+    )
+    file_version.read_permissions.add(reader)
+    params = _params(signing.sign(blob, reader.id))
+
+    def share(*readers):
+        data = {"read_permissions": [reader.email for reader in readers]}
+        response = api_client.patch(f"/api/file_versions/{file_version.id}/", data, format="json")
+        assert response.status_code == status.HTTP_200_OK
+
+    share(reader, other_reader)
+    assert signing.verify(blob, params)
+    other_params = _params(signing.sign(blob, other_reader.id))
+
+    share(other_reader)
+    with pytest.raises(signing.InvalidSignature):
+        signing.verify(blob, params)
+    assert signing.verify(blob, other_params)
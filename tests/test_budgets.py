@@ -0,0 +1,240 @@
+"""
+Query and allocation budgets of every API endpoint.
+
+Each endpoint is measured against a small dataset, which then grows about tenfold: more users,
+versions, documents, shares, audit events and retention policies, and a longer permission list.
+Its query count must not grow with the data, and neither the query count nor the peak of Python
+allocations (traced with tracemalloc) may exceed its budget in budgets.json. Nor may the growth
+of the peak between the two sizes, so allocations that scale with the data are caught even when
+the small dataset hides them. Failures print the SQL of the request.
+
+After an intended change, record new budgets with:
+
+    pytest tests/test_budgets.py --update-budgets
+"""
+import itertools
+import json
+import math
+import tracemalloc
+from functools import partial
+from pathlib import Path
+
+import pytest
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions import signing
+from propylon_document_manager.file_versions.api.authentication import clear_local_token_cache
+from propylon_document_manager.file_versions.blob_cache import get_blob_cache
+from propylon_document_manager.file_versions.models import AuditEvent, FileVersion, RetentionPolicy, User
+from propylon_document_manager.file_versions.uploads import store_file_version
+
+from .factories import UserFactory
+
+BUDGETS_PATH = Path(__file__).with_name("budgets.json")
+
+# Budgets recorded with --update-budgets leave this much room for allocation noise
+ALLOCATION_HEADROOM = 1.5
+# Extra room for the growth of the peak, which is close to zero for most endpoints
+GROWTH_SLACK_KIB = 8
+# Requests are measured this many times and their lowest peak kept, which leaves out one-off
+# allocations such as a process-wide dict growing
+MEASUREMENTS = 2
+
+SMALL_SCALE = 2
+LARGE_SCALE = 20
+
+DOCUMENT_URL = "docs/target.txt"
+SHARED_DOCUMENT_URL = "shared/target.txt"
+
+_contents = itertools.count()
+
+
+def _store(media, user, file_url):
+    """Stores a new version of a document, with its blob on disk."""
+    content = f"{file_url} {next(_contents)}".encode()
+    file_hash = f"{next(_contents):064x}"
+    (media / file_hash).write_bytes(content)
+    latest = FileVersion.objects.filter(user=user, file_url=file_url, is_latest=True).first()
+    version_number = latest.version_number + 1 if latest else 0
+    return store_file_version(user.id, file_url, file_url.rsplit("/", 1)[-1], file_hash, len(content), version_number)
+
+
+def grow(media, owner, other, scale):
+    """
+    Adds ``scale`` users with a retention policy each, versions of the owner's and of the shared
+    document, documents of the owner, audit events, and shares of both latest versions with every
+    user.
+    """
+    users = UserFactory.create_batch(scale)
+    RetentionPolicy.objects.bulk_create(RetentionPolicy(user=user, keep_last=1) for user in users)
+    for number in range(scale):
+        _store(media, owner, DOCUMENT_URL)
+        _store(media, other, SHARED_DOCUMENT_URL)
+        _store(media, owner, f"docs/{next(_contents)}.txt")
+    AuditEvent.objects.bulk_create(
+        AuditEvent(action=AuditEvent.READ, user=user, file_url=DOCUMENT_URL) for user in (owner, other) * scale
+    )
+
+    users = list(User.objects.all())
+    for file_url in (DOCUMENT_URL, SHARED_DOCUMENT_URL):
+        latest = FileVersion.objects.get(file_url=file_url, is_latest=True)
+        latest.read_permissions.add(*users)
+        latest.write_permissions.add(*users)
+
+
+def _latest(file_url):
+    return FileVersion.objects.get(file_url=file_url, is_latest=True)
+
+
+def _upload(client, owner):
+    content = f"upload {next(_contents)}".encode()
+    data = {"file_url": DOCUMENT_URL, "file": SimpleUploadedFile("target.txt", content)}
+    return partial(client.post, "/api/file_versions/", data)
+
+
+def _blob(client, owner):
+    file_hash = _latest(DOCUMENT_URL).file_hash
+    # Signed once the caches are cleared, since clearing them revokes earlier URLs
+    return lambda: client.get(f"/api/blobs/{file_hash}?{signing.sign(file_hash, owner.id)}")
+
+
+def _partial_update(client, owner):
+    data = {"read_permissions": list(User.objects.values_list("email", flat=True)), "write_permissions": [owner.email]}
+    return partial(client.patch, f"/api/file_versions/{_latest(DOCUMENT_URL).id}/", data, format="json")
+
+
+def _audit(client, owner):
+    owner.is_staff = True
+    owner.save()
+    return partial(client.get, "/api/audit/", {"file_url": DOCUMENT_URL})
+
+
+def _retention_policies(client, owner):
+    RetentionPolicy.objects.get_or_create(user=owner, prefix="docs/", defaults={"keep_last": 5})
+    return partial(client.get, "/api/retention_policies/")
+
+
+BATCH = {
+    "files": [{"file_url": DOCUMENT_URL}, {"file_url": SHARED_DOCUMENT_URL}, {"file_url": DOCUMENT_URL, "revision": 0}]
+}
+
+# Each endpoint prepares, outside of the measurement, a request of the owner
+ENDPOINTS = {
+    "retrieve": lambda client, owner: partial(client.get, f"/api/file_versions/{DOCUMENT_URL}"),
+    "retrieve_revision": lambda client, owner: partial(
+        client.get, f"/api/file_versions/{DOCUMENT_URL}", {"revision": 0}
+    ),
+    "retrieve_shared": lambda client, owner: partial(client.get, f"/api/file_versions/{SHARED_DOCUMENT_URL}"),
+    "history": lambda client, owner: partial(client.get, f"/api/file_versions/{DOCUMENT_URL}/history"),
+    "blob": _blob,
+    "download_url": lambda client, owner: partial(
+        client.get, f"/api/file_versions/{_latest(DOCUMENT_URL).id}/download_url/"
+    ),
+    "detail": lambda client, owner: partial(client.get, f"/api/file_versions/{_latest(DOCUMENT_URL).id}/"),
+    "create": _upload,
+    "partial_update": _partial_update,
+    "list": lambda client, owner: partial(client.get, "/api/file_versions/"),
+    "list_shared": lambda client, owner: partial(client.get, "/api/file_versions/", {"scope": "shared"}),
+    "list_related_fields": lambda client, owner: partial(
+        client.get, "/api/file_versions/", {"fields": "id,uploader,read_permissions,blob_url"}
+    ),
+    "versions": lambda client, owner: partial(client.get, "/api/file_versions/versions/", {"file_url": DOCUMENT_URL}),
+    "archive": lambda client, owner: partial(client.get, "/api/file_versions/archive/", {"revisions": "all"}),
+    "batch": lambda client, owner: partial(client.post, "/api/file_versions/batch/", BATCH, format="json"),
+    "folders": lambda client, owner: partial(client.get, "/api/folders/", {"path": "docs"}),
+    "audit": _audit,
+    "retention_policies": _retention_policies,
+}
+
+
+def measure_once(send):
+    """Runs a request with cold caches. Returns its response, captured queries and peak allocated bytes."""
+    cache.clear()
+    get_blob_cache.cache_clear()
+    clear_local_token_cache()
+
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            response = send()
+            if response.streaming:
+                b"".join(response.streaming_content)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert status.is_success(response.status_code), response.content
+    return response, queries.captured_queries, peak
+
+
+def measure(prepare, client, owner):
+    """Measures freshly prepared requests MEASUREMENTS times. Returns the last queries and the lowest peak."""
+    measurements = [measure_once(prepare(client, owner)) for _ in range(MEASUREMENTS)]
+    return measurements[-1][1], min(peak for _, _, peak in measurements)
+
+
+def format_queries(queries):
+    return "\n".join(f"{number}. {query['sql']}" for number, query in enumerate(queries, 1))
+
+
+def load_budgets():
+    if not BUDGETS_PATH.exists():
+        return {}
+    return json.loads(BUDGETS_PATH.read_text())
+
+
+def save_budget(endpoint, budget):
+    budgets = load_budgets()
+    budgets[endpoint] = budget
+    BUDGETS_PATH.write_text(json.dumps(dict(sorted(budgets.items())), indent=2) + "\n")
+
+
+@pytest.mark.parametrize("endpoint", ENDPOINTS)
+def test_endpoint_budget(request, media, endpoint):
+    owner, other = UserFactory(), UserFactory()
+    client = APIClient()
+    client.force_authenticate(owner)
+    prepare = ENDPOINTS[endpoint]
+
+    grow(media, owner, other, SMALL_SCALE)
+    # The first request fills per-process state (URL resolvers, imports) that later ones reuse
+    measure_once(prepare(client, owner))
+    small_queries, small_peak = measure(prepare, client, owner)
+
+    grow(media, owner, other, LARGE_SCALE)
+    large_queries, large_peak = measure(prepare, client, owner)
+
+    assert len(large_queries) <= len(small_queries), (
+        f"{endpoint} made {len(small_queries)} queries on the small dataset and {len(large_queries)} "
+        f"on the large one:\n{format_queries(large_queries)}"
+    )
+
+    peak_kib = math.ceil(max(small_peak, large_peak) / 1024)
+    growth_kib = math.ceil(max(0, large_peak - small_peak) / 1024)
+    if request.config.getoption("update_budgets"):
+        budget = {
+            "queries": len(large_queries),
+            "peak_kib": math.ceil(peak_kib * ALLOCATION_HEADROOM),
+            "growth_kib": math.ceil(growth_kib * ALLOCATION_HEADROOM) + GROWTH_SLACK_KIB,
+        }
+        save_budget(endpoint, budget)
+        return
+
+    budget = load_budgets().get(endpoint)
+    assert budget, f"{endpoint} has no budget, record one with --update-budgets"
+    assert len(large_queries) <= budget["queries"], (
+        f"{endpoint} made {len(large_queries)} queries, over its budget of {budget['queries']}:\n"
+        f"{format_queries(large_queries)}"
+    )
+    assert peak_kib <= budget["peak_kib"], (
+        f"{endpoint} allocated up to {peak_kib} KiB, over its budget of {budget['peak_kib']} KiB"
+    )
+    assert growth_kib <= budget["growth_kib"], (
+        f"{endpoint} allocated {growth_kib} KiB more on the large dataset than on the small one, "
+        f"over its budget of {budget['growth_kib']} KiB"
+    )
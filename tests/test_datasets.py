@@ -0,0 +1,56 @@
+from hashlib import sha256
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from propylon_document_manager.file_versions.datasets import DatasetSpec, generate_dataset
+from propylon_document_manager.file_versions.folders import check_folder_index
+from propylon_document_manager.file_versions.models import FileVersion, User
+
+SPEC = DatasetSpec(users=5, documents_per_user=8, mean_versions=3, median_blob_size=512, dedup_ratio=0.3, seed=7)
+
+
+def _snapshot():
+    rows = FileVersion.objects.order_by("id").values_list(
+        "user__email", "file_url", "version_number", "file_hash", "file_size", "created_at", "is_latest"
+    )
+    shares = FileVersion.read_permissions.through.objects.values_list("fileversion__file_url", "user__email")
+    return list(rows), sorted(shares)
+
+
+def test_generate_dataset(tmp_path):
+    """Tests that a generated dataset is consistent, with blobs matching their hashes"""
+    totals = generate_dataset(SPEC, media_path=str(tmp_path), batch_size=10)
+
+    assert totals["users"] == User.objects.count() == 5
+    assert totals["documents"] == FileVersion.objects.filter(is_latest=True).count() == 40
+    assert totals["versions"] == FileVersion.objects.count()
+    assert totals["blobs"] == FileVersion.objects.values("file_hash").distinct().count() < totals["versions"]
+    assert check_folder_index() == []
+
+    for file_hash, file_size in FileVersion.objects.values_list("file_hash", "file_size").distinct():
+        content = (tmp_path / file_hash).read_bytes()
+        assert sha256(content).hexdigest() == file_hash
+        assert len(content) == file_size
+
+
+def test_generate_dataset_is_deterministic():
+    """Tests that the same spec generates the same rows, whatever the batch size"""
+    generate_dataset(SPEC, batch_size=10)
+    snapshot = _snapshot()
+    User.objects.all().delete()
+
+    generate_dataset(SPEC, batch_size=1000)
+
+    assert _snapshot() == snapshot
+
+
+def test_generate_dataset_command():
+    """Tests the command and that it refuses to generate the same users twice"""
+    options = {"users": 2, "documents_per_user": 3, "no_blobs": True, "stdout": StringIO()}
+    call_command("generate_dataset", **options)
+    assert FileVersion.objects.filter(is_latest=True).count() == 6
+
+    with pytest.raises(CommandError):
+        call_command("generate_dataset", **options)
@@ -0,0 +1,111 @@
+import os
+from hashlib import sha256
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions import signing
+from propylon_document_manager.file_versions.models import FileVersion
+
+from .factories import UserFactory
+
+CONTENT = b"Statute of limitations"
+FILE_HASH = sha256(CONTENT).hexdigest()
+
+
+def nginx_stand_in(response, internal_location, root):
+    """
+    Resolves an X-Accel-Redirect like nginx does for an `internal` location aliased to `root`:
+    the body comes from the aliased file and the upstream content headers are kept.
+    """
+    redirect = response["X-Accel-Redirect"]
+    assert redirect.startswith(internal_location)
+    with open(os.path.join(root, redirect[len(internal_location):]), "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def media(media):
+    (media / FILE_HASH).write_bytes(CONTENT)
+    return media
+
+
+@pytest.fixture
+def api_client(user, media):
+    FileVersion.objects.create(
+        user=user,
+        file_url="statutes/limitations.txt",
+        file_name="limitations.txt",
+        version_number=0,
+        file_hash=FILE_HASH,
+    )
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def test_stream_mode_is_default(api_client):
+    """Tests that Django streams the bytes itself unless offloading is configured"""
+    response = api_client.get("/api/file_versions/statutes/limitations.txt")
+
+    assert "X-Accel-Redirect" not in response
+    assert b"".join(response.streaming_content) == CONTENT
+
+
+def test_x_accel_redirect_mode(api_client, media, settings):
+    """Tests that in x-accel-redirect mode only headers are returned and nginx can serve the blob"""
+    settings.FILE_VERSIONS_DELIVERY_MODE = "x-accel-redirect"
+
+    response = api_client.get("/api/file_versions/statutes/limitations.txt")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == b""
+    assert response["X-Accel-Redirect"] == f"/internal/blobs/{FILE_HASH}"
+    assert response["Content-Type"] == "text/plain"
+    assert response["Content-Disposition"] == 'inline; filename="limitations.txt"'
+    assert response["ETag"] == f'"{FILE_HASH}"'
+    assert nginx_stand_in(response, "/internal/blobs/", media) == CONTENT
+
+
+def test_x_sendfile_mode(api_client, media, settings):
+    """Tests that in x-sendfile mode the absolute blob path is handed to the server"""
+    settings.FILE_VERSIONS_DELIVERY_MODE = "x-sendfile"
+
+    response = api_client.get("/api/file_versions/statutes/limitations.txt")
+
+    assert response["X-Sendfile"] == os.path.join(str(media), FILE_HASH)
+    assert response.content == b""
+
+
+def test_offload_still_checks_permissions(api_client, settings):
+    """Tests that offloading happens only after the permission check"""
+    settings.FILE_VERSIONS_DELIVERY_MODE = "x-accel-redirect"
+    api_client.force_authenticate(UserFactory())
+
+    response = api_client.get("/api/file_versions/statutes/limitations.txt")
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert "X-Accel-Redirect" not in response
+
+
+def test_blob_offload_skipped_for_bound_ranges(media, settings):
+    """Tests that blobs are offloaded, except for URLs bound to a range the proxy would not enforce"""
+    settings.FILE_VERSIONS_DELIVERY_MODE = "x-accel-redirect"
+
+    response = APIClient().get(f"/api/blobs/{FILE_HASH}?{signing.sign(FILE_HASH, 1)}")
+    assert response["X-Accel-Redirect"] == f"/internal/blobs/{FILE_HASH}"
+    assert response["Cache-Control"].startswith("private")
+
+    response = APIClient().get(f"/api/blobs/{FILE_HASH}?{signing.sign(FILE_HASH, 1, byte_range=(0, 6))}")
+    assert "X-Accel-Redirect" not in response
+    assert b"".join(response.streaming_content) == b"Statute"
+
+
+def test_unknown_delivery_mode(api_client, settings):
+    """Tests that a misconfigured delivery mode fails loudly"""
+    settings.FILE_VERSIONS_DELIVERY_MODE = "carrier-pigeon"
+
+    with pytest.raises(ImproperlyConfigured):
+        api_client.get("/api/file_versions/statutes/limitations.txt")
@@ -1,17 +1,26 @@
+import json
 import os
 import shutil
+from base64 import urlsafe_b64encode
+from datetime import datetime, timezone as dt_timezone
 from unittest.mock import MagicMock
 
+import pytest
 from pytest import raises
 from unittest import mock
 from rest_framework.exceptions import ValidationError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
 from django.http import Http404
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 
 from propylon_document_manager.file_versions.api.views import FileVersionRetrieveView, FileVersionViewSet, \
     get_directories
 from propylon_document_manager.file_versions.models import FileVersion, User
+from .conftest import upload
+from .factories import UserFactory
 
 
 def test_file_versions(user):
@@ -274,8 +283,7 @@ def test_partial_update_read_permissions_updated(mock_file_version_objects, mock
     request = MagicMock(data=data)
     response = FileVersionViewSet().partial_update(request, pk=1)
 
-    mock_file_version.read_permissions.clear.assert_called_once()
-    mock_file_version.read_permissions.add.assert_called_once_with(user)
+    mock_file_version.read_permissions.set.assert_called_once_with([user])
     assert response.status_code == status.HTTP_200_OK
     assert response.data["id"] == mock_file_version.id
 
@@ -296,8 +304,7 @@ def test_partial_update_write_permissions_updated(mock_file_version_objects, moc
     request = MagicMock(data=data)
     response = FileVersionViewSet().partial_update(request, pk=1)
 
-    mock_file_version.write_permissions.clear.assert_called_once()
-    mock_file_version.write_permissions.add.assert_called_once_with(user)
+    mock_file_version.write_permissions.set.assert_called_once_with([user])
     assert response.status_code == status.HTTP_200_OK
     assert response.data["id"] == mock_file_version.id
 
@@ -323,8 +330,364 @@ def test_partial_update_both_permissions(mock_file_version_objects, mock_user_ob
     request = MagicMock(data=data)
     response = FileVersionViewSet().partial_update(request, pk=1)
 
-    mock_file_version.read_permissions.clear.assert_called_once()
-    mock_file_version.write_permissions.clear.assert_called_once()
-    mock_file_version.read_permissions.add.assert_called_once_with(user)
-    mock_file_version.write_permissions.add.assert_called_once_with(user)
+    mock_file_version.read_permissions.set.assert_called_once_with([user])
+    mock_file_version.write_permissions.set.assert_called_once_with([user])
     assert response.status_code == status.HTTP_200_OK
+
+
+def _create_versions(user, file_url, count, **kwargs):
+    FileVersion.objects.filter(file_url=file_url, user_id=user.id).update(is_latest=False)
+    return [
+        FileVersion.objects.create(
+            file_name=file_url.split("/")[-1],
+            file_url=file_url,
+            version_number=number,
+            file_hash=f"{number:064d}",
+            user_id=user.id,
+            is_latest=number == count - 1,
+            **kwargs
+        )
+        for number in range(count)
+    ]
+
+
+def test_list_returns_latest_owned_versions(api_client, user):
+    """Tests that the document listing returns one row per document, at its latest version"""
+    _create_versions(user, "matters/a.txt", 3)
+    _create_versions(user, "matters/b.txt", 1)
+    _create_versions(user, "other/c.txt", 1)
+
+    response = api_client.get("/api/file_versions/", {"prefix": "matters/", "scope": "owned"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [(row["file_url"], row["version_number"]) for row in response.data["results"]] == [
+        ("matters/a.txt", 2),
+        ("matters/b.txt", 0),
+    ]
+    assert response.data["next"] is None
+
+
+def test_list_shared_scope(api_client, user):
+    """Tests that the shared scope only returns documents other users have shared"""
+    owner = UserFactory()
+    shared, = _create_versions(owner, "shared/doc.txt", 1)
+    _create_versions(owner, "private/doc.txt", 1)
+    _create_versions(user, "mine/doc.txt", 1)
+    shared.read_permissions.add(user)
+
+    response = api_client.get("/api/file_versions/", {"scope": "shared"})
+
+    assert [row["id"] for row in response.data["results"]] == [shared.id]
+
+
+def test_list_shared_document_after_a_new_version(api_client, user, media):
+    """Tests that a document shared at an older version is listed at that version once the owner uploads another"""
+    owner = UserFactory()
+    owner_client = APIClient()
+    owner_client.force_authenticate(owner)
+    shared_id = upload(owner_client, "shared/doc.txt", b"first").data["id"]
+    FileVersion.objects.get(pk=shared_id).read_permissions.add(user)
+    upload(owner_client, "shared/doc.txt", b"second")
+
+    for scope in ("shared", "all"):
+        response = api_client.get("/api/file_versions/", {"scope": scope})
+        assert [(row["id"], row["version_number"]) for row in response.data["results"]] == [(shared_id, 0)]
+
+    response = api_client.get("/api/file_versions/shared/doc.txt")
+    assert b"".join(response.streaming_content) == b"first"
+
+
+def test_list_owned_scope_reads_its_index(api_client, user):
+    """Tests that the owned listing is read in order from its partial index, without sorting"""
+    _create_versions(user, "matters/a.txt", 2)
+
+    with CaptureQueriesContext(connection) as queries:
+        assert api_client.get("/api/file_versions/", {"scope": "owned"}).status_code == status.HTTP_200_OK
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {queries[-1]['sql']}")
+        plan = " ".join(str(row) for row in cursor.fetchall())
+
+    assert "fileversion_owned_latest_idx" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_partial_update_needs_owner_or_writer(api_client, user, media):
+    """Tests that users who neither own nor can write a version cannot share it, themselves included"""
+    owner = UserFactory()
+    owner_client = APIClient()
+    owner_client.force_authenticate(owner)
+    file_version = FileVersion.objects.get(pk=upload(owner_client, "docs/a.txt", b"secret").data["id"])
+    data = {"read_permissions": [user.email]}
+
+    assert api_client.patch(f"/api/file_versions/{file_version.id}/", data, format="json").status_code == 403
+    file_version.read_permissions.add(user)
+    data_write = {"write_permissions": [user.email]}
+    assert api_client.patch(f"/api/file_versions/{file_version.id}/", data_write, format="json").status_code == 403
+    assert not file_version.write_permissions.exists()
+
+    file_version.write_permissions.add(user)
+    assert api_client.patch(f"/api/file_versions/{file_version.id}/", data, format="json").status_code == 200
+
+
+@pytest.mark.parametrize(
+    "method, path",
+    [
+        ("get", "/api/file_versions/abc/"),
+        ("get", "/api/file_versions/abc/download_url/"),
+        ("patch", "/api/file_versions/abc/"),
+        ("patch", "/api/retention_policies/abc/"),
+        ("delete", "/api/retention_policies/abc/"),
+    ],
+)
+def test_non_numeric_ids_are_not_found(api_client, method, path):
+    """Tests that detail routes answer 404 to ids that are not numbers"""
+    response = getattr(api_client, method)(path, {}, format="json")
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_list_invalid_scope(api_client):
+    """Tests that an unknown scope is rejected"""
+    response = api_client.get("/api/file_versions/", {"scope": "everything"})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_list_keyset_pagination_walks_every_document(api_client, user):
+    """Tests that following the next cursors visits every document exactly once"""
+    file_urls = sorted(f"docs/file_{index:02d}.txt" for index in range(7))
+    for file_url in file_urls:
+        _create_versions(user, file_url, 2)
+
+    seen = []
+    url = "/api/file_versions/?page_size=3"
+    while url:
+        response = api_client.get(url)
+        seen.extend(row["file_url"] for row in response.data["results"])
+        url = response.data["next"]
+
+    assert seen == file_urls
+
+
+def test_list_invalid_cursor(api_client):
+    """Tests that a malformed cursor is reported as not found"""
+    response = api_client.get("/api/file_versions/", {"cursor": "not-a-cursor"})
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.parametrize("position", [["a", "abc"], [None, None], ["a", {"id": 1}]])
+def test_list_cursor_with_invalid_values(api_client, position):
+    """Tests that a well-formed cursor holding values its fields cannot take is reported as not found"""
+    cursor = urlsafe_b64encode(json.dumps(position).encode()).decode()
+    response = api_client.get("/api/file_versions/", {"cursor": cursor})
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_versions_lists_history_newest_first(api_client, user):
+    """Tests that the versions listing is paginated newest first"""
+    _create_versions(user, "docs/report.txt", 5)
+
+    response = api_client.get("/api/file_versions/versions/", {"file_url": "docs/report.txt", "page_size": 2})
+    assert [row["version_number"] for row in response.data["results"]] == [4, 3]
+
+    response = api_client.get(response.data["next"])
+    assert [row["version_number"] for row in response.data["results"]] == [2, 1]
+
+
+def test_create_moves_latest_flag(authenticated_client, user):
+    """Tests that uploading a new version marks the previous one as superseded"""
+    for content in (b"first", b"second"):
+        upload(authenticated_client, "docs/doc.txt", content)
+
+    versions = FileVersion.objects.filter(file_url="docs/doc.txt").order_by("version_number")
+    assert [version.is_latest for version in versions] == [False, True]
+
+
+@pytest.mark.parametrize("version_count", [3, 30])
+def test_history_query_count_is_constant(api_client, user, version_count, django_assert_num_queries):
+    """Tests that the history endpoint costs the same number of queries for any number of versions"""
+    reader, writer = UserFactory(), UserFactory()
+    for file_version in _create_versions(user, "docs/history.txt", version_count):
+        file_version.read_permissions.add(reader, writer)
+        file_version.write_permissions.add(writer)
+
+    # One query for the versions and uploaders, one per permission list
+    with django_assert_num_queries(3):
+        response = api_client.get("/api/file_versions/docs/history.txt/history")
+
+    assert response.status_code == status.HTTP_200_OK
+    versions = response.data["versions"]
+    assert [version["version_number"] for version in versions] == list(range(version_count))
+    assert versions[0]["uploader"] == user.email
+    assert sorted(versions[0]["read_permissions"]) == sorted([reader.email, writer.email])
+    assert versions[0]["write_permissions"] == [writer.email]
+
+
+def test_history_not_found(api_client):
+    """Tests that the history of an unknown file_url returns 404"""
+    response = api_client.get("/api/file_versions/docs/missing.txt/history")
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_list_sparse_fieldset(api_client, user):
+    """Tests that ?fields= narrows the listing rows to the requested columns"""
+    _create_versions(user, "docs/a.txt", 2)
+
+    response = api_client.get("/api/file_versions/", {"fields": "version_number,file_size"})
+
+    assert response.data["results"] == [{"version_number": 1, "file_size": 0}]
+
+
+def test_list_unknown_field(api_client):
+    """Tests that requesting an unknown field is rejected"""
+    response = api_client.get("/api/file_versions/", {"fields": "id,password"})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.parametrize(
+    "fields, expected_queries",
+    [
+        ("id,file_url,version_number", 1),
+        ("id,uploader", 1),
+        ("id,read_permissions", 2),
+        ("id,uploader,read_permissions,write_permissions", 3),
+    ],
+)
+def test_list_queries_only_what_fields_need(api_client, user, fields, expected_queries, django_assert_num_queries):
+    """Tests that serialising a large page only joins or prefetches what the requested fields need"""
+    reader = UserFactory()
+    FileVersion.read_permissions.through.objects.bulk_create(
+        FileVersion.read_permissions.through(fileversion_id=file_version.id, user_id=reader.id)
+        for file_url in (f"docs/file_{index:03d}.txt" for index in range(200))
+        for file_version in _create_versions(user, file_url, 1)
+    )
+
+    with django_assert_num_queries(expected_queries):
+        response = api_client.get("/api/file_versions/", {"fields": fields, "page_size": 500, "scope": "owned"})
+
+    assert len(response.data["results"]) == 200
+    assert set(response.data["results"][0]) == set(fields.split(","))
+
+
+def test_retrieve_metadata(api_client, user):
+    """Tests that the detail endpoint returns the full metadata of a visible version"""
+    file_version, = _create_versions(user, "docs/a.txt", 1)
+
+    response = api_client.get(f"/api/file_versions/{file_version.id}/")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["uploader"] == user.email
+    assert response.data["read_permissions"] == []
+
+    response = api_client.get(f"/api/file_versions/{file_version.id}/", {"fields": "file_url"})
+    assert response.data == {"file_url": "docs/a.txt"}
+
+
+def test_retrieve_metadata_not_visible(api_client):
+    """Tests that versions of other users are not exposed by the detail endpoint"""
+    file_version, = _create_versions(UserFactory(), "docs/a.txt", 1)
+
+    response = api_client.get(f"/api/file_versions/{file_version.id}/")
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.fixture
+def stored_versions(user, media):
+    """Three versions of docs/dated.txt uploaded on the 1st, 10th and 20th of January, with blobs on disk"""
+    versions = _create_versions(user, "docs/dated.txt", 3)
+    for file_version, day in zip(versions, (1, 10, 20)):
+        file_version.created_at = datetime(2024, 1, day, 12, tzinfo=dt_timezone.utc)
+        file_version.save()
+        (media / file_version.file_hash).write_text(f"version {file_version.version_number}")
+
+    return versions
+
+
+@pytest.mark.parametrize(
+    "as_of, expected_content",
+    [
+        ("2024-01-10T12:00:00Z", b"version 1"),
+        ("2024-01-15", b"version 1"),
+        ("2024-01-25T00:00:00+01:00", b"version 2"),
+        ("2024-01-01T12:00:00", b"version 0"),
+    ],
+)
+def test_retrieve_as_of(api_client, stored_versions, as_of, expected_content):
+    """Tests that as_of returns the version that was current at that moment"""
+    response = api_client.get("/api/file_versions/docs/dated.txt", {"as_of": as_of})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert b"".join(response.streaming_content) == expected_content
+
+
+@pytest.mark.django_db(transaction=True)
+def test_migration_dates_existing_versions_from_their_blobs(tmp_path, monkeypatch):
+    """Tests that migrating existing versions dates them from their blobs, in version order"""
+    monkeypatch.chdir(tmp_path)
+    media = tmp_path / "src" / "propylon_document_manager" / "media"
+    media.mkdir(parents=True)
+    for file_hash, day in [("hash-one", 10), ("hash-two", 5), ("hash-three", 20)]:
+        (media / file_hash).write_bytes(file_hash.encode())
+        mtime = datetime(2024, 1, day, 12, tzinfo=dt_timezone.utc).timestamp()
+        os.utime(media / file_hash, (mtime, mtime))
+
+    executor = MigrationExecutor(connection)
+    before, after = [("file_versions", "0007_folder")], executor.loader.graph.leaf_nodes()
+    executor.migrate(before)
+    apps = executor.loader.project_state(before).apps
+    user = apps.get_model("file_versions", "User").objects.create(email="old@example.com")
+    OldFileVersion = apps.get_model("file_versions", "FileVersion")
+    for file_hash, version_number in [("hash-one", 0), ("hash-missing", 1), ("hash-two", 2), ("hash-three", 3)]:
+        OldFileVersion.objects.create(
+            user=user, file_url="docs/old.txt", file_name="old.txt", file_hash=file_hash, version_number=version_number
+        )
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(after)
+
+    versions = FileVersion.objects.filter(file_url="docs/old.txt").order_by("version_number")
+    created_at = list(versions.values_list("created_at", flat=True))
+    january_10 = datetime(2024, 1, 10, 12, tzinfo=dt_timezone.utc)
+    assert created_at[0] == january_10
+    assert january_10 < created_at[1] < created_at[2] < datetime(2024, 1, 11, tzinfo=dt_timezone.utc)
+    assert created_at[3] == datetime(2024, 1, 20, 12, tzinfo=dt_timezone.utc)
+
+
+def test_retrieve_binary_content(api_client, stored_versions, tmp_path):
+    """Tests that blobs are streamed byte for byte, with the content type of the file_url"""
+    content = bytes(range(256))
+    (tmp_path / stored_versions[-1].file_hash).write_bytes(content)
+
+    response = api_client.get("/api/file_versions/docs/dated.txt")
+
+    assert response["Content-Type"].startswith("text/plain")
+    assert b"".join(response.streaming_content) == content
+
+
+def test_retrieve_as_of_before_first_upload(api_client, stored_versions):
+    """Tests that as_of before the first upload returns 404"""
+    response = api_client.get("/api/file_versions/docs/dated.txt", {"as_of": "2023-12-31T00:00:00Z"})
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.parametrize("params", [{"as_of": "yesterday"}, {"as_of": "2024-01-15", "revision": 1}])
+def test_retrieve_as_of_invalid(api_client, stored_versions, params):
+    """Tests that malformed as_of values, or as_of combined with revision, are rejected"""
+    response = api_client.get("/api/file_versions/docs/dated.txt", params)
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_versions_changed_since(api_client, stored_versions):
+    """Tests that changed_since only lists versions uploaded after the given time"""
+    response = api_client.get(
+        "/api/file_versions/versions/", {"file_url": "docs/dated.txt", "changed_since": "2024-01-05T00:00:00Z"}
+    )
+
+    assert [row["version_number"] for row in response.data["results"]] == [2, 1]
@@ -0,0 +1,121 @@
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from rest_framework import status
+
+from propylon_document_manager.file_versions.folders import check_folder_index, folder_paths, rebuild_folder_index
+from propylon_document_manager.file_versions.models import Folder
+
+from .conftest import upload
+
+
+def _aggregates(user, path):
+    return Folder.objects.filter(user=user, path=path).values(
+        "file_count", "total_file_count", "total_version_count", "total_size"
+    ).get()
+
+
+def test_folder_paths():
+    """Tests that folder_paths returns every ancestor folder from the root down"""
+    assert folder_paths("documents/reviews/review.pdf") == ["", "documents", "documents/reviews"]
+    assert folder_paths("review.pdf") == [""]
+
+
+def test_upload_updates_folder_aggregates(authenticated_client, user):
+    """Tests that uploads maintain counts and sizes on every ancestor folder"""
+    upload(authenticated_client, "matters/a/one.txt", b"12345")
+    upload(authenticated_client, "matters/a/one.txt", b"1234567")
+    upload(authenticated_client, "matters/two.txt", b"12")
+
+    assert _aggregates(user, "") == {**_aggregates(user, "matters"), "file_count": 0}
+    assert _aggregates(user, "matters") == {
+        "file_count": 1,
+        "total_file_count": 2,
+        "total_version_count": 3,
+        "total_size": 14,
+    }
+    assert _aggregates(user, "matters/a") == {
+        "file_count": 1,
+        "total_file_count": 1,
+        "total_version_count": 2,
+        "total_size": 12,
+    }
+    assert check_folder_index() == []
+
+
+def test_folder_listing(authenticated_client):
+    """Tests that the folder endpoint lists immediate subfolders and documents only"""
+    upload(authenticated_client, "matters/a/one.txt", b"one")
+    upload(authenticated_client, "matters/two.txt", b"two")
+
+    response = authenticated_client.get("/api/folders/", {"path": "matters"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["total_file_count"] == 2
+    assert [folder["name"] for folder in response.data["folders"]] == ["a"]
+    assert [file["file_url"] for file in response.data["files"]] == ["matters/two.txt"]
+
+
+def test_folder_listing_unknown_folder(api_client):
+    """Tests that listing a folder that does not exist returns 404, but an empty root does not"""
+    assert api_client.get("/api/folders/", {"path": "missing"}).status_code == status.HTTP_404_NOT_FOUND
+
+    response = api_client.get("/api/folders/")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["files"] == []
+
+
+def test_check_and_rebuild_folder_index(authenticated_client, user):
+    """Tests that drift is reported by the checker and repaired by a rebuild"""
+    upload(authenticated_client, "matters/a/one.txt", b"one")
+    upload(authenticated_client, "matters/two.txt", b"two")
+    Folder.objects.filter(user=user, path="matters").update(total_size=0)
+
+    assert check_folder_index() == [f"user {user.id}: folder 'matters' total_size is 0, expected 6"]
+    with pytest.raises(CommandError):
+        call_command("check_folder_index")
+
+    rebuild_folder_index()
+
+    assert check_folder_index() == []
+    assert Folder.objects.get(user=user, path="matters/a").parent.path == "matters"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_migration_indexes_existing_versions(tmp_path, monkeypatch):
+    """Tests that migrating existing versions sizes them from their blobs and builds their folder index"""
+    monkeypatch.chdir(tmp_path)
+    media = tmp_path / "src" / "propylon_document_manager" / "media"
+    media.mkdir(parents=True)
+    (media / "hash-one").write_bytes(b"one")
+    (media / "hash-three").write_bytes(b"three")
+
+    executor = MigrationExecutor(connection)
+    before, after = [("file_versions", "0006_fileversion_is_latest_and_more")], executor.loader.graph.leaf_nodes()
+    executor.migrate(before)
+    apps = executor.loader.project_state(before).apps
+    user = apps.get_model("file_versions", "User").objects.create(email="old@example.com")
+    FileVersion = apps.get_model("file_versions", "FileVersion")
+    for file_url, file_hash, version_number, is_latest in [
+        ("matters/a/one.txt", "hash-one", 0, False),
+        ("matters/a/one.txt", "hash-three", 1, True),
+        ("matters/two.txt", "hash-one", 0, True),
+    ]:
+        FileVersion.objects.create(
+            user=user,
+            file_url=file_url,
+            file_name=file_url.rpartition("/")[2],
+            file_hash=file_hash,
+            version_number=version_number,
+            is_latest=is_latest,
+        )
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(after)
+
+    assert check_folder_index() == []
+    folder = Folder.objects.get(user_id=user.id, path="matters")
+    assert (folder.total_file_count, folder.total_version_count, folder.total_size) == (2, 3, 11)
+    assert Folder.objects.get(user_id=user.id, path="matters/a").file_versions.count() == 2
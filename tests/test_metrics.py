@@ -0,0 +1,63 @@
+from prometheus_client import REGISTRY
+from rest_framework import status
+
+from propylon_document_manager.file_versions.models import FileVersion
+
+from .conftest import upload
+
+
+def _value(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_request_metrics(authenticated_client):
+    """Tests that requests are timed by view, with their database queries"""
+    view = "FileVersionRetrieveView"
+    requests = _value("file_versions_request_duration_seconds_count", view=view, method="GET", status="200")
+    queries = _value("file_versions_db_queries_total", view=view)
+    upload(authenticated_client, "docs/a.txt", b"a")
+
+    authenticated_client.get("/api/file_versions/docs/a.txt")
+    authenticated_client.get("/api/file_versions/docs/a.txt")
+
+    count = _value("file_versions_request_duration_seconds_count", view=view, method="GET", status="200")
+    assert count == requests + 2
+    assert _value("file_versions_db_queries_total", view=view) > queries
+
+
+def test_upload_and_cache_metrics(authenticated_client):
+    """Tests the upload outcomes, blob bytes and resolution cache hits"""
+    stored = _value("file_versions_uploads_total", outcome="stored")
+    deduplicated = _value("file_versions_uploads_total", outcome="deduplicated")
+    unchanged = _value("file_versions_uploads_total", outcome="unchanged")
+    written = _value("file_versions_blob_written_bytes_total")
+    hits = _value("file_versions_cache_lookups_total", cache="resolution", result="hit")
+
+    upload(authenticated_client, "docs/a.txt", b"abc")
+    upload(authenticated_client, "docs/a.txt", b"abc")
+    upload(authenticated_client, "docs/b.txt", b"abc")
+    authenticated_client.get("/api/file_versions/docs/a.txt")
+    authenticated_client.get("/api/file_versions/docs/a.txt")
+
+    assert _value("file_versions_uploads_total", outcome="stored") == stored + 1
+    assert _value("file_versions_uploads_total", outcome="deduplicated") == deduplicated + 1
+    assert _value("file_versions_uploads_total", outcome="unchanged") == unchanged + 1
+    assert _value("file_versions_blob_written_bytes_total") == written + 3
+    assert _value("file_versions_cache_lookups_total", cache="resolution", result="hit") == hits + 1
+    assert FileVersion.objects.count() == 2
+
+
+def test_metrics_endpoint(authenticated_client, settings):
+    """Tests the exposition format, and that scrapes need the token and are off without one"""
+    authenticated_client.get("/api/file_versions/")
+    assert authenticated_client.get("/metrics").status_code == status.HTTP_404_NOT_FOUND
+
+    settings.FILE_VERSIONS_METRICS_TOKEN = "secret"
+    assert authenticated_client.get("/metrics").status_code == status.HTTP_403_FORBIDDEN
+    response = authenticated_client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    response = authenticated_client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"].startswith("text/plain")
+    assert b"file_versions_request_duration_seconds_bucket" in response.content
@@ -0,0 +1,111 @@
+from unittest import mock
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.test import AsyncClient
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions.middleware import profiling_middleware
+from propylon_document_manager.file_versions.profiling import load_profiles
+
+from .conftest import client_for
+from .factories import UserFactory
+
+
+@pytest.fixture
+def profile_dir(settings, tmp_path):
+    settings.FILE_VERSIONS_PROFILE_DIR = str(tmp_path)
+    return tmp_path
+
+
+def test_disabled_middleware_is_not_used(settings):
+    """Tests that profiling costs nothing when off, by leaving the middleware chain"""
+    settings.FILE_VERSIONS_PROFILING = False
+    settings.FILE_VERSIONS_PROFILE_SAMPLE_RATE = 0
+
+    with pytest.raises(MiddlewareNotUsed):
+        profiling_middleware(lambda request: None)
+
+
+def test_header_profiles_staff_requests_only(settings, profile_dir, user):
+    """Tests that the profile header is honoured for staff session users only, checked before profiling"""
+    settings.FILE_VERSIONS_PROFILING = True
+    staff = UserFactory(is_staff=True)
+    staff_client = APIClient()
+    staff_client.force_login(staff)
+
+    with mock.patch("propylon_document_manager.file_versions.profiling.start_profile") as start_profile:
+        assert client_for(user).get("/api/file_versions/", HTTP_X_PROFILE="1").status_code == status.HTTP_200_OK
+        assert client_for(staff).get("/api/file_versions/", HTTP_X_PROFILE="1").status_code == status.HTTP_200_OK
+        assert staff_client.get("/api/file_versions/").status_code == status.HTTP_200_OK
+    start_profile.assert_not_called()
+
+    staff_client.get("/api/file_versions/docs/missing.txt", HTTP_X_PROFILE="1")
+
+    [(name, info)] = load_profiles(profile_dir)
+    assert (profile_dir / f"{name}.prof").exists()
+    assert info["path"] == "/api/file_versions/docs/missing.txt"
+    assert info["status"] == status.HTTP_404_NOT_FOUND
+    assert info["trigger"] == "header"
+    assert info["user_id"] == staff.id
+
+
+def test_sampled_profiles_ring_buffer(settings, profile_dir, user):
+    """Tests that sampling only covers the file versions views and keeps the newest profiles"""
+    settings.FILE_VERSIONS_PROFILE_SAMPLE_RATE = 1
+    settings.FILE_VERSIONS_PROFILE_LIMIT = 2
+    client = client_for(user)
+
+    client.get("/auth-token/")
+    assert load_profiles(profile_dir) == []
+
+    for number in range(3):
+        client.get(f"/api/file_versions/docs/{number}.txt")
+
+    profiles = load_profiles(profile_dir)
+    assert [info["path"] for _, info in profiles] == ["/api/file_versions/docs/1.txt", "/api/file_versions/docs/2.txt"]
+    assert {info["trigger"] for _, info in profiles} == {"sample"}
+    assert len(list(profile_dir.iterdir())) == 4
+
+
+def test_profiles_command(settings, profile_dir, user, capsys):
+    """Tests listing and summarising profiles"""
+    settings.FILE_VERSIONS_PROFILE_SAMPLE_RATE = 1
+    client_for(user).get("/api/file_versions/docs/a.txt")
+    client_for(user).get("/api/file_versions/")
+    [(name, _), _] = load_profiles(profile_dir)
+
+    call_command("profiles")
+    output = capsys.readouterr().out
+    assert name in output
+    assert "/api/file_versions/docs/a.txt" in output
+    assert "Successfully read 2 profiles" in output
+
+    call_command("profiles", "--path", "/api/file_versions/docs/", "--summary")
+    output = capsys.readouterr().out
+    assert "resolve_file_version" in output
+    assert "Successfully read 1 profiles" in output
+
+
+@pytest.mark.urls("tests.async_urls")
+def test_header_profiles_async_views(settings, profile_dir):
+    """Tests that staff session users of the async views can profile requests, and staff token users cannot"""
+    settings.FILE_VERSIONS_PROFILING = True
+    staff = UserFactory(is_staff=True)
+    headers = {"Authorization": f"Token {Token.objects.create(user=staff).key}", "X-Profile": "1"}
+
+    response = async_to_sync(AsyncClient().get)("/api/file_versions/docs/missing.txt", headers=headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert load_profiles(profile_dir) == []
+
+    client = AsyncClient()
+    client.force_login(staff)
+    response = async_to_sync(client.get)("/api/file_versions/docs/missing.txt", headers={"X-Profile": "1"})
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    [(_, info)] = load_profiles(profile_dir)
+    assert info["user_id"] == staff.id
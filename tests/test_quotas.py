@@ -0,0 +1,102 @@
+from io import StringIO
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from rest_framework import status
+
+from propylon_document_manager.file_versions.models import FileVersion, StorageUsage
+from propylon_document_manager.file_versions.quotas import StorageQuotaExceeded
+from propylon_document_manager.file_versions.uploads import delete_file_versions, store_file_version
+
+from .conftest import upload
+
+
+def _usage(user):
+    usage = StorageUsage.objects.get(user=user)
+    return usage.logical_bytes, usage.physical_bytes, usage.version_count
+
+
+def test_usage_follows_uploads_and_deletions(authenticated_client, user):
+    """Tests that usage counts every version, each distinct blob once, and is released on deletion"""
+    upload(authenticated_client, "docs/a.txt", b"abc")
+    upload(authenticated_client, "docs/b.txt", b"abc")
+    upload(authenticated_client, "docs/a.txt", b"abcdef")
+    assert _usage(user) == (12, 9, 3)
+
+    delete_file_versions(FileVersion.objects.filter(file_url="docs/b.txt"))
+    assert _usage(user) == (9, 9, 2)
+
+    delete_file_versions(FileVersion.objects.filter(file_url="docs/a.txt", version_number=0))
+    assert _usage(user) == (6, 6, 1)
+
+
+def test_deleting_versions_that_share_a_blob_releases_it_once(authenticated_client, user):
+    """Tests that a blob shared by several versions deleted together is released once"""
+    for content in (b"a" * 100, b"b" * 300, b"a" * 100, b"c" * 600):
+        upload(authenticated_client, "docs/a.txt", content)
+    assert _usage(user) == (1100, 1000, 4)
+
+    delete_file_versions(FileVersion.objects.filter(version_number__lt=3))
+    assert _usage(user) == (600, 600, 1)
+
+
+def test_uploads_over_quota_are_rejected_before_reading_them(settings, authenticated_client, user):
+    """Tests that uploads are rejected by Content-Length, or while reading them, without storing anything"""
+    settings.FILE_VERSIONS_STORAGE_QUOTA = 1000
+    upload(authenticated_client, "docs/a.txt", b"a" * 600)
+
+    with mock.patch("django.core.files.uploadhandler.TemporaryFileUploadHandler.receive_data_chunk") as received:
+        upload(authenticated_client, "docs/b.txt", b"b" * 100_000, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    received.assert_not_called()
+
+    upload(authenticated_client, "docs/b.txt", b"b" * 500, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    assert FileVersion.objects.count() == 1
+
+    # A quota of the user's own overrides the default one, and duplicates of a stored blob take no space
+    StorageUsage.objects.filter(user=user).update(quota_bytes=2000)
+    upload(authenticated_client, "docs/c.txt", b"a" * 600)
+    upload(authenticated_client, "docs/b.txt", b"b" * 500)
+    assert _usage(user) == (1700, 1100, 3)
+
+
+def test_storing_a_version_over_quota_rolls_back(settings, user):
+    """Tests that a version whose new blob exceeds the quota is not stored, e.g. after a concurrent upload"""
+    settings.FILE_VERSIONS_STORAGE_QUOTA = 100
+    store_file_version(user.id, "docs/a.txt", "a.txt", "1" * 64, 60, 0)
+
+    with pytest.raises(StorageQuotaExceeded):
+        store_file_version(user.id, "docs/a.txt", "a.txt", "2" * 64, 60, 1)
+
+    assert list(FileVersion.objects.values_list("version_number", "is_latest")) == [(0, True)]
+    assert _usage(user) == (60, 60, 1)
+
+
+def test_reconcile_storage_usage(authenticated_client, user):
+    """Tests that the command reports drift, and repairs it unless it is a dry run"""
+    upload(authenticated_client, "docs/a.txt", b"abc")
+    StorageUsage.objects.filter(user=user).update(logical_bytes=50, version_count=7)
+
+    out = StringIO()
+    call_command("reconcile_storage_usage", dry_run=True, stdout=out)
+    assert f"user {user.id}: stored logical_bytes=50, physical_bytes=3, version_count=7" in out.getvalue()
+    assert _usage(user) == (50, 3, 7)
+
+    call_command("reconcile_storage_usage", emails=[user.email], stdout=StringIO())
+    assert _usage(user) == (3, 3, 1)
+
+    out = StringIO()
+    call_command("reconcile_storage_usage", stdout=out)
+    assert "Successfully reconciled storage usage of 0 users" in out.getvalue()
+
+
+def test_uploads_rejected_while_storing_leave_no_blob(settings, authenticated_client, tmp_path):
+    """Tests that an upload admitted before a concurrent one used up the quota writes no blob"""
+    settings.FILE_VERSIONS_STORAGE_QUOTA = 100
+    upload(authenticated_client, "docs/a.txt", b"a" * 60)
+
+    with mock.patch("propylon_document_manager.file_versions.api.views.limit_upload"):
+        upload(authenticated_client, "docs/b.txt", b"b" * 60, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    assert [path.read_bytes() for path in tmp_path.iterdir()] == [b"a" * 60]
+    assert FileVersion.objects.count() == 1
@@ -0,0 +1,60 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from rest_framework import status
+
+from propylon_document_manager.file_versions.models import FileVersion
+from propylon_document_manager.file_versions.routers import pin_to_primary, replica_reads
+
+from .conftest import client_for, upload
+from .factories import UserFactory
+
+pytestmark = pytest.mark.django_db(databases=["default", "replica"])
+
+
+@pytest.fixture
+def replicas(settings, media):
+    settings.FILE_VERSIONS_REPLICA_DATABASES = ["replica"]
+    settings.FILE_VERSIONS_REPLICA_PIN_SECONDS = 60
+
+
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_reads_go_to_replica(replicas):
+    """Tests that an unpinned user reads from the replica, which has not seen the primary's rows yet"""
+    user = UserFactory()
+    FileVersion.objects.create(
+        file_name="a.txt", file_url="docs/a.txt", version_number=0, file_hash="0" * 64, user=user
+    )
+
+    assert client_for(user).get("/api/file_versions/").data["results"] == []
+
+    call_command("sync_replicas", stdout=StringIO())
+
+    assert [row["file_url"] for row in client_for(user).get("/api/file_versions/").data["results"]] == ["docs/a.txt"]
+
+
+def test_writer_reads_own_writes(replicas):
+    """Tests that after uploading, the user is pinned to the primary and sees the new version"""
+    user = UserFactory()
+    other_user = UserFactory()
+    upload(client_for(user), "docs/a.txt", b"a")
+
+    assert FileVersion.objects.using("default").count() == 1
+    assert FileVersion.objects.using("replica").count() == 0
+    assert client_for(user).get("/api/file_versions/docs/a.txt").status_code == status.HTTP_200_OK
+    assert [row["file_url"] for row in client_for(user).get("/api/file_versions/").data["results"]] == ["docs/a.txt"]
+    # Other users are not pinned and read from the (lagging) replica
+    assert client_for(other_user).get("/api/folders/").data["files"] == []
+
+
+def test_reads_stay_on_primary_without_replicas(settings):
+    """Tests that nothing is routed to a replica when none is configured"""
+    user = UserFactory()
+    FileVersion.objects.create(
+        file_name="a.txt", file_url="docs/a.txt", version_number=0, file_hash="0" * 64, user=user
+    )
+    pin_to_primary(user.id)
+
+    with replica_reads(user.id):
+        assert FileVersion.objects.count() == 1
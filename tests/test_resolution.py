@@ -0,0 +1,81 @@
+import threading
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions.models import FileVersion
+from propylon_document_manager.file_versions.resolution import cached_resolution
+
+from .factories import UserFactory
+
+
+@pytest.fixture
+def document(user, media):
+    for number in range(2):
+        (media / f"{number:064d}").write_text(f"version {number}")
+        FileVersion.objects.create(
+            file_name="a.txt", file_url="docs/a.txt", version_number=number, file_hash=f"{number:064d}", user=user
+        )
+
+    return media
+
+
+def _retrieve(user, params=None):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client.get("/api/file_versions/docs/a.txt", params or {})
+
+
+@pytest.mark.parametrize("params, expected_content", [({}, b"version 1"), ({"revision": 0}, b"version 0")])
+def test_cached_resolution_needs_no_queries(user, document, django_assert_num_queries, params, expected_content):
+    """Tests that a repeated retrieval is resolved from the cache without database queries"""
+    _retrieve(user, params)
+
+    with django_assert_num_queries(0):
+        response = _retrieve(user, params)
+
+    assert b"".join(response.streaming_content) == expected_content
+
+
+def test_upload_invalidates_resolution(user, document):
+    """Tests that a new version is returned right after it is stored"""
+    assert b"".join(_retrieve(user).streaming_content) == b"version 1"
+
+    (document / f"{2:064d}").write_text("version 2")
+    FileVersion.objects.create(
+        file_name="a.txt", file_url="docs/a.txt", version_number=2, file_hash=f"{2:064d}", user=user
+    )
+
+    assert b"".join(_retrieve(user).streaming_content) == b"version 2"
+
+
+def test_permission_change_invalidates_resolution(user, document):
+    """Tests that cached not-found results and shared resolutions follow permission changes"""
+    other_user = UserFactory()
+    assert _retrieve(other_user).status_code == status.HTTP_404_NOT_FOUND
+
+    file_version = FileVersion.objects.get(file_url="docs/a.txt", version_number=1)
+    file_version.read_permissions.add(other_user)
+    assert _retrieve(other_user).status_code == status.HTTP_200_OK
+
+    other_user.read_permissions.clear()
+    assert _retrieve(other_user).status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_stampede_protection():
+    """Tests that requests missing a key being resolved elsewhere wait for that result instead of resolving it"""
+    cache.add("hot:lock", 1)
+    threading.Timer(0.05, cache.set, args=("hot", "resolved elsewhere")).start()
+
+    assert cached_resolution("hot", 60, mock.Mock(side_effect=AssertionError)) == "resolved elsewhere"
+
+
+def test_stampede_lock_timeout():
+    """Tests that a request stops waiting for a stalled resolution and resolves the key itself"""
+    cache.add("stalled:lock", 1)
+
+    assert cached_resolution("stalled", 60, lambda: "resolved") == "resolved"
+    assert cache.get("stalled") == "resolved"
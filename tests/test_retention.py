@@ -0,0 +1,153 @@
+from datetime import date, datetime, timezone
+from io import StringIO
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions.folders import check_folder_index
+from propylon_document_manager.file_versions.models import FileVersion, RetentionPolicy
+from propylon_document_manager.file_versions.quotas import reconcile_usage
+from propylon_document_manager.file_versions.retention import kept_versions
+
+from .conftest import upload
+from .factories import UserFactory
+
+
+@pytest.fixture
+def media(media):
+    with mock.patch(
+        "propylon_document_manager.file_versions.management.commands.prune_versions.PATH_TO_MEDIA", [str(media)]
+    ):
+        yield media
+
+
+def _version(version_id, created_at, is_protected=False):
+    return {"id": version_id, "created_at": created_at, "is_protected": is_protected}
+
+
+def test_kept_versions():
+    """Tests that versions are kept by any rule, the latest and protected ones always"""
+    versions = [
+        _version(1, datetime(2024, 3, 10, 18, tzinfo=timezone.utc)),
+        _version(2, datetime(2024, 3, 10, 9, tzinfo=timezone.utc)),
+        _version(3, datetime(2024, 3, 9, 9, tzinfo=timezone.utc)),
+        _version(4, datetime(2024, 2, 20, tzinfo=timezone.utc)),
+        _version(5, datetime(2024, 2, 10, tzinfo=timezone.utc)),
+        _version(6, datetime(2024, 1, 5, tzinfo=timezone.utc), is_protected=True),
+        _version(7, datetime(2023, 12, 5, tzinfo=timezone.utc)),
+    ]
+    today = date(2024, 3, 10)
+
+    assert kept_versions(versions, RetentionPolicy(), today) == {1, 6}
+    assert kept_versions(versions, RetentionPolicy(keep_last=3), today) == {1, 2, 3, 6}
+    assert kept_versions(versions, RetentionPolicy(keep_daily_days=2, keep_monthly_months=3), today) == {1, 3, 4, 6}
+
+
+def test_prune_versions(authenticated_client, user, media):
+    """Tests that pruning follows the most specific policy and keeps the index, usage and blobs consistent"""
+    other = UserFactory()
+    RetentionPolicy.objects.create(user=None, prefix="", keep_last=2)
+    RetentionPolicy.objects.create(user=user, prefix="archive/")
+
+    for number in range(4):
+        upload(authenticated_client, "docs/a.txt", f"a{number}".encode())
+    protected = FileVersion.objects.get(pk=upload(authenticated_client, "archive/b.txt", b"b0").data["id"])
+    upload(authenticated_client, "archive/b.txt", b"a0")
+    upload(authenticated_client, "archive/b.txt", b"b1")
+    upload(authenticated_client, "archive/b.txt", b"b2")
+    authenticated_client.patch(f"/api/file_versions/{protected.id}/", {"is_protected": True}, format="json")
+    other_client = APIClient()
+    other_client.force_authenticate(other)
+    for number in range(3):
+        upload(other_client, "docs/c.txt", f"c{number}".encode())
+
+    out = StringIO()
+    call_command("prune_versions", dry_run=True, stdout=out)
+    assert f"user {user.id}: 4 versions, 8 bytes" in out.getvalue()
+    assert f"user {other.id}: 1 versions, 2 bytes" in out.getvalue()
+    # Both versions sharing the a0 blob are pruned, so it is reclaimed too
+    assert "Would prune 5 versions of 3 documents, 10 bytes, and reclaim 8 bytes of blobs" in out.getvalue()
+    assert FileVersion.objects.count() == 11
+
+    call_command("prune_versions", batch_size=2, stdout=StringIO())
+
+    remaining = FileVersion.objects.order_by("user_id", "file_url", "version_number")
+    assert [(version.file_url, version.version_number) for version in remaining] == [
+        ("archive/b.txt", 0),
+        ("archive/b.txt", 3),
+        ("docs/a.txt", 2),
+        ("docs/a.txt", 3),
+        ("docs/c.txt", 1),
+        ("docs/c.txt", 2),
+    ]
+    assert sorted(path.read_bytes() for path in media.iterdir()) == [b"a2", b"a3", b"b0", b"b2", b"c1", b"c2"]
+    assert check_folder_index() == []
+    assert reconcile_usage(dry_run=True) == []
+
+
+def test_retention_policy_api(authenticated_client, user):
+    """Tests that users manage their own policies, with a unique prefix each"""
+    policies = "/api/retention_policies/"
+    response = authenticated_client.post(policies, {"prefix": "/docs/", "keep_last": 3}, format="json")
+    assert response.status_code == status.HTTP_201_CREATED
+    policy_id = response.data["id"]
+    assert RetentionPolicy.objects.get().user == user
+
+    duplicate = authenticated_client.post(policies, {"prefix": "docs/", "keep_last": 1}, format="json")
+    assert duplicate.status_code == status.HTTP_400_BAD_REQUEST
+
+    for data in ({}, {"prefix": "tmp/", "keep_last": 0, "keep_daily_days": None}):
+        response = authenticated_client.post(policies, data, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = authenticated_client.patch(f"{policies}{policy_id}/", {"keep_last": None}, format="json")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = authenticated_client.patch(f"{policies}{policy_id}/", {"keep_daily_days": 30}, format="json")
+    assert response.data == {
+        "id": policy_id, "prefix": "docs/", "keep_last": 3, "keep_daily_days": 30, "keep_monthly_months": None
+    }
+
+    stranger = APIClient()
+    stranger.force_authenticate(UserFactory())
+    assert stranger.get("/api/retention_policies/").data == []
+    assert stranger.delete(f"/api/retention_policies/{policy_id}/").status_code == status.HTTP_404_NOT_FOUND
+
+    assert authenticated_client.delete(f"{policies}{policy_id}/").status_code == status.HTTP_204_NO_CONTENT
+    assert not RetentionPolicy.objects.exists()
+
+
+def test_pruning_versions_that_share_a_blob(authenticated_client, user, media):
+    """Tests that pruned versions sharing a blob in one transaction leave storage usage reconciled"""
+    RetentionPolicy.objects.create(user=user, keep_last=1)
+    for content in (b"a" * 100, b"b" * 300, b"a" * 100, b"c" * 600):
+        upload(authenticated_client, "docs/a.txt", content)
+
+    call_command("prune_versions", stdout=StringIO())
+
+    assert FileVersion.objects.count() == 1
+    assert reconcile_usage(dry_run=True) == []
+    assert sorted(path.read_bytes() for path in media.iterdir()) == [b"c" * 600]
+
+
+def test_only_owners_and_writers_protect_versions(authenticated_client, user):
+    """Tests that users without write permission cannot protect or unprotect a version"""
+    version = FileVersion.objects.get(pk=upload(authenticated_client, "docs/a.txt", b"a").data["id"])
+    writer, stranger = UserFactory(), UserFactory()
+    version.write_permissions.add(writer)
+
+    def protect(as_user, is_protected):
+        api_client = APIClient()
+        api_client.force_authenticate(as_user)
+        return api_client.patch(f"/api/file_versions/{version.id}/", {"is_protected": is_protected}, format="json")
+
+    assert protect(stranger, True).status_code == status.HTTP_403_FORBIDDEN
+    assert not FileVersion.objects.get(pk=version.pk).is_protected
+
+    assert protect(writer, True).status_code == status.HTTP_200_OK
+    assert FileVersion.objects.get(pk=version.pk).is_protected
+    assert protect(stranger, False).status_code == status.HTTP_403_FORBIDDEN
+    assert protect(user, False).status_code == status.HTTP_200_OK
+    assert not FileVersion.objects.get(pk=version.pk).is_protected